@@ -153,12 +153,12 @@ void loop() {
       analogWrite(pump_2, 0);
       //Serial.println("Stop");
     }
+    else if (strstr(cmd, "TEMPB")) {                                                  //READ TEMPERATURE B (checked first: "TEMPB" also contains "TEMP")
+      printTemperatureB();
+    }
     else if (strstr(cmd, "TEMP")) {                                                  //READ TEMPERATURE
       printTemperature();
     }
-    else if (strstr(cmd, "TEMPB")) {                                                  //READ TEMPERATURE B
-      printTemperatureB();
-    }
     else if (strstr(cmd, "OPEN VALVE")) {                                            //OPEN VALVE
       digitalWrite(valvePin, HIGH);
     }
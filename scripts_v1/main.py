@@ -18,6 +18,7 @@ import gripper
 import environment
 import data_proccesing
 import degradation
+import scheduler
 
 def main():
 
@@ -67,7 +68,6 @@ def main():
         print(f"Directory '{photo_dir}' already exists.")
     
     temperature_registry = f"../data/TemperatureRegistry_{name}.txt"
-    prev_time = int(time.strftime('%H%M%S', time.localtime()))
     
     # Groups to be sampled during each cycle
     Groups = {}
@@ -106,25 +106,18 @@ def main():
     # STEP 4: PRINCIPAL LOOP
     # >>> LOOP THROUGH CYCLES
 
+    # Cycle deadlines are anchored to the experiment start, so a long cycle does not delay the following ones
+    schedule = scheduler.CycleScheduler(scheduler.interval_from_config(config["timing"]))
+
     while cycle_number < cycles + 1:
         # Time delay management
-        minutes = int(time.strftime('%M', time.localtime())) + minutes_delay
-        hours = int(time.strftime('%H', time.localtime())) + hours_delay
-        if minutes >= 60:
-            minutes -= 60
-            minutes += 1
-        if len(str(minutes)) == 1:
-            minutes = '0' + str(minutes)
-        if hours >= 24:
-            hours = int(hours) - 24 
-        if len(str(hours)) == 1:
-            H = '0' + str(hours)
-        time_delay = str(hours) + str(minutes)
-        if len(str(time_delay)) == 3:
-            time_delay = '0' + str(time_delay)
+        lateness = schedule.wait(cycle_number - 1)
+        next_cycle_at = schedule.wall_time(cycle_number)
         
-        print('Current Time: ', time.strftime('%H:%M', time.localtime()))
-        print('Next Cycle: ', time_delay)
+        print('Current Time: ', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
+        print('Next Cycle: ', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_cycle_at)))
+        if lateness > 1:
+            print(f"Cycle {cycle_number} started {scheduler.format_duration(lateness)} late")
 
         # Calibration
         rtde_c.moveL(lid_position, 3, 1)
@@ -292,26 +285,19 @@ def main():
         degradation.move_lid("on", rtde_c, rtde_r, rtde_io)
 
         # Log temperature during the cycle
-        with open(temperature_registry, 'a') as f:
-            while True:
-                if robot.robot_online(rtde_r) == 'False':
-                    continuation = input("Robot Offline! If you want to continue, reconnect and press Enter")
-                
-                # Log temperature data every 10 minutes
-                current_time = int(time.strftime('%H%M', time.localtime()))
-                if current_time % 10 == 0 and current_time != prev_time:
-                    temperature = environment.arduino(b'TEMPERATURE')
-                    while len(temperature.split()) < 5:  # Ensure temperature is valid
-                        temperature = environment.arduino(b'TEMPERATURE')
-                        time.sleep(1)
-                    f.write(str(time.strftime('%m/%d, %H:%M:%S', time.localtime())+', '+temperature.split()[4]) + '\n')
-                    prev_time = current_time
-                    time.sleep(1)
-                
-                # Check if it is time to break the cycle
-                if time.strftime('%H%M', time.localtime()) == time_delay:
-                    break
+        def log_temperature():
+            if robot.robot_online(rtde_r) == 'False':
+                continuation = input("Robot Offline! If you want to continue, reconnect and press Enter")
+            temperature = environment.arduino(b'TEMPERATURE')
+            while len(temperature.split()) < 5:  # Ensure temperature is valid
+                temperature = environment.arduino(b'TEMPERATURE')
                 time.sleep(1)
+            f.write(str(time.strftime('%m/%d, %H:%M:%S', time.localtime())+', '+temperature.split()[4]) + '\n')
+            f.flush()
+
+        # Wait for the next cycle, logging temperature data every 10 minutes
+        with open(temperature_registry, 'a') as f:
+            schedule.wait(cycle_number, log_temperature, every=600)
 
         # Now allow the cycle to repeat
         cycle_number += 1
@@ -0,0 +1,287 @@
+# ------------------------------------------------------- #
+# END-TO-END CYCLE BENCHMARK ON THE SIMULATED ROBOT AND   #
+# EMULATED DEVICES                                        #
+# ------------------------------------------------------- #
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import scheduler
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 1. ONE SCENARIO (runs in its own process: listener and degradation read config.json from the working directory)
+
+def _free_camera_base(device_emulator, settings, first=18080):
+    """Starts the emulator on the first camera port base whose ports are free."""
+    for base in range(first, first + 1000, 10):
+        try:
+            return device_emulator.DeviceEmulator("127.0.0.1", 0, base, **settings).start(), base
+        except OSError:
+            continue
+    raise OSError("No free ports for the emulated cameras")
+
+def run_scenario(scenario, directory):
+    """
+    Runs one cycle of execute_command against the simulator and the device emulator.
+
+    Args:
+    - scenario: {"setup", "columns", "rows", "samples", "async_motion", "simulator", "emulator", "trace"}.
+    - directory: Empty folder for the run; the cycle writes its data (and data/Trace.jsonl with trace) to directory/data.
+
+    Returns:
+    - dict: Result with the event timeline (see summarize()).
+    """
+    run_dir = os.path.join(directory, "run")
+    os.makedirs(run_dir, exist_ok=True)
+    os.makedirs(os.path.join(directory, "data"), exist_ok=True)
+    sys.path.insert(0, HERE)
+
+    import device_emulator
+    emulator, camera_port_base = _free_camera_base(device_emulator, scenario["emulator"])
+
+    with open(os.path.join(HERE, f"config{scenario['setup']}.json")) as file:
+        config = json.load(file)
+    config["robot"].update(robot_ip="sim", backend="sim", setup=scenario["setup"],
+                           async_motion=scenario["async_motion"], simulator=scenario["simulator"])
+    config["grid"] = {"columns": scenario["columns"], "rows": scenario["rows"]}
+    config["devices"] = {"host": "127.0.0.1", "port": emulator.port, "camera_port_base": camera_port_base}
+    config.setdefault("telemetry", {})["store"] = "../data/TemperatureStore"
+    config["tracing"] = {"enabled": scenario.get("trace", False), "file": "../data/Trace.jsonl"}
+    with open(os.path.join(run_dir, "config.json"), "w") as file:
+        json.dump(config, file, indent=4)
+    os.chdir(run_dir)
+
+    import simulator
+    import robot
+    import environment
+    import listener
+
+    # Open the session first so every event can record the simulated motion and gripper time
+    simulator.configure(**scenario["simulator"])
+    session = robot.get_session("sim", "sim")
+    sim_robot = session.interfaces()[0].robot
+
+    events = []
+    def report(event, **fields):
+        events.append({"event": event, "time": time.monotonic(), "motion": sim_robot.motion_time,
+                       "gripper": sim_robot.gripper_time, "sample": fields.get("sample")})
+
+    command_data = {
+        "robot_ip": "sim",
+        "setup": scenario["setup"],
+        "date": time.strftime('%m_%d', time.localtime()),
+        "material": "benchmark",
+        "rows": scenario["rows"],
+        "columns": scenario["columns"],
+        "temperature": 0,
+        "samples": [str(i) for i in range(1, scenario["samples"] + 1)],
+        "choice": config["robot"]["choice"],
+        "next_cycle_at": time.time(),
+        "cycle_number": 1,
+        "remote_scale": True,
+    }
+    try:
+        report("started")
+        listener.execute_command(command_data, report)
+        report("completed")
+    finally:
+        robot.close_sessions()
+        environment.stop_cameras()
+        environment.stop_temperature_sampler()
+        environment.close_devices()
+        emulator.stop()
+
+    return summarize(scenario, events, scenario["simulator"].get("time_scale", simulator.SETTINGS["time_scale"]))
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 2. RESULTS
+
+def _stats(values):
+    values = np.asarray(values, dtype=float)
+    return {"count": int(len(values)), "total": round(float(values.sum()), 3), "mean": round(float(values.mean()), 3),
+            "p50": round(float(np.percentile(values, 50)), 3), "p95": round(float(np.percentile(values, 95)), 3)}
+
+def summarize(scenario, events, time_scale):
+    """
+    Turns the event timeline of a cycle into durations.
+
+    Every duration is converted to real-robot time: the simulated motion and
+    gripper time of the interval replace their scaled share ((motion + gripper) *
+    time_scale) of the wall time.
+    A step is named after the event that ends it ("picked" = from the previous
+    event until the sample was picked); "setup" runs until the grid is
+    calibrated, "teardown" from the last sample event until the results are
+    saved and the lid is back on.
+    """
+    def duration(start, end):
+        simulated = end["motion"] - start["motion"] + end["gripper"] - start["gripper"]
+        return end["time"] - start["time"] + simulated * (1 - time_scale)
+
+    index = {event["event"]: event for event in events if event["sample"] is None}
+    sample_events = [event for event in events if event["sample"] is not None]
+    steps = {"setup": [duration(index["started"], index["calibrated"])]}
+    previous = index["calibrated"]
+    per_sample = {}
+    for event in sample_events:
+        step = duration(previous, event)
+        steps.setdefault(event["event"], []).append(step)
+        per_sample[event["sample"]] = per_sample.get(event["sample"], 0.0) + step
+        previous = event
+    steps["teardown"] = [duration(previous, index["measured"])]
+
+    sampling = duration(index["calibrated"], previous)
+    makespan = duration(index["started"], index["measured"])
+    return {
+        "scenario": scenario,
+        "time_scale": time_scale,
+        "samples": len(per_sample),
+        "makespan": round(makespan, 3),
+        "seconds_per_sample": round(sampling / max(len(per_sample), 1), 3),
+        "setup": round(steps["setup"][0], 3),
+        "teardown": round(steps["teardown"][0], 3),
+        "motion_time": round(index["measured"]["motion"], 3),
+        "gripper_time": round(index["measured"]["gripper"], 3),
+        "steps": {name: _stats(values) for name, values in steps.items()},
+        "per_sample": _stats(list(per_sample.values())) if per_sample else None,
+    }
+
+def scenario_name(scenario):
+    name = f"setup{scenario['setup']}_{scenario['columns']}x{scenario['rows']}_{scenario['samples']}samples"
+    return name + ("_async" if scenario["async_motion"] else "")
+
+def print_result(name, result):
+    print(f"\n{name}: {result['samples']} samples, makespan {scheduler.format_duration(result['makespan'])}, "
+          f"{result['seconds_per_sample']:.1f} s/sample (setup {result['setup']:.1f} s, teardown {result['teardown']:.1f} s)")
+    print(f"  {'step':<12}{'count':>6}{'mean':>9}{'p50':>9}{'p95':>9}{'total':>10}")
+    for step, stats in result["steps"].items():
+        print(f"  {step:<12}{stats['count']:>6}{stats['mean']:>9.2f}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['total']:>10.1f}")
+
+def projected_makespan(result, samples):
+    """Cycle time for another number of samples, from the setup, teardown and time per sample of a run."""
+    return result["setup"] + result["teardown"] + result["seconds_per_sample"] * samples
+
+def compare(results, baseline, tolerance):
+    """
+    Compares seconds per sample and makespan with a baseline.
+
+    Returns:
+    - list: Regressions as text (empty if none).
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name}: no baseline")
+            continue
+        for key in ("seconds_per_sample", "makespan"):
+            old, new = baseline[name][key], result[key]
+            change = (new - old) / old * 100 if old else 0.0
+            print(f"{name} {key}: {old:.2f} -> {new:.2f} ({change:+.1f} %)")
+            if new > old * (1 + tolerance / 100):
+                regressions.append(f"{name} {key} {change:+.1f} %")
+    return regressions
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 3. COMMAND LINE
+
+def _grid(text):
+    columns, rows = text.lower().split("x")
+    return int(columns), int(rows)
+
+def _overrides(items):
+    settings = {}
+    for item in items:
+        key, value = item.split("=", 1)
+        try:
+            settings[key] = json.loads(value)
+        except ValueError:
+            settings[key] = value
+    return settings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks full cycles of execute_command on the simulated robot and emulated devices.")
+    parser.add_argument('--grid', type=_grid, nargs='+', default=[(23, 11)], help='Grid sizes as COLUMNSxROWS')
+    parser.add_argument('--samples', type=int, nargs='+', default=[3], help='Samples measured per cycle')
+    parser.add_argument('--setup', type=int, nargs='+', default=[1], choices=[1, 2])
+    parser.add_argument('--async-motion', action='store_true', help='Run with the async_motion option')
+    parser.add_argument('--time-scale', type=float, default=0.1, help='Simulated motion speed-up (results are in real-robot time)')
+    parser.add_argument('--simulator', nargs='*', default=[], metavar='KEY=VALUE', help='simulator.SETTINGS overrides')
+    parser.add_argument('--emulator', nargs='*', default=[], metavar='KEY=VALUE', help='device_emulator.SETTINGS overrides')
+    parser.add_argument('--trace', action='store_true', help='Write the timing spans of each run to <workdir>/<scenario>/data/Trace.jsonl')
+    parser.add_argument('--fit', type=int, default=None, metavar='SAMPLES', help='Check whether a cycle of this many samples fits the timing block')
+    parser.add_argument('--config', default=os.path.join(HERE, 'config1.json'), help='Config whose timing block --fit checks')
+    parser.add_argument('--baseline', help='Baseline JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=10.0, help='Allowed slowdown against the baseline in percent')
+    parser.add_argument('--save', help='Write the results to this JSON file (e.g. a new baseline)')
+    parser.add_argument('--workdir', help='Folder for the runs (default: a new temporary folder)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # Child process: run one scenario and hand the result to the parent on the last line
+        request = json.loads(args.child)
+        result = run_scenario(request["scenario"], request["directory"])
+        print("RESULT " + json.dumps(result))
+        return
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="polymersion-benchmark-")
+    simulator_settings = dict(_overrides(args.simulator), time_scale=args.time_scale)
+    emulator_settings = _overrides(args.emulator)
+    print(f"Runs in {workdir}")
+
+    results = {}
+    for setup, (columns, rows), samples in itertools.product(args.setup, args.grid, args.samples):
+        if samples > columns * rows:
+            print(f"Skipping {samples} samples on a {columns}x{rows} grid")
+            continue
+        scenario = {"setup": setup, "columns": columns, "rows": rows, "samples": samples,
+                    "async_motion": args.async_motion, "simulator": simulator_settings, "emulator": emulator_settings,
+                    "trace": args.trace}
+        name = scenario_name(scenario)
+        directory = os.path.join(workdir, name)
+        os.makedirs(directory, exist_ok=True)
+        print(f"Running {name}...", flush=True)
+        with open(os.path.join(directory, "output.log"), "w") as log:
+            process = subprocess.run([sys.executable, os.path.abspath(__file__), "--child",
+                                      json.dumps({"scenario": scenario, "directory": directory})],
+                                     cwd=HERE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+            log.write(process.stdout)
+        lines = [line for line in process.stdout.splitlines() if line.startswith("RESULT ")]
+        if process.returncode != 0 or not lines:
+            print(f"{name} failed, see {os.path.join(directory, 'output.log')}")
+            continue
+        results[name] = json.loads(lines[-1][len("RESULT "):])
+        print_result(name, results[name])
+
+    if args.fit:
+        with open(args.config) as file:
+            interval = scheduler.interval_from_config(json.load(file)["timing"])
+        for name, result in results.items():
+            needed = projected_makespan(result, args.fit)
+            verdict = "fits" if needed <= interval else "does NOT fit"
+            print(f"{name}: {args.fit} samples need {scheduler.format_duration(needed)}, "
+                  f"{verdict} in the {scheduler.format_duration(interval)} cycle interval")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Results saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,8 @@ import socket
 import json
 import time
 
+import scheduler
+
 parser = argparse.ArgumentParser()
 parser.add_argument('--config', type=str, required=True, help='Ruta al archivo de configuración')
 parser.add_argument('--setup', type=int, required=True, help='Número de setup a utilizar (1, 2, etc)')
@@ -32,6 +34,22 @@ cycle_number = config["experiment"]["starting_cycle"]
 
 name = f"{material}_{temperature}_{date}"
 
+events_file = f"../data/Events_{name}.jsonl"  # Progress events streamed by the listener
+
+def print_event(event):
+    """Print one progress event received from the listener."""
+    timestamp = time.strftime('%H:%M:%S', time.localtime(event["time"]))
+    if event["event"] == "weighed":
+        print(f"[{timestamp}] Sample {event['sample']} weighed: {event['measurements']} -> {event['average']} g")
+        if event.get("unstable"):
+            print(f"[{timestamp}] Sample {event['sample']} measurements {event['unstable']} were not stable")
+    elif event["event"] == "measured" and event.get("photo_errors"):
+        print(f"[{timestamp}] Cycle {event.get('cycle')} measured, photo warnings: {'; '.join(event['photo_errors'])}")
+    elif "sample" in event:
+        print(f"[{timestamp}] Sample {event['sample']} {event['event']}")
+    else:
+        print(f"[{timestamp}] Cycle {event.get('cycle')} {event['event']}")
+
 print(f"Name: {name}")
 print(f"Cycles: {cycles}")
 print(f"Subycles: {subcycles}")
@@ -50,29 +68,23 @@ for i in range(1, cycles + 1):
 print(Groups)
 
 
-hours_delay = config["timing"]["hours_delay"] # Delay between cycles in hours
-minutes_delay = config["timing"]["minutes_delay"] # Delay between cycles in minutes
+interval = scheduler.interval_from_config(config["timing"]) # Delay between cycle starts in seconds
 cycle_number = config["experiment"]["starting_cycle"]
+starting_cycle = cycle_number
+
+# Cycle deadlines are anchored to now, so a long cycle does not delay the following ones
+schedule = scheduler.CycleScheduler(interval)
 
 while cycle_number <= cycles:
     # Time delay management
-    M = int(time.strftime('%M', time.localtime())) + minutes_delay
-    H = int(time.strftime('%H', time.localtime())) + hours_delay
-    if M >= 60:
-        M -= 60
-        H += 1
-    if len(str(M)) == 1:
-        M = '0' + str(M)
-    if H >= 24:
-        H = int(H) - 24 
-    if len(str(H)) == 1:
-        H = '0' + str(H)
-    time_delay = str(H) + str(M)
-    if len(str(time_delay)) == 3:
-        time_delay = '0' + str(time_delay)
-
-    print('Current Time: ', time.strftime('%H%M', time.localtime()))
-    print('Next Cycle: ', time_delay)
+    index = cycle_number - starting_cycle
+    lateness = schedule.wait(index)
+    next_cycle_at = schedule.wall_time(index + 1)
+
+    print('Current Time: ', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime()))
+    print('Next Cycle: ', time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(next_cycle_at)))
+    if lateness > 1:
+        print(f"Cycle {cycle_number} started {scheduler.format_duration(lateness)} late")
 
     print(f"\n--- Starting cycle {cycle_number} of {cycles} cycle/s. ---")
     SEQUENCE = Groups[cycle_number]
@@ -89,7 +101,7 @@ while cycle_number <= cycles:
         "temperature": temperature,
         "samples": [str(i) for i in SEQUENCE],
         "choice": choice,
-        "time_delay": time_delay,
+        "next_cycle_at": next_cycle_at,
         "cycle_number": cycle_number
     }
 
@@ -99,18 +111,25 @@ while cycle_number <= cycles:
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         s.connect((HOST, PORT))
         s.sendall(json_data.encode())
-        data = s.recv(1024)
-
-
-    # Parse the JSON response
-    response = json.loads(data.decode())
-    print(f"Received response: {response}")
+        # Replies are newline-delimited JSON
+        stream = s.makefile('rb')
+        data = stream.readline()
+
+        # Parse the JSON response
+        response = json.loads(data.decode())
+        print(f"Received response: {response}")
+
+        # Follow the progress events of this cycle until the robot is released
+        if response.get("status") in ("accepted", "busy"):
+            with open(events_file, "a") as events:
+                for line in stream:
+                    event = json.loads(line.decode())
+                    events.write(json.dumps(event) + "\n")
+                    events.flush()  # Make each event visible to downstream readers immediately
+                    print_event(event)
+                    if event.get("event") in ("completed", "failed"):
+                        break
     
     cycle_number += 1
-    # Check if it is time to break the cycle
-    while True:
-        if time.strftime('%H%M', time.localtime()) == time_delay:
-            break
-        time.sleep(1)
         
 print("EXPERIMENT COMPLETED!!!")
@@ -3,7 +3,15 @@
 # BS. 11.04.25                                               #
 # ---------------------------------------------------------- #
 
+import calendar
 import csv
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 
@@ -91,3 +99,288 @@ def plot_graph(csv_file, output_file, hdel, mdel):
     plt.close()  # Close the plot to free memory
 
 
+
+
+class ImageWriter:
+    """
+    Encodes and saves photos on background threads, away from the robot motion sequence.
+
+    Args:
+        workers (int): Number of encoding threads.
+        max_pending (int): Photos allowed to wait in the queue. When the disk cannot keep
+            up, save() blocks until a slot frees up, so memory use stays bounded.
+        codec (str): "png", "webp" or "jpg".
+        quality (int, optional): PNG compression level (0-9, default 3), WebP quality
+            (default 101 = lossless) or JPEG quality (default 95).
+    """
+
+    EXTENSIONS = {"png": ".png", "webp": ".webp", "jpg": ".jpg"}
+
+    def __init__(self, workers=2, max_pending=16, codec="png", quality=None):
+        if codec not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported image codec: {codec}")
+        self.codec = codec
+        self.params = self._encode_params(codec, quality)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._errors = []
+        self._threads = [threading.Thread(target=self._run, name=f"image-writer-{i}", daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    @staticmethod
+    def _encode_params(codec, quality):
+        if codec == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, 3 if quality is None else quality]
+        if codec == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, 101 if quality is None else quality]
+        return [cv2.IMWRITE_JPEG_QUALITY, 95 if quality is None else quality]
+
+    def save(self, path, image):
+        """
+        Queues an image to be saved and returns the path it will be written to.
+
+        Args:
+            path (str): Target path. The extension is replaced to match the codec.
+            image (numpy.ndarray): Frame to save. It must not be modified afterwards.
+
+        Returns:
+            str: Final path of the image file.
+        """
+        path = os.path.splitext(path)[0] + self.EXTENSIONS[self.codec]
+        self._queue.put((path, image))  # Blocks while max_pending photos are waiting
+        return path
+
+    def flush(self):
+        """
+        Waits until every queued photo is on disk.
+
+        Raises:
+            IOError: If any photo since the last flush could not be written.
+        """
+        self._queue.join()
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise IOError(f"{len(errors)} photo(s) could not be saved: {errors[0]}")
+
+    def close(self):
+        """Flushes pending photos and stops the writer threads."""
+        try:
+            self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for thread in self._threads:
+                thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            path, image = item
+            try:
+                if image is None:
+                    raise ValueError("no frame was captured")
+                ok, buffer = cv2.imencode(self.EXTENSIONS[self.codec], image, self.params)
+                if not ok:
+                    raise ValueError("encoding failed")
+                # Write to a temporary name first so readers never see a partial file
+                temporary = path + ".part"
+                with open(temporary, "wb") as file:
+                    file.write(buffer.tobytes())
+                os.replace(temporary, path)
+            except Exception as e:
+                self._errors.append(f"{path}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+class TemperatureStore:
+    """
+    Append-only binary store of temperature readings, one file per (UTC) day.
+
+    Every file is a flat array of records: the epoch time as float64 followed by
+    one float32 per sensor (NaN when a reading is missing). The files have no
+    header, so each one can be opened with numpy.memmap and a time range is
+    found with a binary search on the time column. The sensor names are kept in
+    meta.json next to the day files.
+
+    Args:
+        directory (str): Folder of the store. It is created if needed.
+        sensors (list, optional): Sensor names. Required when the store is new; an
+            existing store keeps its own names.
+    """
+
+    DAY = 86400
+
+    def __init__(self, directory, sensors=None):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        meta_file = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file) as file:
+                self.sensors = json.load(file)["sensors"]
+        elif sensors is None:
+            raise ValueError(f"{directory} is not a temperature store; give the sensor names to create one")
+        else:
+            self.sensors = [str(sensor) for sensor in sensors]
+            with open(meta_file, "w") as file:
+                json.dump({"sensors": self.sensors, "time": "<f8", "values": "<f4"}, file, indent=2)
+        self.dtype = np.dtype([("time", "<f8")] + [(sensor, "<f4") for sensor in self.sensors])
+        self._lock = threading.Lock()
+        self._last_time = -np.inf
+
+    def _day_file(self, day):
+        return os.path.join(self.directory, time.strftime("%Y-%m-%d", time.gmtime(day * self.DAY)) + ".bin")
+
+    def _days(self):
+        """Returns the day numbers that have a file, in order."""
+        days = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                stamp = time.strptime(name[:-4], "%Y-%m-%d")
+                days.append(int(calendar.timegm(stamp) // self.DAY))
+        return sorted(days)
+
+    def append(self, times, values):
+        """
+        Appends readings. Rows older than the last appended one are dropped, so the
+        time column of every file stays sorted.
+
+        Args:
+            times: Epoch time of each row (N,), or a single time.
+            values: Readings (N, sensors), or one row of readings.
+        """
+        times = np.atleast_1d(np.asarray(times, dtype=float))
+        values = np.asarray(values, dtype=float).reshape(len(times), len(self.sensors))
+        with self._lock:
+            if self._last_time == -np.inf:
+                self._last_time = self._stored_end()
+            keep = times > self._last_time
+            keep[1:] &= np.diff(times) > 0
+            times, values = times[keep], values[keep]
+            if len(times) == 0:
+                return 0
+            records = np.empty(len(times), dtype=self.dtype)
+            records["time"] = times
+            for column, sensor in enumerate(self.sensors):
+                records[sensor] = values[:, column]
+            days = np.floor(times / self.DAY).astype(np.int64)
+            for day in np.unique(days):
+                with open(self._day_file(day), "ab") as file:
+                    file.write(records[days == day].tobytes())
+            self._last_time = times[-1]
+            return len(times)
+
+    def _stored_end(self):
+        days = self._days()
+        for day in reversed(days):
+            data = self._map(day)
+            if len(data):
+                return float(data["time"][-1])
+        return -np.inf
+
+    def _map(self, day):
+        path = self._day_file(day)
+        if not os.path.exists(path) or os.path.getsize(path) < self.dtype.itemsize:
+            return np.empty(0, dtype=self.dtype)
+        count = os.path.getsize(path) // self.dtype.itemsize  # A partly written last record is ignored
+        return np.memmap(path, dtype=self.dtype, mode="r", shape=(count,))
+
+    def read(self, start=None, end=None, sensors=None):
+        """
+        Returns the records between two epoch times (inclusive).
+
+        Args:
+            start, end (float, optional): Range limits. Default: the whole store.
+            sensors (list, optional): Columns to return besides the time.
+
+        Returns:
+            numpy.ndarray: Structured array with a "time" field and one field per sensor.
+        """
+        fields = ["time"] + [str(sensor) for sensor in (self.sensors if sensors is None else sensors)]
+        chunks = []
+        for day in self._days():
+            if start is not None and (day + 1) * self.DAY <= start:
+                continue
+            if end is not None and day * self.DAY > end:
+                break
+            data = self._map(day)
+            first = 0 if start is None else np.searchsorted(data["time"], start, side="left")
+            last = len(data) if end is None else np.searchsorted(data["time"], end, side="right")
+            chunks.append(np.array(data[fields][first:last]))
+        if not chunks:
+            return np.empty(0, dtype=self.dtype[fields])
+        return np.concatenate(chunks)
+
+    def downsample(self, sensor, every, start=None, end=None):
+        """
+        Averages the valid readings of a sensor over consecutive bins of `every` seconds.
+
+        Returns:
+            tuple: Arrays (bin_starts, means).
+        """
+        data = self.read(start, end, [sensor])
+        values = data[str(sensor)].astype(float)
+        valid = ~np.isnan(values)
+        bins = np.floor(data["time"][valid] / every).astype(np.int64)
+        if len(bins) == 0:
+            return np.array([]), np.array([])
+        labels, index = np.unique(bins, return_inverse=True)
+        means = np.bincount(index, weights=values[valid]) / np.bincount(index)
+        return labels * float(every), means
+
+    def to_csv(self, filename, start=None, end=None):
+        """Exports a range as CSV (epoch time, local time and one column per sensor)."""
+        data = self.read(start, end)
+        table = pd.DataFrame({sensor: data[sensor] for sensor in self.sensors})
+        table.insert(0, "local_time", [time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t)) for t in data["time"]])
+        table.insert(0, "time", data["time"])
+        table.to_csv(filename, index=False)
+
+
+def convert_registry(registry_file, store, sensor, year=None):
+    """
+    Imports a text temperature registry ('%m/%d, %H:%M:%S, value' per line) into a TemperatureStore.
+
+    The text format has no year. It is taken from `year` (year of the first line) or
+    else from the modification date of the file (year of the last line), and is
+    increased where the dates wrap from December to January. Times are read as
+    local time, as they were written. The store is append-only, so import old
+    registries into a new store or before newer readings are appended.
+
+    Args:
+        registry_file (str): TemperatureRegistry_<name>.txt file.
+        store (TemperatureStore): Destination store.
+        sensor (str): Sensor (bath) the registry belongs to; the other sensors are stored as NaN.
+        year (int, optional): Year of the first line.
+
+    Returns:
+        int: Number of readings imported.
+    """
+    lines = []
+    with open(registry_file) as file:
+        for line in file:
+            parts = [part.strip() for part in line.split(",")]
+            try:
+                lines.append((int(parts[0].split("/")[0]), parts[0], parts[1], float(parts[2])))
+            except (IndexError, ValueError):
+                continue  # Blank or malformed line
+
+    months = [month for month, _, _, _ in lines]
+    wraps = sum(later < earlier for earlier, later in zip(months, months[1:]))
+    if year is None:
+        year = time.localtime(os.path.getmtime(registry_file)).tm_year - wraps
+
+    times, values = [], []
+    for i, (month, date, clock, value) in enumerate(lines):
+        if i and month < lines[i - 1][0]:
+            year += 1  # December -> January
+        times.append(time.mktime(time.strptime(f"{year}/{date} {clock}", "%Y/%m/%d %H:%M:%S")))
+        values.append(value)
+
+    rows = np.full((len(times), len(store.sensors)), np.nan)
+    rows[:, store.sensors.index(str(sensor))] = values
+    return store.append(np.array(times, dtype=float), rows)
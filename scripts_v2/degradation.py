@@ -15,15 +15,97 @@ from random import choice
 import cv2
 import time
 import json
+import threading
 
 import robot
 import gripper
 import environment
+import tracing
 
+# ---------------------------------------------------------------------------------------------------------------------
+# CONTACT PROBING
+
+PROBE_SPEED = 0.1           # Contact speed (m/s) when the surface location is unknown
+SLOW_PROBE_SPEED = 0.03     # Contact speed (m/s) after the fast approach
+APPROACH_SPEED = 0.25       # Speed (m/s) of the fast move to the standoff
+APPROACH_ACCELERATION = 1.2
+PROBE_STANDOFF = 0.01       # Distance (m) before the expected surface where the slow approach starts
+FORCE_SAMPLE_PERIOD = 0.01  # Seconds between force samples recorded during a probe
+
+expected_contacts = {}  # (setup, probe name) -> last contact pose
+contact_profiles = {}   # (setup, probe name) -> [(seconds since start, [Fx, Fy, Fz, Tx, Ty, Tz]), ...] of the last probe
+
+def clear_contacts(setup, prefix=""):
+    """Forgets the expected contacts of a bath (those whose probe name starts with prefix)."""
+    for key in [key for key in expected_contacts if key[0] == setup and key[1].startswith(prefix)]:
+        del expected_contacts[key]
+
+@tracing.traced()
+def probe(name, direction, rtde_c, rtde_r, setup, expected=None, standoff=PROBE_STANDOFF, stop_script=False):
+    """
+    Moves along a direction until contact, approaching fast when the surface location is known.
+
+    Parameters:
+    -----------
+    name : str
+        Identifies the probe; its last contact is the expected surface for the next call.
+    setup : int
+        Bath the probed surface belongs to. Contacts are remembered per bath, so a probe
+        never approaches fast to a surface recorded on the other bath.
+    direction : list
+        Unit vector [x, y, z] of the approach in the base frame.
+    expected : list, optional
+        Expected contact pose (e.g. from the calibration cache). Defaults to the last contact of this probe.
+    standoff : float
+        The fast move stops this far before the expected surface, then the slow approach finds the contact.
+        The surface must not have moved more than this towards the probe, since the fast move cannot detect contact.
+    stop_script : bool
+        Stops the control script after the contact, as the grid probes of the original center() did.
+
+    Returns:
+    --------
+    contact : list
+        TCP pose at contact. The force profile of the approach is stored in contact_profiles[setup, name].
+    """
+    expected = expected if expected is not None else expected_contacts.get((setup, name))
+    speed = PROBE_SPEED
+    if expected is not None:
+        start = rtde_r.getActualTCPPose()
+        distance = sum((e - s) * u for e, s, u in zip(expected[:3], start[:3], direction))
+        if distance > standoff:
+            # Travel fast to just before the surface, then touch it slowly
+            target = list(start)
+            for axis in range(3):
+                target[axis] += direction[axis] * (distance - standoff)
+            rtde_c.moveL(target, APPROACH_SPEED, APPROACH_ACCELERATION)
+            speed = SLOW_PROBE_SPEED
+    velocity = [speed * u for u in direction] + [0, 0, 0]
+
+    # Sample the force sensor while moveUntilContact blocks
+    profile = []
+    probing = threading.Event()
+    probing.set()
+    def record_force():
+        start_time = time.monotonic()
+        while probing.is_set():
+            profile.append((time.monotonic() - start_time, rtde_r.getActualTCPForce()))
+            time.sleep(FORCE_SAMPLE_PERIOD)
+    recorder = threading.Thread(target=record_force, daemon=True)
+
+    rtde_c.zeroFtSensor()
+    recorder.start()
+    try:
+        rtde_c.moveUntilContact(velocity, direction=velocity)
+    finally:
+        probing.clear()
+        recorder.join()
+    if stop_script:
+        rtde_c.stopScript()
+    contact = rtde_r.getActualTCPPose()
 
-from rtde_control import RTDEControlInterface as RTDEControl
-from rtde_receive import RTDEReceiveInterface as RTDEReceive
-from rtde_io import RTDEIOInterface as RTDEIO
+    expected_contacts[setup, name] = contact
+    contact_profiles[setup, name] = profile
+    return contact
 
 # ---------------------------------------------------------------------------------------------------------------------
 # 1. MANIPULATE BASIN LID
@@ -33,7 +115,84 @@ with open("config.json", "r") as file:
 
 setup = config["robot"]["setup"]
 
-def move_lid(STATUS, rtde_c, rtde_r, rtde_io):
+# Pose above the stand where the lid is left while the bath is open (config "robot" "lid_stand" overrides it)
+LID_STAND_POSITION = config["robot"].get("lid_stand", [0.6030834794381555, 0.9021261902449913, 0.39639681430164314, 0.01272613523271384, 3.1354295627494064, 0.0013375201682988259])
+LID_CACHE = "../data/LidHeights_setup{setup}.json"  # One file per bath
+LID_CLEARANCE = 0.001  # The cached moves stop this far (m) above the contact height
+
+lid_heights = {}  # Setup -> contact height (m) per lid step, loaded from LID_CACHE on first use
+
+def _load_lid_heights(setup):
+    if setup not in lid_heights:
+        try:
+            with open(LID_CACHE.format(setup=setup)) as file:
+                lid_heights[setup] = json.load(file)
+        except (OSError, ValueError):
+            lid_heights[setup] = {}
+    return lid_heights[setup]
+
+def _save_lid_heights(setup):
+    with open(LID_CACHE.format(setup=setup), "w") as file:
+        json.dump(lid_heights[setup], file, indent=2)
+
+def lower_to_lid(step, rtde_c, rtde_r, setup, force_probe=False):
+    """
+    Moves the gripper straight down to the contact height of a lid step.
+
+    The first time (or with force_probe) the height is found with a contact probe
+    and cached; afterwards a plain position move to the cached height is used.
+
+    Parameters:
+    -----------
+    step : str
+        "pick" (lid on the bath), "stand_off"/"stand_on" (stand, leaving/taking the lid) or "place" (back on the bath).
+    setup : int
+        Bath the lid belongs to; each bath has its own cached heights.
+    force_probe : bool
+        Probes even if a height is cached, e.g. when the gripper missed the lid. A cached
+        height still lets the probe approach fast up to PROBE_STANDOFF above it.
+
+    Returns:
+    --------
+    probed : bool
+        True if the height was found by contact.
+    """
+    heights = _load_lid_heights(setup)
+    pose = rtde_r.getActualTCPPose()
+    if step in heights and not force_probe:
+        pose[2] = heights[step] + LID_CLEARANCE
+        rtde_c.moveL(pose, APPROACH_SPEED, APPROACH_ACCELERATION)
+        return False
+
+    expected = None
+    if step in heights:
+        expected = list(pose)
+        expected[2] = heights[step]
+    contact = probe("lid_" + step, [0, 0, -1], rtde_c, rtde_r, setup, expected=expected)
+    heights[step] = contact[2]
+    _save_lid_heights(setup)
+    return True
+
+def grasp_lid(step, rtde_c, rtde_r, rtde_io, setup):
+    """
+    Lowers to the lid and closes the gripper on it.
+
+    The cached height is only trusted when the gripper reports its finger width
+    (gripper width_feedback), since that is what shows a missed lid; the grasp is
+    then probed again if the gripper closed on nothing. Without width feedback
+    every grasp is probed.
+    """
+    feedback = gripper.SETTINGS["width_feedback"]
+    probed = lower_to_lid(step, rtde_c, rtde_r, setup, force_probe=not feedback)
+    width = gripper.close_grip(rtde_c, rtde_r, rtde_io, force=40)
+    if not gripper.holding(width) and not probed:
+        # The lid is not where it was last time: find it by contact and update the cache
+        gripper.open_grip(40, rtde_c, rtde_r, rtde_io)
+        lower_to_lid(step, rtde_c, rtde_r, setup, force_probe=True)
+        gripper.close_grip(rtde_c, rtde_r, rtde_io, force=40)
+
+@tracing.traced()
+def move_lid(STATUS, rtde_c, rtde_r, rtde_io, setup):
     """
     This function controls the movement of a robotic lid based on the provided status. 
     It also manages the gripping of the lid and performs actions depending on whether the lid should be opened or closed.
@@ -49,6 +208,9 @@ def move_lid(STATUS, rtde_c, rtde_r, rtde_io):
     rtde_r : RTDEReadInterface
     rtde_io : RTDEIOInterface
 
+    setup : int
+        Bath whose lid is moved (the setup of the command); selects the cached lid heights.
+
     Returns:
     --------
     lid_position_before_move : float
@@ -72,7 +234,8 @@ def move_lid(STATUS, rtde_c, rtde_r, rtde_io):
     Notes:
     ------
     - The function expects that the gripper and movement actions are defined in other parts of the code, specifically the `open_grip` and `close_grip` functions.
-    - The robot's movements are controlled using the `moveL` method for linear motion and `moveUntilContact` to detect contact with the surface.
+    - The contact heights are probed once per bath and cached in LID_CACHE (see `lower_to_lid`); later cycles lower the
+      held lid with plain `moveL` moves. Grasps are probed again unless the gripper reports its width (see `grasp_lid`).
     """
     
     current_tcp_position = rtde_r.getActualTCPPose() # Get the current tool center point (TCP) position
@@ -80,38 +243,29 @@ def move_lid(STATUS, rtde_c, rtde_r, rtde_io):
 
     # Interface A/R: If the status is "off", perform actions to close the lid
     if STATUS == "off":
-        downward_speed = [0, 0, -0.1, 0, 0, 0] # Define a speed vector to move downwards
-        rtde_c.zeroFtSensor() # Zero the force/torque sensor to ensure accurate measurement
-        rtde_c.moveUntilContact(downward_speed, direction=downward_speed) # Move the robot until contact is detected with the downward speed
-        gripper.close_grip(rtde_c, rtde_r, rtde_io, force=40)
+        grasp_lid("pick", rtde_c, rtde_r, rtde_io, setup) # Move down to the lid and grip it
         lid_position_before_move = rtde_r.getActualTCPPose()[2]
         rtde_c.moveL(current_tcp_position, 0.05)
 
     intermediate_tcp_position = rtde_r.getActualTCPPose()
-    final_lid_position = [0.6030834794381555, 0.9021261902449913, 0.39639681430164314, 0.01272613523271384, 3.1354295627494064, 0.0013375201682988259] # Define the final position for the lid to be moved to
+    final_lid_position = list(LID_STAND_POSITION) # The final position for the lid to be moved to
     final_lid_position[2] += 0.05
     rtde_c.moveL(final_lid_position, 3, 1)
     
-    # Move down to detect contact with the lid or surface below
-    downward_speed = [0,0, -.1, 0, 0, 0]
-    rtde_c.zeroFtSensor()
-    rtde_c.moveUntilContact(downward_speed, direction=downward_speed)
-    
-    # Interface A/R: If the status is "off", open the gripper slightly to release the lid
+    # Interface A/R: If the status is "off", lower the lid onto the stand and open the gripper slightly to release it
     if STATUS == "off":
+        lower_to_lid("stand_off", rtde_c, rtde_r, setup)
         gripper.open_grip(30, rtde_c, rtde_r, rtde_io)
     else:
-        # If the status is "on", close the gripper with a force of 40 to keep the lid secured
-        gripper.close_grip(rtde_c, rtde_r, rtde_io, force=40)
+        # If the status is "on", lower to the lid and grip it with a force of 40 to keep it secured
+        grasp_lid("stand_on", rtde_c, rtde_r, rtde_io, setup)
 
     rtde_c.moveL(final_lid_position, 3, 1)
     rtde_c.moveL(intermediate_tcp_position, 3, 1)
 
     # Interface A/R: If the status is "on", perform additional actions
     if STATUS == "on":
-        downward_speed = [0,0, -.1, 0, 0, 0]
-        rtde_c.zeroFtSensor()
-        rtde_c.moveUntilContact(downward_speed, direction=downward_speed)
+        lower_to_lid("place", rtde_c, rtde_r, setup)
         gripper.open_grip(40, rtde_c, rtde_r, rtde_io)
         
         # Move the robot back to the initial position (restore the TCP position)
@@ -126,7 +280,60 @@ def move_lid(STATUS, rtde_c, rtde_r, rtde_io):
 
 import math
 
-def center(temporal_position, rtde_c, rtde_r, rtde_io, OFFSETT):
+PROBES_PER_EDGE = 3          # Contact points measured on each tray edge
+PROBE_SPAN = 0.15            # Distance (m) covered by the probes along each edge
+MAX_FIT_RESIDUAL = 0.001     # RMS residual (m) above which the probing is repeated
+MAX_CALIBRATION_ATTEMPTS = 3
+
+def fit_corner(edge_y_points, edge_x_points):
+    """
+    Fits two perpendicular lines to the contact points of the two tray edges by least squares.
+
+    The edge probed along Y runs in direction u = (cos a, sin a) and the edge probed along X
+    is perpendicular to it. Rotating the X-edge points by 90 degrees gives both point sets
+    the same direction, so a single total least squares fit over the centred points of both
+    edges finds the common angle, and each edge keeps its own offset.
+
+    Parameters:
+    -----------
+    edge_y_points : array-like (N, 2)
+        XY contacts on the edge probed along Y (at least 2).
+    edge_x_points : array-like (M, 2)
+        XY contacts on the edge probed along X (at least 2).
+
+    Returns:
+    --------
+    intersection : numpy.ndarray (2,)
+        Corner where the two edges meet.
+    rotation_angle : float
+        Angle of the Y-probed edge with the robot X axis (radians).
+    residual : float
+        RMS distance of the contacts to the fitted edges (m); a measure of confidence.
+    """
+    a = np.asarray(edge_y_points, dtype=float)
+    b = np.asarray(edge_x_points, dtype=float)
+    if len(a) < 2 or len(b) < 2:
+        raise ValueError("At least two contacts per edge are needed")
+
+    b_rotated = np.column_stack([-b[:, 1], b[:, 0]])
+    centred = np.vstack([a - a.mean(axis=0), b_rotated - b_rotated.mean(axis=0)])
+    eigenvalues, eigenvectors = np.linalg.eigh(centred.T @ centred)
+    direction = eigenvectors[:, 1]  # Largest eigenvalue: common edge direction
+    if direction[0] < 0:
+        direction = -direction
+    normal = np.array([-direction[1], direction[0]])
+
+    offset_y_edge = normal @ a.mean(axis=0)     # normal . p = offset on the Y-probed edge
+    offset_x_edge = direction @ b.mean(axis=0)  # direction . p = offset on the X-probed edge
+    intersection = offset_y_edge * normal + offset_x_edge * direction
+
+    residuals = np.concatenate([(a - a.mean(axis=0)) @ normal, (b - b.mean(axis=0)) @ direction])
+    residual = float(np.sqrt(np.mean(residuals ** 2)))
+    rotation_angle = float(math.atan2(direction[1], direction[0]))
+    return intersection, rotation_angle, residual
+
+@tracing.traced()
+def center(temporal_position, rtde_c, rtde_r, rtde_io, OFFSETT, setup, probes_per_edge=PROBES_PER_EDGE):
     """
     This function is designed to center the robot's tool at a specific point in space based on measurements 
     taken along the X and Y axes. It uses the gripper's position and force sensors to determine the center 
@@ -146,6 +353,12 @@ def center(temporal_position, rtde_c, rtde_r, rtde_io, OFFSETT):
         An offset value used to adjust the final position of the robot, especially for Z-coordinate calibration. 
         It is applied to fine-tune the robot's final position after centering the object.
 
+    setup : int
+        Bath whose grid is probed; the result is kept in last_calibration[setup].
+
+    probes_per_edge : int
+        Number of contact points measured on each edge (at least 2).
+
     Returns:
     --------
     final_pose : list
@@ -153,184 +366,230 @@ def center(temporal_position, rtde_c, rtde_r, rtde_io, OFFSETT):
         the position (X, Y, Z) and the orientation (rotation angle).
 
     rotation_angle : float
-        The calculated rotation angle required for centering the robot based on the slope of the measurements 
-        along the X and Y axes.
+        The rotation angle of the grid, from the least squares fit of both edges.
+
+    residual : float
+        RMS distance (m) of the contact points to the fitted edges. Small values mean a reliable frame.
 
     Description:
     -----------
     - The function starts by closing the gripper with a specified force to prepare for the centering operation.
-    - The robot first moves to a temporary position and adjusts for measurements along both the Y and X axes.
-    - It performs a series of movements to measure contact points along the Y-axis and X-axis, calculating slopes 
-      and intersections to find the center of the object.
-    - The robot calculates the intersection point of the two lines (one for the Y-axis and one for the X-axis) 
-      and uses this to determine the object's center in the workspace.
+    - It probes `probes_per_edge` points along the edge facing -Y, then along the edge facing -X,
+      spread over PROBE_SPAN.
+    - Both edges are fitted at once with the constraint that they are perpendicular (see fit_corner),
+      which gives the corner and the rotation angle.
+    - The probing is only repeated if the fit residual exceeds MAX_FIT_RESIDUAL (e.g. a contact was
+      triggered by debris), up to MAX_CALIBRATION_ATTEMPTS times.
     - The robot then adjusts its position based on the calculated center, applies an offset for precision, 
       and moves to the final position.
-    - The final position of the robot is returned, along with the rotation angle required for centering the object.
 
     Notes:
     ------
     - The function assumes that the gripper and movement actions (e.g., `moveL`, `moveUntilContact`) are defined 
       and configured properly in other parts of the code.
     - The function uses force feedback sensors to detect contact and determine the position of the object.
-    - The robot’s alignment and rotation are carefully adjusted by calculating the slopes of the lines created 
-      during the measurements.
     """
 
     gripper.close_grip(rtde_c, rtde_r, rtde_io, force=40)
 
     # Initial adjustment to temporary position for centering
     temporal_position[0] += 0.05
+    step = PROBE_SPAN / (probes_per_edge - 1)
 
-    while True:
-        rtde_c.moveL(temporal_position, 1)
-
-        # Gripper offset dimensions
-        gripper_offset_y = 0.005
-        gripper_offset_x = 0.009
+    # Gripper offset dimensions
+    gripper_offset_y = 0.005
+    gripper_offset_x = 0.009
 
-        # First line (Y-axis measurement)
-        # Move down along the Y-axis until contact
-        speed = [0, -0.1, 0, 0, 0, 0]
-        rtde_c.zeroFtSensor()
-        rtde_c.moveUntilContact(speed, direction=speed)
-        rtde_c.stopScript()
-        pose_1 = rtde_r.getActualTCPPose()
-
-        y1 = pose_1[1] - gripper_offset_y
-        x1 = pose_1[0]
+    for attempt in range(1, MAX_CALIBRATION_ATTEMPTS + 1):
+        rtde_c.moveL(temporal_position, 1)
 
-        # Move to the next position for further calculations
-        pose_1[1] += 0.04
-        rtde_c.moveL(pose_1, 0.5, 1)
-        pose_1[0] -= 0.15
-        rtde_c.moveL(pose_1, 0.5, 1)
+        # First line (Y-axis measurement): probe along -Y, stepping towards -X
+        edge_y_points = []
+        for i in range(probes_per_edge):
+            if i > 0:
+                pose[1] += 0.04
+                rtde_c.moveL(pose, 0.5, 1)
+                pose[0] -= step
+                rtde_c.moveL(pose, 0.5, 1)
+            pose = probe(f"edge_y_{i}", [0, -1, 0], rtde_c, rtde_r, setup, stop_script=True)
+            if i == 0:
+                reference_probe = {"start": list(temporal_position), "contact": pose[:3]}
+            edge_y_points.append([pose[0], pose[1] - gripper_offset_y])
 
-        # Second measurement along the Y-axis
-        rtde_c.zeroFtSensor()
-        rtde_c.moveUntilContact(speed, direction=speed)
-        rtde_c.stopScript()
-        pose_2 = rtde_r.getActualTCPPose()
+        # Move back to a safer position
+        pose[1] += 0.06
+        rtde_c.moveL(pose, 0.5, 1)
+
+        # Second line (X-axis measurement): probe along -X, stepping towards +Y
+        edge_x_points = []
+        for i in range(probes_per_edge):
+            if i > 0:
+                pose[0] += 0.04
+                pose[1] += step
+                rtde_c.moveL(pose, 0.5, 1)
+            start = list(pose)
+            pose = probe(f"edge_x_{i}", [-1, 0, 0], rtde_c, rtde_r, setup, stop_script=True)
+            if i == 0:
+                reference_probe_x = {"start": start, "contact": pose[:3]}
+            edge_x_points.append([pose[0] - gripper_offset_x, pose[1]])
+
+        intersection, rotation_angle, residual = fit_corner(edge_y_points, edge_x_points)
+        X_intersection, Y_intersection = intersection
+        print(f"Calibration attempt {attempt}: angle {math.degrees(rotation_angle):.3f} deg, "
+              f"residual {residual * 1000:.2f} mm")
+
+        # Check if the contacts agree with two perpendicular edges
+        if residual <= MAX_FIT_RESIDUAL:
+            break
+    else:
+        print(f"Calibration residual above {MAX_FIT_RESIDUAL * 1000:.1f} mm, using the last fit")
 
-        y2 = pose_2[1] - gripper_offset_y
-        x2 = pose_2[0]
+    # Calculate the center of the bin
+    x_center = X_intersection + (0.25 * math.cos(rotation_angle) - 0.15 * math.sin(rotation_angle))
+    y_center = Y_intersection + (0.15 * math.cos(rotation_angle) + 0.25 * math.sin(rotation_angle))
 
-        # Calculate slope for the first line
-        try:
-            slope_y = (y2 - y1) / (x2 - x1)
-        except ZeroDivisionError:
-            slope_y = y2 - y1
-        intercept_y = y1 - slope_y * x1
+    pose[0] = x_center
+    pose[1] = y_center
 
-        # Move back to a safer position
-        pose_2[1] += 0.06
-        rtde_c.moveL(pose_2, 0.5, 1)
+    # Adjust to center on rack corner
+    pose[0] -= (0.222 * math.cos(rotation_angle) - 0.102 * math.sin(rotation_angle))
+    pose[1] -= (0.102 * math.cos(rotation_angle) + 0.222 * math.sin(rotation_angle))
+    pose[2] = 0.4 + OFFSETT
 
-        # Second line (X-axis measurement)
-        speed = [-0.1, 0, 0, 0, 0, 0]
-        rtde_c.zeroFtSensor()
-        rtde_c.moveUntilContact(speed, direction=speed)
-        rtde_c.stopScript()
-        pose_3 = rtde_r.getActualTCPPose()
+    rtde_c.moveL(pose, 3, 1)
+    final_pose = rtde_r.getActualTCPPose()
 
-        y3 = pose_3[1]
-        x3 = pose_3[0] - gripper_offset_x
+    # Keep the first probe of each edge so a later cycle can verify the calibration with two contacts
+    contacts = {name: pose for (bath, name), pose in expected_contacts.items() if bath == setup and name.startswith("edge_")}
+    last_calibration[setup] = dict(final_pose=final_pose, angle=rotation_angle, residual=residual,
+                                   probe=reference_probe, probe_x=reference_probe_x, contacts=contacts)
 
-        # Move to next position
-        pose_3[0] += 0.04
-        pose_3[1] += 0.15
-        rtde_c.moveL(pose_3, 0.5, 1)
+    return final_pose, rotation_angle, residual
 
-        # Second measurement along the X-axis
-        rtde_c.zeroFtSensor()
-        rtde_c.moveUntilContact(speed, direction=speed)
-        rtde_c.stopScript()
-        pose_4 = rtde_r.getActualTCPPose()
+# Setup -> result of the last calibration of that bath in this process (see center)
+last_calibration = {}
 
-        y4 = pose_4[1]
-        x4 = pose_4[0] - gripper_offset_x
+CALIBRATION_CACHE = "../data/Calibration_setup{setup}.json"  # One file per bath
+CALIBRATION_TOLERANCE = 0.002  # Maximum drift (m) of the verification contacts to reuse the cache
+VERIFY_STANDOFF = 0.03  # The verification probes slow down this far (m) before the cached edges: the tray may have moved
 
-        # Calculate slope for the second line
-        try:
-            slope_x = (y4 - y3) / (x4 - x3)
-        except ZeroDivisionError:
-            slope_x = y4 - y3
-        intercept_x = y3 - slope_x * x3
-
-        # Calculate intersection point
-        try:
-            X_intersection = (intercept_x - intercept_y) / (slope_y - slope_x)
-        except ZeroDivisionError:
-            X_intersection = (intercept_x - intercept_y)
-        Y_intersection = slope_y * X_intersection + intercept_y
+def save_calibration(setup, filename=None):
+    """
+    Saves the last calibration of a bath (final pose, angle and reference probes) with a timestamp.
+    """
+    data = dict(last_calibration[setup], setup=setup, timestamp=time.time(),
+                date=datetime.datetime.now().isoformat(timespec='seconds'))
+    with open(filename or CALIBRATION_CACHE.format(setup=setup), 'w') as file:
+        json.dump(data, file, indent=4)
 
-        # Calculate rotation angle
-        rotation_angle = math.atan(slope_y)
+def load_calibration(setup, filename=None, max_age=None):
+    """
+    Loads the saved calibration of a bath. Returns None if there is none or it is older than max_age seconds.
+    """
+    try:
+        with open(filename or CALIBRATION_CACHE.format(setup=setup), 'r') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if max_age is not None and time.time() - data.get("timestamp", 0) > max_age:
+        return None
+    return data
+
+@tracing.traced()
+def verify_calibration(cached, rtde_c, rtde_r, rtde_io, setup, tolerance=CALIBRATION_TOLERANCE):
+    """
+    Repeats the first probe of each edge of the cached calibration and compares the contacts.
 
-        try:
-            inverse_slope_y = 1 / slope_y
-        except ZeroDivisionError:
-            inverse_slope_y = 1
+    The -Y probe measures a shift of the tray along Y and the -X probe a shift along X,
+    so a translation in any direction is detected. A rotation is only seen through
+    the displacement it causes at the two probe points.
 
-        inverse_slope_x = -1 * slope_x
+    Returns:
+    --------
+    bool : True if both contacts lie within tolerance of the cached ones, i.e. the tray has not moved.
+           A cache without the X probe (written by an older version) is never accepted.
+    """
+    if "probe_x" not in cached:
+        return False
+    gripper.close_grip(rtde_c, rtde_r, rtde_io, force=40)
 
-        try:
-            difference = abs(abs(inverse_slope_x) / abs(inverse_slope_y))
-        except ZeroDivisionError:
-            difference = abs(inverse_slope_x)
+    drifts = []
+    for name, direction, key in (("edge_y_0", [0, -1, 0], "probe"), ("edge_x_0", [-1, 0, 0], "probe_x")):
+        reference = cached[key]
+        rtde_c.moveL(reference["start"], APPROACH_SPEED, APPROACH_ACCELERATION)
 
-        # Check if alignment is within tolerance
-        if 0.5 <= difference <= 1.5:
-            break
+        # Approach fast up to the cached edge, then touch it slowly
+        contact = probe(name, direction, rtde_c, rtde_r, setup, expected=reference["contact"],
+                        standoff=VERIFY_STANDOFF, stop_script=True)
 
-    # Calculate the center of the bin
-    x_center = X_intersection + (0.25 * math.cos(rotation_angle) - 0.15 * math.sin(rotation_angle))
-    y_center = Y_intersection + (0.15 * math.cos(rotation_angle) + 0.25 * math.sin(rotation_angle))
+        # Back off the edge like center() does
+        retreat = list(contact)
+        axis = 1 if key == "probe" else 0
+        retreat[axis] += 0.04
+        rtde_c.moveL(retreat, 0.5, 1)
+        drifts.append(math.dist(contact[:2], reference["contact"][:2]))
 
-    pose_2[0] = x_center
-    pose_2[1] = y_center
+    print(f"Calibration check: contact drift {drifts[0] * 1000:.1f} mm (Y edge), {drifts[1] * 1000:.1f} mm (X edge)")
+    return max(drifts) <= tolerance
 
-    # Adjust to center on rack corner
-    pose_2[0] -= (0.222 * math.cos(rotation_angle) - 0.102 * math.sin(rotation_angle))
-    pose_2[1] -= (0.102 * math.cos(rotation_angle) + 0.222 * math.sin(rotation_angle))
-    pose_2[2] = 0.4 + OFFSETT
+@tracing.traced()
+def calibrate(temporal_position, rtde_c, rtde_r, rtde_io, OFFSETT, setup, max_age=None, tolerance=CALIBRATION_TOLERANCE):
+    """
+    Returns the grid frame, reusing the cached calibration when two probes (one per edge) confirm it.
 
-    rtde_c.moveL(pose_2, 3, 1)
-    final_pose = rtde_r.getActualTCPPose()
+    The full four-probe center() only runs when there is no cache, the cache is older
+    than max_age seconds, or the verification contact drifted more than tolerance.
+    Each bath (setup) has its own cache file.
 
+    Returns:
+    --------
+    final_pose, rotation_angle : as returned by center() (without the residual).
+    """
+    cached = load_calibration(setup, max_age=max_age)
+    if cached is not None:
+        # Cached contacts give the probes an expected surface for the fast approach
+        for name, pose in cached.get("contacts", {}).items():
+            expected_contacts.setdefault((setup, name), pose)
+    if cached is not None and verify_calibration(cached, rtde_c, rtde_r, rtde_io, setup, tolerance):
+        print(f"Using calibration from {cached['date']}")
+        last_calibration[setup] = dict(final_pose=cached["final_pose"], angle=cached["angle"], probe=cached["probe"],
+                                       probe_x=cached["probe_x"], contacts=cached.get("contacts", {}))
+        rtde_c.moveL(cached["final_pose"], 3, 1)
+        return rtde_r.getActualTCPPose(), cached["angle"]
+
+    print("Calibration drift detected or no cached calibration, probing the grid...")
+    # The bath may have moved: none of its remembered contacts (edges or lid) is trusted for a fast approach
+    clear_contacts(setup)
+    final_pose, rotation_angle, residual = center(temporal_position, rtde_c, rtde_r, rtde_io, OFFSETT, setup)
+    save_calibration(setup)
     return final_pose, rotation_angle
 
 # ---------------------------------------------------------------------------------------------------------------------
 #  3. USE SPONGE
 
+# Blends only round the transit corners: reversals and the strokes on the sponge stop exactly (blend=0),
+# otherwise the arm would cut them short and barely touch the sponge or shake the sample
+SPONGE_BLEND = 0.005  # Blend radius (m) at the transit corners between the sponge strokes
+SHAKE_BLEND = 0.0005  # Blend radius (m) where the shake turns from X to Y
+
+@tracing.traced()
 def use_sponge(rtde_c, rtde_r, rtde_io):
-    PI = rtde_r.getActualTCPPose()
     sequence = [-3,-2,-1,0,1,2,3]
     # Random X coordinate along the sponge
     RAND = choice(sequence)
 
     P0 = rtde_r.getActualTCPPose() 
     P0[0] += RAND * .01
-    # Down
-    P0[2] -= .05
-    rtde_c.moveL(P0,2)
-    # Up
-    P0[2] += .05
-    rtde_c.moveL(P0,2)
-    # Over
-    P0[1] -= .023
-    rtde_c.moveL(P0,3,1)
-    # Down & dab
-    P0[2] -= .04
-    rtde_c.moveL(P0,2,1)
-    P0[2] -= .08
-    rtde_c.moveL(P0,2,1)
-    P0[1] += .01
-    rtde_c.moveL(P0,2,1)
-    P0[2] += .12
-    rtde_c.moveL(P0,2,1)
-    P0[1] -= .01
-    rtde_c.moveL(P0,2,1)
+    (robot.Path(P0, 2, 1, SPONGE_BLEND)
+        .offset(dz=-.05, acceleration=1.2, blend=0)  # Down
+        .offset(dz=.05, acceleration=1.2)            # Up
+        .offset(dy=-.023, speed=3)                   # Over
+        .offset(dz=-.04)                             # Down & dab
+        .offset(dz=-.08, blend=0)
+        .offset(dy=.01, blend=0)
+        .offset(dz=.12)
+        .offset(dy=-.01)
+        .run(rtde_c))
 
     # Turn
     J0 = rtde_r.getActualQ()
@@ -338,17 +597,13 @@ def use_sponge(rtde_c, rtde_r, rtde_io):
     rtde_c.moveJ(J0,3,3)
 
     P0 = rtde_r.getActualTCPPose()
-    # Down & dab
-    P0[2] -= .04
-    rtde_c.moveL(P0,2,1)
-    P0[2] -= .08
-    rtde_c.moveL(P0,2,1)
-    P0[1] += .01
-    rtde_c.moveL(P0,2,1)
-    P0[2] += .20
-    rtde_c.moveL(P0,2,1)
-    P0[1] -= .01
-    rtde_c.moveL(P0,2,1)
+    (robot.Path(P0, 2, 1, SPONGE_BLEND)
+        .offset(dz=-.04)                    # Down & dab
+        .offset(dz=-.08, blend=0)
+        .offset(dy=.01, blend=0)
+        .offset(dz=.20)
+        .offset(dy=-.01)
+        .run(rtde_c))
     # Turn back
     J0[-1] -= np.pi
     rtde_c.moveJ(J0,3,3)
@@ -356,7 +611,16 @@ def use_sponge(rtde_c, rtde_r, rtde_io):
 # ---------------------------------------------------------------------------------------------------------------------
 # 4. USE OF SCALE & DATA COLLECTION
 
-def use_scale(n, cycle_number, SAMPLE, rtde_c, rtde_r, rtde_io, balance, remote, photo_directory):
+@tracing.traced(category="device")
+def tare_and_settle(balance, remote):
+    """
+    Tares the balance and waits for a stable zero.
+    """
+    environment.tare_balance(balance, remote)
+    return environment.wait_for_zero(balance, remote, environment.DEVICE_HOST)
+
+@tracing.traced()
+def use_scale(n, cycle_number, SAMPLE, rtde_c, rtde_r, rtde_io, balance, remote, photo_directory, writer=None, overlap=None):
     """
     Performs three measurements of a sample using a robotic arm and scale, calculates the average, and stores the results.
     
@@ -370,42 +634,53 @@ def use_scale(n, cycle_number, SAMPLE, rtde_c, rtde_r, rtde_io, balance, remote,
     balance (object): Serial connection to the balance.
     remote (bool): If True, performs remote measurement through a Raspberry Pi.
     photo_directory (str): Directory to save photos of each measurement step.
+    writer (ImageWriter, optional): Saves the photos in the background. If None they are written immediately.
+    overlap (robot.Overlap, optional): If given, the balance is tared while the arm descends.
+
+    Returns:
+    list: Paths of the photos taken on the scale.
     """
+    photos = []
     measurement_count = 1
     average_weight = 0
     initial_position = rtde_r.getActualTCPPose()  # Get current robot TCP position
+    overlap = overlap or robot.Overlap(rtde_c)
 
     # Perform three measurements per sample
     while measurement_count <= 3:
-        # Tare the balance to reset measurement to zero
-        environment.tare_balance(balance, remote)
-        time.sleep(3.5)
-        
-        # Lower the gripper to insert the sample
+        # Tare the balance to reset measurement to zero while the gripper is lowered to insert the sample
+        zeroed = overlap.background(tare_and_settle, balance, remote)
         initial_position[2] -= 0.072
-        rtde_c.moveL(initial_position, 0.1)
+        overlap.motion(rtde_c.moveL, initial_position, 0.1)
+        overlap.sync()
+        zeroed.result()  # Sync point: the pan reads zero before the sample is released
         gripper.open_grip(40, rtde_c, rtde_r, rtde_io)
         
-        # Rotate gripper to dislodge sample if it sticks
-        joint_positions = rtde_r.getActualQ()
-        joint_positions[-1] -= np.pi / 6
-        rtde_c.moveJ(joint_positions, 3, 3)
-        joint_positions[-1] += np.pi / 6
-        rtde_c.moveJ(joint_positions, 3, 3)
-        
-        time.sleep(3.5)
+        # Rotate gripper to dislodge sample if it sticks (one command; a pure wrist turn cannot be blended)
+        (robot.Path(rtde_r.getActualQ(), 3, 3, joint=True)
+            .rotate(-1, -np.pi / 6)
+            .rotate(-1, np.pi / 6)
+            .run(rtde_c))
         
-        # Measure the weight and add it to the total
-        measured_weight = float(environment.measure_weight(balance=balance, remote=remote, raspberry_pi_ip="192.168.8.151"))
+        # Measure the weight as soon as the reading is stable and add it to the total
+        measured_weight, stable = environment.read_stable_weight(balance, remote, environment.DEVICE_HOST)
+        if measured_weight is None:
+            raise TimeoutError(f"No valid balance reading for sample {n}")
+        if not stable:
+            # Kept so the sample still has three measurements, but flagged for the results
+            print(f"Sample {n}: measurement {measurement_count} taken without a stable reading ({measured_weight} g)")
+            SAMPLE[n].unstable.append(measurement_count)
+        settled = time.monotonic()
         average_weight += measured_weight
         SAMPLE[n].data.append(measured_weight)
         
         # Capture photo of the measurement process
-        photo = environment.take_photo(1)
-        cv2.imwrite(photo_directory + 
-                    "/Sample_" + str(n) + 
-                    "_cycle_" + str(cycle_number) + 
-                    "_" + str(measurement_count) + "_scale.png", photo)
+        photo = environment.take_photo(1, newer_than=settled)
+        photo_file = (photo_directory + 
+                      "/Sample_" + str(n) + 
+                      "_cycle_" + str(cycle_number) + 
+                      "_" + str(measurement_count) + "_scale.png")
+        photos.append(save_photo(photo_file, photo, writer))
         
         # Lower further for precise centering
         initial_position[2] -= 0.0085
@@ -436,44 +711,57 @@ def use_scale(n, cycle_number, SAMPLE, rtde_c, rtde_r, rtde_io, balance, remote,
     # Raise the robot arm to the safe height
     initial_position[2] += 0.1
     rtde_c.moveL(initial_position, 3, 1)
+    return photos
 
 # ---------------------------------------------------------------------------------------------------------------------
 # 5. MOVE TO PHOTO STAND
 
-def photo_stand(n, cycle_number, rtde_c, rtde_r, rtde_io, photo_directory):
+def save_photo(photo_file, photo, writer=None):
+    """
+    Saves a photo through the background writer if one is given, otherwise immediately.
+    Returns the path of the saved file.
+    """
+    if writer is not None:
+        return writer.save(photo_file, photo)
+    cv2.imwrite(photo_file, photo)
+    return photo_file
+
+@tracing.traced()
+def photo_stand(n, cycle_number, rtde_c, rtde_r, rtde_io, photo_directory, writer=None):
     photo_position = rtde_r.getActualTCPPose()
     photo_position[0] += 0.1
     photo_position[1] += 0.07
     photo_position[2] -= 0.07
     rtde_c.moveL(photo_position,3,1)
 
-    photo = environment.take_photo(2)
-    cv2.imwrite(photo_directory + "/Sample_" + str(n) + "_cycle_" + str(cycle_number) +"_front.png", photo)
+    photo = environment.take_photo(2, newer_than=time.monotonic())
+    front_file = photo_directory + "/Sample_" + str(n) + "_cycle_" + str(cycle_number) +"_front.png"
+    front_file = save_photo(front_file, photo, writer)
 
     joints = rtde_r.getActualQ()
     joints[-1] += np.pi/2
     rtde_c.moveJ(joints,3,3)
 
-    photo = environment.take_photo(2)
-    cv2.imwrite(photo_directory + "/Sample_" + str(n) + "_cycle_" + str(cycle_number) +"_side.png", photo)
+    photo = environment.take_photo(2, newer_than=time.monotonic())
+    side_file = photo_directory + "/Sample_" + str(n) + "_cycle_" + str(cycle_number) +"_side.png"
+    side_file = save_photo(side_file, photo, writer)
+
+    return [front_file, side_file]
                     
 # ---------------------------------------------------------------------------------------------------------------------
 # 6. SHAKE FOR IMPROVED COMPLIANCE
 
+@tracing.traced()
 def shake(rtde_c, rtde_r, rtde_io):
     P0 = rtde_r.getActualTCPPose()
-    P0[0] += .002
-    rtde_c.moveL(P0,2,.75)
-    P0[0] -= .004
-    rtde_c.moveL(P0,2,.75)
-    P0[0] += .002
-    rtde_c.moveL(P0,2,.75)
-    P0[1] += .004
-    rtde_c.moveL(P0,2,.75)
-    P0[1] -= .008
-    rtde_c.moveL(P0,2,.75)
-    P0[1] += .004
-    rtde_c.moveL(P0,2,.75)
+    (robot.Path(P0, 2, .75, 0)
+        .offset(dx=.002)
+        .offset(dx=-.004)
+        .offset(dx=.002, blend=SHAKE_BLEND)
+        .offset(dy=.004)
+        .offset(dy=-.008)
+        .offset(dy=.004)
+        .run(rtde_c))
 
 # ---------------------------------------------------------------------------------------------------------------------
 # 7. CALCULATE DATA AND ADD TO CSV FOR RESULTS
@@ -523,12 +811,17 @@ def add_csv_stats(filename, POPNUM):
 # CYCLE OPTIONS
 
 # 1. INSERT SAMPLE IN EXTERNAL TRAY
-def replace_sample_out(rtde_c, rtde_r, rtde_io, PD, initial_position):
+@tracing.traced()
+def replace_sample_out(rtde_c, rtde_r, rtde_io, PD, initial_position, planner=None):
     """ 
     Insert sample in external tray.
+    The transit to the tray is a joint move if a robot.TransitPlanner is given.
     """
     # Return sample to its original position
-    rtde_c.moveL(PD, 3, 1)
+    if planner is not None:
+        planner.transit(PD)
+    else:
+        rtde_c.moveL(PD, 3, 1)
     
     if setup == 1:
         # Move down to insert sample back into its position
@@ -586,12 +879,17 @@ def replace_sample_out(rtde_c, rtde_r, rtde_io, PD, initial_position):
         rtde_c.moveL(initial_position, 3, 1)
 
 # 2. INSERT SAMPLE BACK INTO THE TRAY
-def replace_sample_in(rtde_c, rtde_r, rtde_io, P0):
+@tracing.traced()
+def replace_sample_in(rtde_c, rtde_r, rtde_io, P0, planner=None):
     """ 
     Insert sample back into the tray.
+    The transit to the tray is a joint move if a robot.TransitPlanner is given.
     """
     # Return sample to its original position
-    rtde_c.moveL(P0, 3, 1)
+    if planner is not None:
+        planner.transit(P0)
+    else:
+        rtde_c.moveL(P0, 3, 1)
     
     # Move down to insert sample back into its position
     P0[2] -= 0.188
@@ -611,3 +909,45 @@ def replace_sample_in(rtde_c, rtde_r, rtde_io, P0):
     # Move up after insertion
     P0[2] += 0.04  
     rtde_c.moveL(P0, 3, 1)
+
+# 3. SAFE STOP AFTER A GRIPPER FAILURE
+@tracing.traced()
+def release_sample(slot_position, rtde_c, rtde_r, rtde_io, planner=None, timeout=2 * gripper.TIMEOUT):
+    """
+    Puts the held sample back into its slot after a gripper.GripperTimeout,
+    so the robot is not left holding it.
+
+    Parameters:
+    - slot_position (list): Pick pose over the sample slot (targets.pick_pose(n)).
+    - planner (robot.TransitPlanner, optional): Used for the transit back to the slot.
+    - timeout (float, optional): Seconds given to the gripper to open.
+
+    Returns:
+    - bool: True if the gripper opened, False if it is still not responding.
+    """
+    # Stop whatever move is running and lift the sample clear of the baths and the stand
+    rtde_c.stopL()
+    P = rtde_r.getActualTCPPose()
+    P[2] = max(P[2], slot_position[2])
+    rtde_c.moveL(P, 0.05)
+
+    # Return over the slot and lower the sample into it slowly
+    slot = list(slot_position)
+    if planner is not None:
+        planner.transit(slot)
+    else:
+        rtde_c.moveL(slot, 0.3, 1)
+    slot[2] -= 0.04
+    rtde_c.moveL(slot, 0.05)
+
+    try:
+        gripper.open_grip(15, rtde_c, rtde_r, rtde_io, timeout=timeout)
+        released = True
+    except gripper.GripperTimeout as error:
+        print(f"Gripper still not responding: {error}")
+        released = False
+
+    # Move up again, out of the tray
+    slot[2] += 0.04
+    rtde_c.moveL(slot, 0.3, 1)
+    return released
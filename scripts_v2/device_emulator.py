@@ -0,0 +1,326 @@
+# ------------------------------------------------------- #
+# LOCAL STAND-IN FOR THE RASPBERRY PI SCALE, ARDUINO AND  #
+# CAMERAS OF THE UR ROBOT DEGRADATION SETUP               #
+# ------------------------------------------------------- #
+
+import argparse
+import math
+import random
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+# Defaults of the emulated devices; every key can be overridden per emulator or from the command line
+SETTINGS = {
+    # Scale
+    "scale_latency": 0.05,        # Seconds before each scale reply
+    "scale_noise": 0.0005,        # Standard deviation (g) of the readings
+    "settle_time": 1.5,           # Time constant x 5 (s) for a new load to settle
+    "stable_band": 0.002,         # The scale flags readings 'S' once within this band (g) of the load
+    "sample_weight": 4.3,         # Mean sample weight (g)
+    "sample_spread": 0.2,         # Spread of the weight between samples (g)
+    "loads_per_sample": 3,        # Consecutive loads with the same weight (measurements per sample)
+    "load_delay": 0.5,            # Seconds between a stable zero and the sample landing on the pan
+    # Arduino
+    "arduino_latency": 0.05,      # Seconds before each Arduino reply (the firmware loop adds up to 1 s)
+    "temperatures": [40.0, 40.0], # Set point of each bath sensor (C)
+    "temperature_noise": 0.05,    # Standard deviation (C) of the readings
+    # Cameras
+    "camera_fps": 10.0,
+    "frame_size": [640, 480],
+    # Failure injection
+    "jitter": 0.0,                # Uniform extra latency (s) added to every reply
+    "failure_rate": 0.0,          # Probability of an incomplete reply
+    "drop_rate": 0.0,             # Probability of closing the connection instead of replying
+    "camera_stall_rate": 0.0,     # Probability per frame of a stream stall
+    "camera_stall": 2.0,          # Length (s) of a stall
+    "seed": None,
+}
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 1. DEVICE MODELS
+
+class EmulatedScale:
+    """
+    Balance with first-order settling.
+
+    After a tare the reading settles to zero. Once a stable zero has been read,
+    the next sample lands on the pan load_delay seconds later (readings are
+    unstable meanwhile) and the reading settles to its weight. Readings carry
+    the flag 'S' (stable) or 'U'.
+    """
+
+    def __init__(self, settings, rng):
+        self.settings = settings
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.offset = 0.0        # Tare offset (g)
+        self.load = 0.0          # Weight on the pan (g)
+        self.reading = 0.0       # Reading before the last change
+        self.changed = time.monotonic()
+        self.loads = 0
+        self.weight = self._new_weight()
+        self.pending_load = None  # Monotonic time at which the next sample lands
+
+    def _new_weight(self):
+        return self.settings["sample_weight"] + self.rng.uniform(-1, 1) * self.settings["sample_spread"]
+
+    def _value(self, now):
+        # Exponential approach to load - offset, 99 % after settle_time
+        tau = max(self.settings["settle_time"], 1e-6) / 5
+        target = self.load - self.offset
+        return target + (self.reading - target) * math.exp(-(now - self.changed) / tau)
+
+    def _change(self, now, load=None, offset=None):
+        self.reading = self._value(now)
+        self.changed = now
+        if load is not None:
+            self.load = load
+        if offset is not None:
+            self.offset = offset
+
+    def tare(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.load > 0:
+                # The sample was lifted off since the last tare
+                self._change(now, load=0.0)
+            self._change(now, offset=self.load)
+            self.pending_load = None
+
+    def measure(self):
+        with self.lock:
+            now = time.monotonic()
+            if self.pending_load is not None and now >= self.pending_load:
+                self.pending_load = None
+                self.loads += 1
+                if (self.loads - 1) % self.settings["loads_per_sample"] == 0:
+                    self.weight = self._new_weight()
+                self._change(now, load=self.offset + self.weight)
+            value = self._value(now)
+            target = self.load - self.offset
+            if self.pending_load is not None:
+                stable = False  # The sample is on its way to the pan
+            else:
+                stable = abs(value - target) <= self.settings["stable_band"]
+                if stable and self.load == self.offset:
+                    self.pending_load = now + self.settings["load_delay"]  # Stable zero: the robot releases the sample
+            value += self.rng.gauss(0, self.settings["scale_noise"])
+            return f"{value:.4f} {'S' if stable else 'U'}"
+
+class EmulatedArduino:
+    """Temperature sensors and air valve of the Arduino bridge."""
+
+    def __init__(self, settings, rng):
+        self.settings = settings
+        self.rng = rng
+        self.valve_open = False
+        self.started = time.monotonic()
+
+    def temperature(self, sensor):
+        set_point = self.settings["temperatures"][sensor - 1]
+        drift = 0.2 * math.sin((time.monotonic() - self.started) / 600)  # Slow oscillation of the bath heater
+        value = set_point + drift + self.rng.gauss(0, self.settings["temperature_noise"])
+        return f"Temperature at sensor {sensor}: {value:.2f} ºC"
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 2. LINE PROTOCOL SERVER (port 65432)
+
+ONE_SHOT_IDLE = 0.05  # Seconds of silence after which an unterminated command is taken as complete
+
+class _DeviceHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        emulator = self.server.emulator
+        self.request.settimeout(ONE_SHOT_IDLE)
+        buffer = b""
+        while not emulator.stopped.is_set():
+            try:
+                data = self.request.recv(4096)
+            except socket.timeout:
+                if not buffer:
+                    continue
+                # One-shot client (persistent=False): the command has no line terminator
+                data = b"\n"
+            if not data:
+                # Closed by the client; a send-only command may still be waiting in the buffer
+                if buffer.strip():
+                    self._reply(emulator, buffer)
+                return
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if not self._reply(emulator, line):
+                    return
+
+    def _reply(self, emulator, line):
+        """Runs one command and writes its reply. Returns False once the connection is gone."""
+        command = line.strip().upper()
+        if not command:
+            return True
+        reply, latency = emulator.execute(command)
+        time.sleep(latency + emulator.rng.uniform(0, emulator.settings["jitter"]))
+        if emulator.rng.random() < emulator.settings["drop_rate"]:
+            return False  # Connection dropped without a reply
+        if emulator.rng.random() < emulator.settings["failure_rate"]:
+            reply = reply[:len(reply) // 2]  # Incomplete reply
+        try:
+            self.wfile.write(reply.encode() + b"\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return False  # Send-only client (TARE, CALIBRATE) already closed the connection
+        return True
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 3. MJPEG CAMERAS (ports 8081, 8082)
+
+class _CameraHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        emulator, number = self.server.emulator, self.server.camera_number
+        self.send_response(200)
+        self.send_header("Content-Type", "multipart/x-mixed-replace; boundary=frame")
+        self.end_headers()
+        period = 1.0 / emulator.settings["camera_fps"]
+        try:
+            while not emulator.stopped.is_set():
+                if emulator.rng.random() < emulator.settings["camera_stall_rate"]:
+                    time.sleep(emulator.settings["camera_stall"])
+                jpeg = emulator.frame(number)
+                self.wfile.write(b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: "
+                                 + str(len(jpeg)).encode() + b"\r\n\r\n" + jpeg + b"\r\n")
+                time.sleep(period)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 4. EMULATOR
+
+class DeviceEmulator:
+    """
+    Serves the scale/Arduino line protocol and the MJPEG camera streams on loopback.
+
+    Args:
+    - host: Address to listen on.
+    - port: Port of the scale and Arduino commands (environment.DEVICE_PORT).
+    - camera_port_base: Camera n streams on camera_port_base + n (environment.CAMERA_PORT_BASE).
+    - cameras: Camera numbers to serve.
+    - settings: Overrides of SETTINGS.
+    """
+
+    def __init__(self, host="127.0.0.1", port=65432, camera_port_base=8080, cameras=(1, 2), **settings):
+        unknown = set(settings) - set(SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown emulator settings: {sorted(unknown)}")
+        self.settings = dict(SETTINGS, **settings)
+        self.rng = random.Random(self.settings["seed"])
+        self.scale = EmulatedScale(self.settings, self.rng)
+        self.arduino = EmulatedArduino(self.settings, self.rng)
+        self.stopped = threading.Event()
+        self.commands = {}  # Command -> number of requests, for inspection
+        self.host = host
+
+        self._server = _ThreadingTCPServer((host, port), _DeviceHandler)
+        self._server.emulator = self
+        self.port = self._server.server_address[1]
+        self._cameras = {}
+        for number in cameras:
+            server = ThreadingHTTPServer((host, camera_port_base + number if camera_port_base else 0), _CameraHandler)
+            server.daemon_threads = True
+            server.emulator, server.camera_number = self, number
+            self._cameras[number] = server
+        self._threads = []
+
+    def camera_ports(self):
+        """Returns {camera number: port}."""
+        return {number: server.server_address[1] for number, server in self._cameras.items()}
+
+    def execute(self, command):
+        """
+        Runs one command of the line protocol.
+
+        Returns:
+        - tuple: (reply text, latency in seconds).
+        """
+        command = command.decode(errors="replace") if isinstance(command, bytes) else command
+        self.commands[command] = self.commands.get(command, 0) + 1
+        scale_latency, arduino_latency = self.settings["scale_latency"], self.settings["arduino_latency"]
+        if command == "MEASURE":
+            return self.scale.measure(), scale_latency
+        if command == "TARE":
+            self.scale.tare()
+            return "OK", scale_latency
+        if command == "CALIBRATE":
+            return "OK", scale_latency
+        # Same matching order as the firmware: TEMPB before TEMP
+        if "TEMPB" in command:
+            return self.arduino.temperature(2), arduino_latency
+        if "TEMP" in command:
+            return self.arduino.temperature(1), arduino_latency
+        if "OPEN" in command and "VALVE" in command:
+            self.arduino.valve_open = True
+            return "OK", arduino_latency
+        if "CLOSE" in command and "VALVE" in command:
+            self.arduino.valve_open = False
+            return "OK", arduino_latency
+        return f"ERROR unknown command {command}", arduino_latency
+
+    def frame(self, number):
+        """Returns a JPEG test frame of a camera."""
+        width, height = self.settings["frame_size"]
+        image = np.full((height, width, 3), 60 + 40 * number, dtype=np.uint8)
+        cv2.putText(image, f"camera {number}  {time.strftime('%H:%M:%S')}.{int(time.time() * 10) % 10}",
+                    (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        return cv2.imencode(".jpg", image)[1].tobytes()
+
+    def start(self):
+        servers = [self._server] + list(self._cameras.values())
+        self._threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        for server in [self._server] + list(self._cameras.values()):
+            if self._threads:
+                server.shutdown()  # Waits for serve_forever(), so only once start() ran
+            server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulates the scale, Arduino and cameras of the setup on this computer.")
+    parser.add_argument('--host', default="127.0.0.1", help='Address to listen on')
+    parser.add_argument('--port', type=int, default=65432, help='Port of the scale/Arduino commands')
+    parser.add_argument('--camera-port-base', type=int, default=8080, help='Camera n streams on this port + n')
+    for key, value in SETTINGS.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            parser.add_argument('--' + key.replace('_', '-'), type=type(value), default=value)
+    parser.add_argument('--seed', type=int, default=None)
+    args = vars(parser.parse_args())
+    host, port, camera_port_base = args.pop("host"), args.pop("port"), args.pop("camera_port_base")
+
+    emulator = DeviceEmulator(host, port, camera_port_base, **args).start()
+    print(f"Devices on {host}:{emulator.port}, cameras on {emulator.camera_ports()}. Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        emulator.stop()
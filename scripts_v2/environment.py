@@ -7,9 +7,186 @@ import os
 import serial
 import serial.tools.list_ports
 import socket
+import threading
+import time
 import numpy as np
 import copy
 
+import tracing
+
+# --------------------------------------------------------------------------------------------------
+# >>> DEVICE CONNECTIONS
+
+DEVICE_HOST = "192.168.8.151"  # Raspberry Pi serving the scale and the Arduino bridge
+DEVICE_PORT = 65432
+
+class DeviceClient:
+    """
+    Client of a device service (scale or Arduino bridge).
+
+    By default every request opens a connection of its own and sends the bare
+    command, as the original code did and as the service on the Raspberry Pi
+    expects.
+
+    With persistent=True the connection is kept open between requests instead:
+    every request is sent as one line (e.g. b'MEASURE\\n') and answered with one
+    line. If the service closes the connection after a reply, the reply ends at
+    EOF and the next request reconnects. A failed request is retried once on a
+    new connection. Only use it with services that answer line by line, such as
+    device_emulator.py. Commands that get no reply (send()) always go out on a
+    short connection of their own.
+
+    Args:
+    - host, port: Address of the service.
+    - timeout: Seconds to wait for the connection and for each reply.
+    - persistent: Keep the connection open between requests.
+    """
+
+    def __init__(self, host, port, timeout=5.0, persistent=False):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.persistent = persistent
+        self._lock = threading.Lock()
+        self._socket = None
+        self._buffer = b''
+        self._eof = False
+
+    def request(self, command, reply=True):
+        """
+        Sends one command and returns its reply (bytes, without the line terminator).
+
+        Args:
+        - command: Command as bytes, e.g. b'MEASURE'.
+        - reply: If False the command is only sent (see send()) and None is returned.
+        """
+        if not reply:
+            self.send(command)
+            return None
+        return self.pipeline([command])[0]
+
+    def send(self, command):
+        """
+        Sends a command that gets no reply (TARE, CALIBRATE) on a connection of its own,
+        closed right after, as the original code did. Nothing is read, so a service that
+        does not answer these commands never blocks the caller, and a service that does
+        answer cannot put the keep-alive connection out of step.
+        """
+        with tracing.span("send", "device", commands=[command]):
+            payload = command.rstrip(b'\n') + b'\n' if self.persistent else command
+            with socket.create_connection((self.host, self.port), timeout=self.timeout) as client_socket:
+                client_socket.sendall(payload)
+
+    def pipeline(self, commands):
+        """
+        Sends several commands and returns their replies in order.
+        """
+        with self._lock, tracing.span("request", "device", commands=commands):
+            if not self.persistent:
+                return [self._one_shot(command) for command in commands]
+            try:
+                return self._exchange(commands)
+            except (OSError, EOFError):
+                # Stale keep-alive connection (service restarted, Wi-Fi drop): retry once
+                self._close()
+                try:
+                    return self._exchange(commands)
+                except (OSError, EOFError):
+                    self._close()  # A late reply must not be read as the reply of the next request
+                    raise
+
+    def close(self):
+        """Closes the connection."""
+        with self._lock:
+            self._close()
+
+    def _exchange(self, commands):
+        if self._socket is None:
+            self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._buffer = b''
+        self._socket.sendall(b''.join(command.rstrip(b'\n') + b'\n' for command in commands))
+        replies = [self._readline() for _ in commands]
+        if self._socket is not None and not self._buffer and self._eof:
+            self._close()
+        return replies
+
+    def _readline(self):
+        self._eof = False
+        while b'\n' not in self._buffer:
+            data = self._socket.recv(4096)
+            if not data:
+                # One-shot service: the reply ends where the connection does
+                if not self._buffer:
+                    raise EOFError(f"{self.host}:{self.port} closed the connection")
+                self._eof = True
+                line, self._buffer = self._buffer, b''
+                return line.rstrip(b'\r')
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b'\n', 1)
+        return line.rstrip(b'\r')
+
+    def _one_shot(self, command):
+        with socket.create_connection((self.host, self.port), timeout=self.timeout) as client_socket:
+            client_socket.sendall(command)
+            return client_socket.recv(1024)
+
+    def _close(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._buffer = b''
+
+_devices = {}
+_devices_lock = threading.Lock()
+_persistent = False  # One connection per command unless configure_devices(persistent=True)
+
+def get_device(host=None, port=None):
+    """
+    Returns the shared client for a device service, creating it on first use.
+    """
+    host = host or DEVICE_HOST
+    port = port or DEVICE_PORT
+    with _devices_lock:
+        key = (host, port)
+        if key not in _devices:
+            _devices[key] = DeviceClient(host, port, persistent=_persistent)
+        return _devices[key]
+
+def configure_devices(host=None, port=None, persistent=None, camera_port_base=None):
+    """
+    Changes the device addresses or connection mode, e.g. to use device_emulator.py on
+    127.0.0.1. Open connections and camera streams are dropped if anything changed.
+
+    Args:
+    - host, port: New default address of the device service (scale and Arduino bridge).
+    - persistent: True to keep one connection per service open (line protocol, see DeviceClient).
+    - camera_port_base: Camera n streams on camera_port_base + n (cameras use the same host).
+    """
+    global DEVICE_HOST, DEVICE_PORT, _persistent, CAMERA_PORT_BASE
+    previous = (DEVICE_HOST, DEVICE_PORT, _persistent, CAMERA_PORT_BASE)
+    if host is not None:
+        DEVICE_HOST = host
+    if port is not None:
+        DEVICE_PORT = port
+    if persistent is not None:
+        _persistent = persistent
+    if camera_port_base is not None:
+        CAMERA_PORT_BASE = camera_port_base
+    if (DEVICE_HOST, DEVICE_PORT, _persistent, CAMERA_PORT_BASE) != previous:
+        close_devices()
+        stop_cameras()
+
+def close_devices():
+    """Closes every shared device connection."""
+    with _devices_lock:
+        devices = list(_devices.values())
+        _devices.clear()
+    for device in devices:
+        device.close()
+
 # --------------------------------------------------------------------------------------------------
 # >>> SAMPLE GRID FUNCTIONS
 
@@ -20,6 +197,7 @@ class Sample:
         self.data = data
         self.outdex = outdex
         self.status = status
+        self.unstable = []  # Measurements (1-3) of the cycle taken without a stable balance reading
 
 
 def generate_sample_grid(columns, rows):
@@ -38,19 +216,90 @@ def generate_sample_grid(columns, rows):
             y = 1
     return samples
 
+GRID_PITCH = 0.02              # Distance between neighbouring sample slots (m)
+SECOND_TRAY_FIRST_ID = 122     # Samples from this id on sit in the second tray
+SECOND_TRAY_X_OFFSET = 0.003   # Extra X offset of the second tray (m)
+
+class GridTargets:
+    """
+    Pick and deposit poses of every sample of the grid, computed once per cycle.
+
+    Attributes:
+    - ids: Sample ids (N,).
+    - pick: Pick poses in the robot base frame (N, 6).
+    - deposit: Deposit poses in the external tray (N, 6).
+    """
+
+    def __init__(self, ids, pick, deposit):
+        self.ids = np.asarray(ids)
+        self.pick = np.asarray(pick, dtype=float)
+        self.deposit = np.asarray(deposit, dtype=float)
+        self._rows = {int(n): row for row, n in enumerate(self.ids)}
+
+    @classmethod
+    def compute(cls, samples, reference_pose, intersection, angle_deviation, deposit_origin, pitch=GRID_PITCH):
+        """
+        Computes all poses at once from the calibration result.
+
+        Args:
+        - samples: Grid from generate_sample_grid().
+        - reference_pose: TCP pose above the grid corner; its Z and orientation are kept.
+        - intersection: Grid corner found by degradation.center().
+        - angle_deviation: Grid rotation found by degradation.center().
+        - deposit_origin: Pose of the first slot of the external tray (lid_deposition).
+        - pitch: Slot spacing in metres.
+        """
+        ids = np.array(sorted(samples))
+        index = np.array([samples[n].index for n in ids], dtype=float)
+        local = pitch * (index - 1)  # Slot offsets in the grid frame (N, 2)
+
+        cos, sin = np.cos(angle_deviation), np.sin(angle_deviation)
+        pick = np.tile(np.asarray(reference_pose[:6], dtype=float), (len(ids), 1))
+        pick[:, 0] = intersection[0] + local[:, 0] * cos - local[:, 1] * sin  # Rot transformation X
+        pick[:, 0] += np.where(ids >= SECOND_TRAY_FIRST_ID, SECOND_TRAY_X_OFFSET, 0.0)
+        pick[:, 1] = intersection[1] + local[:, 1] * cos + local[:, 0] * sin  # Rot transformation Y
+
+        deposit = np.tile(np.asarray(deposit_origin[:6], dtype=float), (len(ids), 1))
+        deposit[:, :2] += local
+
+        return cls(ids, pick, deposit)
+
+    def pick_pose(self, n):
+        """Returns the pick pose of sample n as a list."""
+        return self.pick[self._rows[int(n)]].tolist()
+
+    def deposit_pose(self, n):
+        """Returns the deposit pose of sample n as a list."""
+        return self.deposit[self._rows[int(n)]].tolist()
+
+    def save(self, filename):
+        """
+        Saves the table as filename.npz (for reuse) and filename.csv (for inspection).
+        """
+        np.savez(filename + '.npz', ids=self.ids, pick=self.pick, deposit=self.deposit)
+        axes = ['x', 'y', 'z', 'rx', 'ry', 'rz']
+        header = ','.join(['sample'] + [f'pick_{a}' for a in axes] + [f'deposit_{a}' for a in axes])
+        np.savetxt(filename + '.csv', np.column_stack([self.ids, self.pick, self.deposit]),
+                   delimiter=',', header=header, comments='', fmt=['%d'] + ['%.6f'] * 12)
+
+    @classmethod
+    def load(cls, filename):
+        """Loads a table saved with save()."""
+        data = np.load(filename + '.npz')
+        return cls(data['ids'], data['pick'], data['deposit'])
+
 # --------------------------------------------------------------------------------------------------
 # >>> BALANCE FUNCTIONS
 
+SERIAL_TIMEOUT = 2.0  # Seconds a read from the local balance may block (readline returns what arrived)
+
 # 1. CALIBRATE BALANCE
+@tracing.traced(category="device")
 def calibrate_balance(balance, remote = True):
     # REMOTE
     if remote == True:
         # REMOTE
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.connect((balance, 65432))
-            # Send a request for the reading
-            client_socket.sendall(b'CALIBRATE')
-            client_socket.close()
+            get_device(balance).request(b'CALIBRATE', reply=False)
             return None
     # LOCAL
     else:
@@ -59,18 +308,15 @@ def calibrate_balance(balance, remote = True):
             balance.write(b'C\r\n')
         except:
             balance = serial.Serial(port=balance_port, baudrate=9600, bytesize=serial.SEVENBITS,
-                           parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE)
+                           parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE, timeout=SERIAL_TIMEOUT)
             balance.write(b'C\r\n')
 
 # 2. TARE BALANCE
+@tracing.traced(category="device")
 def tare_balance(balance, remote = True):
     # REMOTE
     if remote == True:
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((balance, 65432))
-        # Send a request for the reading
-        client_socket.sendall(b'TARE')
-        client_socket.close()
+        get_device(balance).request(b'TARE', reply=False)
         return None
     # LOCAL
     else:
@@ -79,10 +325,11 @@ def tare_balance(balance, remote = True):
             balance.write(b'T\r\n')
         except:
             balance = serial.Serial(port=balance_port, baudrate=9600, bytesize=serial.SEVENBITS,
-                           parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE)
+                           parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE, timeout=SERIAL_TIMEOUT)
             balance.write(b'T\r\n')
 
 # 3. RECORD BALANCE DATA
+@tracing.traced(category="device")
 def measure_weight(balance, remote=True, balance_port=None, raspberry_pi_ip=None):
     """
     Measures the weight using a scale, either locally or remotely.
@@ -99,11 +346,7 @@ def measure_weight(balance, remote=True, balance_port=None, raspberry_pi_ip=None
         if raspberry_pi_ip is None:
             raise ValueError("For a remote scale, the Raspberry Pi's IP address must be provided.")
         
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        client_socket.connect((raspberry_pi_ip, 65432))  # Connection port
-        client_socket.sendall(b'MEASURE')  # Send measurement request
-        data = client_socket.recv(1024)  # Receive response
-        client_socket.close()
+        data = get_device(raspberry_pi_ip).request(b'MEASURE')  # Send measurement request
         
         try:
             return float(data.decode('utf-8'))  # Convert response to float
@@ -119,7 +362,7 @@ def measure_weight(balance, remote=True, balance_port=None, raspberry_pi_ip=None
             # Configure the local scale (if reconfiguration is needed)
             if not isinstance(balance, serial.Serial):  # If balance is not of type Serial
                 balance = serial.Serial(port=balance_port, baudrate=9600, bytesize=serial.SEVENBITS,
-                                         parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE)
+                                         parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE, timeout=SERIAL_TIMEOUT)
             
             balance.flushInput()  # Clear any previous data in the input buffer
             balance.write(b'B\r\n')  # Command to get the measurement
@@ -140,7 +383,7 @@ def setup_remote_scale(access_remote):
     if access_remote:
         # If remote access is enabled, return the IP address
         print("Remote access enabled. Returning IP.")
-        return True, "192.168.8.151"
+        return True, DEVICE_HOST
     else:
         # If not remote, search for the scale's serial port
         print("Local access. Searching for serial port...")
@@ -161,16 +404,129 @@ def setup_remote_scale(access_remote):
 
         # If the port is found, establish the serial connection to the scale
         balance = serial.Serial(port=balance_port, baudrate=9600, bytesize=serial.SEVENBITS,
-                                parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE)
+                                parity=serial.PARITY_EVEN, stopbits=serial.STOPBITS_ONE, timeout=SERIAL_TIMEOUT)
 
         return False, balance
 
+# 5. STABLE WEIGHT READINGS
+
+# Stability criterion used by read_stable_weight and wait_for_zero (can be overridden from the config)
+WEIGHING = {
+    "window": 5,         # Number of consecutive readings that must agree
+    "tolerance": 0.002,  # Maximum spread (max - min) of the window in grams
+    "interval": 0.2,     # Seconds between readings
+    "timeout": 10.0,     # Give up waiting for stability after this many seconds
+    "use_flag": True,    # Accept a reading at once if the balance reports it as stable
+}
+
+STABLE_FLAGS = {"S": True, "ST": True, "STABLE": True, "U": False, "US": False, "?": False, "UNSTABLE": False}
+
+def read_balance(balance, remote=True, raspberry_pi_ip=None):
+    """
+    Takes one reading from the balance.
+
+    :param balance: Serial connection to the scale (local) or its IP address (remote).
+    :param remote: Boolean indicating whether to use the remote scale.
+    :param raspberry_pi_ip: IP address of the Raspberry Pi (remote). Defaults to balance.
+
+    :return: Tuple (weight, stable). stable is True/False if the reply carries a stability
+             flag (e.g. '4.312 S') and None otherwise. weight is None if the reply is invalid.
+    """
+    if remote:
+        text = get_device(raspberry_pi_ip or balance).request(b'MEASURE').decode('utf-8', errors='replace')
+        tokens = text.split(None, 1)
+        number = tokens[0] if tokens else ''
+        rest = tokens[1] if len(tokens) > 1 else ''
+    else:
+        balance.reset_input_buffer()  # Clear any previous data in the input buffer
+        balance.write(b'B\r\n')  # Command to get the measurement
+        reading = balance.readline().decode('ascii', errors='replace')
+        number, rest = reading[:10], reading[10:]  # The weight is in the first 10 characters
+    try:
+        weight = float(number.replace(' ', ''))
+    except ValueError:
+        return None, None
+    flags = [STABLE_FLAGS[token] for token in rest.upper().split() if token in STABLE_FLAGS]
+    return weight, (flags[0] if flags else None)
+
+def weight_readings(balance, remote=True, raspberry_pi_ip=None, interval=None):
+    """
+    Generator that streams balance readings as (monotonic time, weight, stable) tuples,
+    one every `interval` seconds. Invalid replies are yielded with weight None, so the
+    caller keeps control of its deadline even if the balance sends only garbage.
+    """
+    interval = WEIGHING["interval"] if interval is None else interval
+    next_reading = time.monotonic()
+    while True:
+        weight, stable = read_balance(balance, remote, raspberry_pi_ip)
+        yield time.monotonic(), weight, stable
+        next_reading += interval
+        delay = next_reading - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_reading = time.monotonic()  # Do not burst to catch up after a slow reply
+
+@tracing.traced(category="device")
+def read_stable_weight(balance, remote=True, raspberry_pi_ip=None, **criteria):
+    """
+    Returns as soon as the balance reading is stable.
+
+    A reading is stable when the last `window` readings differ by at most `tolerance`
+    grams, or, with use_flag, when the balance itself flags the reading as stable.
+    With use_flag, a reading the balance flags as unstable also restarts the window,
+    so a slow drift within the tolerance is not taken for a stable weight.
+    Any key of WEIGHING can be overridden through criteria.
+
+    :return: Tuple (weight, stable). weight is the mean of the stable window (or the
+             flagged reading). If the timeout expires first, the mean of the last
+             readings is returned with stable=False (weight None if no reply was valid);
+             callers must not use it as a measurement without flagging it.
+    """
+    settings = dict(WEIGHING, **criteria)
+    deadline = time.monotonic() + settings["timeout"]
+    window = []
+    recent = []  # Last readings, stable or not, for the timeout
+    for timestamp, weight, stable in weight_readings(balance, remote, raspberry_pi_ip, settings["interval"]):
+        if weight is not None:
+            recent = (recent + [weight])[-settings["window"]:]
+            if settings["use_flag"] and stable:
+                return weight, True
+            if settings["use_flag"] and stable is False:
+                window = []
+            else:
+                window = (window + [weight])[-settings["window"]:]
+            if len(window) == settings["window"] and max(window) - min(window) <= settings["tolerance"]:
+                return round(sum(window) / len(window), 4), True
+        if timestamp >= deadline:
+            print(f"Balance not stable after {settings['timeout']} s: {recent}")
+            return (round(sum(recent) / len(recent), 4) if recent else None), False
+
+@tracing.traced(category="device")
+def wait_for_zero(balance, remote=True, raspberry_pi_ip=None, **criteria):
+    """
+    Waits after a tare until the balance reads a stable zero (within the tolerance).
+
+    :return: True if a stable zero was reached before the timeout.
+    """
+    settings = dict(WEIGHING, **criteria)
+    deadline = time.monotonic() + settings["timeout"]
+    while True:
+        weight, stable = read_stable_weight(balance, remote, raspberry_pi_ip,
+                                            **dict(criteria, timeout=max(deadline - time.monotonic(), 0)))
+        if stable and weight is not None and abs(weight) <= settings["tolerance"]:
+            return True
+        if time.monotonic() >= deadline:
+            print(f"Balance did not settle at zero after tare: {weight} g")
+            return False
+
 # --------------------------------------------------------------------------------------------------
 # >>> PHOTO STAND FUNCTIONS
 
 import os
 import cv2
 import socket
+import time
 
 def create_photo_directory(name):
     '''
@@ -185,31 +541,319 @@ def create_photo_directory(name):
     return photo_directory  # Return the path to the created directory
 
 
-def take_photo(camera_number = 1):
+CAMERA_PORT_BASE = 8080  # Camera n streams on port CAMERA_PORT_BASE + n
+
+class FrameGrabber:
+    '''
+    Keeps a camera stream open and decodes it continuously on a background thread.
+    Only the latest frame is kept, together with the monotonic time it was read, so a
+    photo is available immediately and is never an old frame left in the stream buffer.
+    If the stream drops, the thread reopens it after reconnect_delay seconds.
+    '''
+    def __init__(self, url, reconnect_delay=1.0):
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self._frame = None
+        self._timestamp = None
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"camera {self.url}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def latest(self):
+        '''Returns the latest frame and its monotonic timestamp (None, None before the first frame).'''
+        with self._condition:
+            return self._frame, self._timestamp
+
+    def wait_for_frame(self, newer_than=None, timeout=5.0):
+        '''
+        Returns the first frame read after the monotonic time newer_than (or any frame if None).
+        Raises TimeoutError if no such frame arrives within timeout seconds.
+        '''
+        def ready():
+            return self._timestamp is not None and (newer_than is None or self._timestamp > newer_than)
+        with self._condition:
+            if not self._condition.wait_for(ready, timeout):
+                raise TimeoutError(f"No frame from {self.url} within {timeout} s")
+            return self._frame, self._timestamp
+
+    def _run(self):
+        while self._running:
+            camera = cv2.VideoCapture(self.url)  # Access the camera stream via IP
+            camera.set(cv2.CAP_PROP_AUTOFOCUS, 1)  # Enable autofocus on the camera
+            while self._running and camera.isOpened():
+                return_value, frame = camera.read()  # Blocks until the next frame is decoded
+                if not return_value:
+                    break
+                with self._condition:
+                    self._frame = frame
+                    self._timestamp = time.monotonic()
+                    self._condition.notify_all()
+            camera.release()
+            if self._running:
+                time.sleep(self.reconnect_delay)
+
+_grabbers = {}
+_grabbers_lock = threading.Lock()
+
+def get_camera(camera_number = 1):
+    '''
+    Returns the running frame grabber of a camera, starting it on first use.
+    '''
+    with _grabbers_lock:
+        if camera_number not in _grabbers:
+            url = f"http://{DEVICE_HOST}:{CAMERA_PORT_BASE + camera_number}"
+            _grabbers[camera_number] = FrameGrabber(url)
+            _grabbers[camera_number].start()
+        return _grabbers[camera_number]
+
+def stop_cameras():
+    '''Stops every frame grabber.'''
+    with _grabbers_lock:
+        grabbers = list(_grabbers.values())
+        _grabbers.clear()
+    for grabber in grabbers:
+        grabber.stop()
+
+def grab_frame(camera_number = 1, newer_than = None, timeout = 5.0):
+    '''
+    Returns the latest frame of a camera and its monotonic timestamp.
+    If newer_than is given, waits for a frame read after that time (e.g. after the arm stopped).
+    '''
+    return get_camera(camera_number).wait_for_frame(newer_than, timeout)
+
+@tracing.traced(category="device")
+def take_photo(camera_number = 1, newer_than = None, timeout = 5.0):
     '''
     Captures a photo using a specified camera.
     The default camera is set to 1, which could be either an on-robot camera or a photo stand camera.
-    The camera stream is accessed through an IP address, and the autofocus is enabled.
+    The frame comes from the camera's background grabber, so no stream is opened per photo.
+    If no suitable frame arrives within the timeout, the latest available frame (or None) is returned.
     '''
     # camera_number = 1 for on-robot camera, 2 for photo stand camera
-    camera = cv2.VideoCapture("http:/192.168.8.151:808"+str(camera_number))  # Access the camera stream via IP
-    camera.set(cv2.CAP_PROP_AUTOFOCUS, 1)  # Enable autofocus on the camera
-    return_value1, img1 = camera.read()  # Read a frame from the camera
-    camera.release()  # Release the camera resource after capturing the image
+    try:
+        img1, timestamp = grab_frame(camera_number, newer_than, timeout)
+    except TimeoutError as e:
+        print(f"Camera {camera_number}: {e}")
+        img1, timestamp = get_camera(camera_number).latest()
     return img1  # Return the captured image
 
 # --------------------------------------------------------------------------------------------------
 # >>> ARDUINO FUNCTIONS
 
-def arduino(task, ip="192.168.8.151", port=65432):
+def arduino(task, ip=None, port=None):
     '''
     Sends a task or command to an Arduino device over a network.
-    Establishes a socket connection to communicate with the Arduino, sends the task, and receives a response.
-    The default IP and port are provided, but can be customized if needed.
-    '''
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # Create a TCP/IP socket
-    client_socket.connect((ip, port))  # Connect to the Arduino device at the specified IP and port
-    client_socket.sendall(task)  # Send the task/command to the Arduino
-    data = client_socket.recv(1024)  # Receive up to 1024 bytes of response data from the Arduino
-    client_socket.close()  # Close the socket connection
-    return str(data)  # Return the received data as a string
\ No newline at end of file
+    Uses the shared keep-alive connection to the Arduino bridge, sends the task, and receives a response.
+    The default IP and port are DEVICE_HOST and DEVICE_PORT, but can be customized if needed.
+    '''
+    data = get_device(ip, port).request(task)  # Send the task/command and wait for the reply
+    return str(data)  # Return the received data as a string
+
+@tracing.traced(category="device")
+def read_temperature(retry_delay=1):
+    '''
+    Asks the Arduino for the temperature until a complete reply arrives.
+    Returns the temperature field (fifth word of the reply) as a string.
+    '''
+    temperature = arduino(b'TEMPERATURE')
+    while len(temperature.split()) < 5:  # Ensure temperature is valid
+        time.sleep(retry_delay)
+        temperature = arduino(b'TEMPERATURE')
+    return temperature.split()[4]
+
+# --------------------------------------------------------------------------------------------------
+# >>> TEMPERATURE TELEMETRY
+
+TEMPERATURE_SENSORS = {1: b'TEMP', 2: b'TEMPB'}  # Arduino command of the sensor of each bath (setup)
+
+def parse_temperature(reply):
+    '''
+    Returns the temperature in a reply such as "Temperature at sensor 1: 40.12 ºC", or None if incomplete.
+    '''
+    words = str(reply).split()
+    try:
+        return float(words[4])
+    except (IndexError, ValueError):
+        return None
+
+class TemperatureSampler:
+    '''
+    Polls the bath temperature sensors on a background thread into a timestamped ring buffer.
+
+    Each row holds the epoch time of a poll and one reading per sensor (NaN if the
+    reply was incomplete). Readings are looked up instead of requested, so taking the
+    temperature of a sample never waits for the Arduino, and the temperature registry
+    is written as a downsampled view of the buffer.
+
+    The polls go through the shared client of the Arduino bridge (get_device()), whose
+    lock lets only one request at a time on the service: a poll waits while a valve or
+    scale command of the cycle is in flight, and the other way round.
+
+    Args:
+    - sensors: Sensor key -> Arduino command (TEMPERATURE_SENSORS by default).
+    - period: Seconds between polls.
+    - capacity: Rows kept; older rows are overwritten (one day at the default period).
+    - host, port: Arduino bridge (DEVICE_HOST and DEVICE_PORT by default).
+    - store: Optional data_processing.TemperatureStore that receives every row.
+    '''
+    def __init__(self, sensors=None, period=10.0, capacity=8640, host=None, port=None, store=None):
+        self.sensors = dict(TEMPERATURE_SENSORS if sensors is None else sensors)
+        self.columns = {key: column for column, key in enumerate(self.sensors)}
+        self.period = period
+        self.capacity = capacity
+        self.host = host
+        self.port = port
+        self.store = store
+        self._times = np.full(capacity, np.nan)
+        self._values = np.full((capacity, len(self.sensors)), np.nan, dtype=np.float32)
+        self._next = 0
+        self._count = 0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="temperature sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def poll(self):
+        '''Reads every sensor once and appends the row to the buffer.'''
+        device = get_device(self.host, self.port)
+        row = []
+        for command in self.sensors.values():
+            try:
+                value = parse_temperature(str(device.request(command)))
+            except (OSError, EOFError) as error:
+                print(f"Temperature read failed: {error}")
+                value = None
+            row.append(np.nan if value is None else value)
+        now = time.time()
+        with self._condition:
+            self._times[self._next] = now
+            self._values[self._next] = row
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self._condition.notify_all()
+        if self.store is not None:
+            try:
+                self.store.append(now, row)
+            except OSError as error:
+                print(f"Temperature store write failed: {error}")
+
+    def _run(self):
+        next_poll = time.monotonic()
+        while not self._stop.is_set():
+            self.poll()
+            next_poll += self.period
+            self._stop.wait(max(next_poll - time.monotonic(), 0))
+
+    def wait_for_data(self, timeout=30.0):
+        '''Waits until the buffer holds at least one row. Returns False on timeout.'''
+        with self._condition:
+            return self._condition.wait_for(lambda: self._count > 0, timeout)
+
+    def history(self, sensor, start=None, end=None):
+        '''
+        Returns the valid readings of a sensor between two epoch times.
+
+        :return: Tuple (times, values) of arrays in chronological order.
+        '''
+        with self._condition:
+            order = (np.arange(self._count) + self._next - self._count) % self.capacity
+            times = self._times[order]
+            values = self._values[order, self.columns[sensor]].astype(float)
+        keep = ~np.isnan(values)
+        if start is not None:
+            keep &= times >= start
+        if end is not None:
+            keep &= times <= end
+        return times[keep], values[keep]
+
+    def latest(self, sensor):
+        '''Returns (time, value) of the last valid reading of a sensor, or (None, None).'''
+        with self._condition:
+            for i in range(1, self._count + 1):
+                row = (self._next - i) % self.capacity
+                value = self._values[row, self.columns[sensor]]
+                if not np.isnan(value):
+                    return float(self._times[row]), float(value)
+        return None, None
+
+    def value_at(self, sensor, when=None):
+        '''
+        Returns the temperature of a sensor at an epoch time, interpolated between the
+        neighbouring readings (the latest reading if when is None or in the future).
+        Returns None if there is no reading yet.
+        '''
+        if when is None:
+            return self.latest(sensor)[1]
+        times, values = self.history(sensor)
+        if len(times) == 0:
+            return None
+        return float(np.interp(when, times, values))
+
+    def downsample(self, sensor, every, start=None, end=None):
+        '''
+        Averages the readings of a sensor over consecutive bins of `every` seconds.
+        Only bins that ended before `end` (default: now) are returned.
+
+        :return: Tuple (bin_starts, means) of arrays.
+        '''
+        end = time.time() if end is None else end
+        times, values = self.history(sensor, start, end)
+        bins = np.floor(times / every).astype(np.int64)
+        complete = (bins + 1) * every <= end
+        bins, values = bins[complete], values[complete]
+        if len(bins) == 0:
+            return np.array([]), np.array([])
+        labels, index = np.unique(bins, return_inverse=True)
+        means = np.bincount(index, weights=values) / np.bincount(index)
+        return labels * float(every), means
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+def get_temperature_sampler(period=10.0, capacity=8640, store=None):
+    '''
+    Returns the running temperature sampler, starting it on first use.
+    The arguments only apply when the sampler is started.
+    '''
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = TemperatureSampler(period=period, capacity=capacity, store=store)
+            _sampler.start()
+        return _sampler
+
+def running_temperature_sampler():
+    '''Returns the running temperature sampler, or None if it has not been started.'''
+    with _sampler_lock:
+        return _sampler
+
+def stop_temperature_sampler():
+    '''Stops the temperature sampler.'''
+    global _sampler
+    with _sampler_lock:
+        sampler, _sampler = _sampler, None
+    if sampler is not None:
+        sampler.stop()
@@ -3,70 +3,132 @@
 # BS. 11.04.25                   #
 # ------------------------------ #
 
-from rtde_control import RTDEControlInterface as RTDEControl
-from rtde_receive import RTDEReceiveInterface as RTDEReceive
-from rtde_io import RTDEIOInterface as RTDEIO
-
 import time
 
-def open_grip(open_distance, rtde_c, rtde_r, rtde_io):
+import tracing
+
+# Registers shared with the gripper program running on the controller
+COMMAND_REGISTER = 18   # Input int: write 1 to execute the command, 0 to reset
+DISTANCE_REGISTER = 18  # Input double: target opening in mm
+FORCE_REGISTER = 19     # Input double: gripping force in N
+BUSY_REGISTER = 18      # Output int: 1 while the gripper is moving
+WIDTH_REGISTER = 18     # Output double: measured finger width in mm (only if the program publishes it)
+
+POLL_PERIOD = 0.002     # RTDE updates the registers at 500 Hz
+ACK_TIMEOUT = 0.2       # Time for the busy flag to rise; very short moves can finish before it is seen
+UNACKED_DELAY = 0.5     # Without an acknowledgement, wait as long as the original fixed sleep before checking the flag
+TIMEOUT = 3.0           # Maximum time for a grip action
+MIN_PART_WIDTH = 1.0    # Fingers closer than this (mm) after closing means nothing was grasped
+
+# Set from the "gripper" block of the robot config (see configure)
+SETTINGS = {
+    "width_feedback": False,  # The controller program writes the finger width to WIDTH_REGISTER
+}
+
+class GripperTimeout(Exception):
+    """Raised when the gripper does not report completion in time."""
+
+def configure(**settings):
+    """
+    Updates SETTINGS, e.g. configure(width_feedback=True) once the controller
+    program publishes the finger width.
+    """
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown gripper settings: {sorted(unknown)}")
+    SETTINGS.update(settings)
+
+def _wait_register(rtde_r, value, timeout):
+    """
+    Polls the busy register until it equals value.
+
+    Returns:
+    - bool: False if the timeout expired first.
+    """
+    deadline = time.monotonic() + timeout
+    while rtde_r.getOutputIntRegister(BUSY_REGISTER) != value:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POLL_PERIOD)
+    return True
+
+def _command(distance, force, rtde_r, rtde_io, timeout):
+    """
+    Sends one command to the gripper and waits for it to finish.
+
+    Returns:
+    - float: Finger width in mm after the move, or None if the width is not published.
+
+    Raises:
+    - GripperTimeout: If the gripper is still busy after the timeout.
+    """
+    # Set the applied force and the target distance, then trigger the command
+    rtde_io.setInputDoubleRegister(FORCE_REGISTER, force)
+    rtde_io.setInputDoubleRegister(DISTANCE_REGISTER, distance)
+    rtde_io.setInputIntRegister(COMMAND_REGISTER, 1)
+
+    try:
+        # Wait for the program to report the gripper as busy, then for the move to end
+        if not _wait_register(rtde_r, 1, ACK_TIMEOUT):
+            # No acknowledgement: the move was shorter than a poll or the flag rises late.
+            # Give it the time of the original fixed sleep before trusting a clear flag.
+            time.sleep(UNACKED_DELAY - ACK_TIMEOUT)
+        if not _wait_register(rtde_r, 0, timeout):
+            raise GripperTimeout(f"Gripper did not reach {distance} mm within {timeout} s")
+    finally:
+        # Reset the input register by writing 0 to prepare for the next command
+        rtde_io.setInputIntRegister(COMMAND_REGISTER, 0)
+
+    return width(rtde_r)
+
+@tracing.traced(category="grip")
+def open_grip(open_distance, rtde_c, rtde_r, rtde_io, force=25, timeout=TIMEOUT):
     """
     Opens the robotic gripper to a specified distance.
-    
+
     Parameters:
     - open_distance (float): Distance in millimeters to open the gripper.
     - rtde_c: RTDE control interface (for robot control).
     - rtde_r: RTDE read interface (for reading robot state).
     - rtde_io: RTDE IO interface (for input/output communication).
+    - force (float, optional): Force applied while opening. Default is 25 N.
+    - timeout (float, optional): Seconds to wait for the gripper to finish.
+
+    Returns:
+    - float: Measured finger width in mm (None without width feedback).
     """
-    force = 25  # Apply 25 N of force to ensure controlled grip opening
-    
-    # Set the applied force in the input register 19
-    rtde_io.setInputDoubleRegister(19, force)
-    
-    # Set the desired opening distance in input register 18
-    rtde_io.setInputDoubleRegister(18, open_distance)
-    
-    # Write 1 to input register 18 to initiate the gripper opening process
-    rtde_io.setInputIntRegister(18, 1)
-
-    time.sleep(0.5)
-    
-    # Check if the gripper has finished moving by reading output register 18
-    if rtde_r.getOutputIntRegister(18) == 1:
-        time.sleep(0.1)
-    
-    # Reset the input register by writing 0 to prepare for the next command
-    rtde_io.setInputIntRegister(18, 0)
-    
-
-def close_grip(rtde_c, rtde_r, rtde_io, force=25):
+    return _command(open_distance, force, rtde_r, rtde_io, timeout)
+
+@tracing.traced(category="grip")
+def close_grip(rtde_c, rtde_r, rtde_io, force=25, timeout=TIMEOUT):
     """
     Closes the robotic gripper to a fully closed position.
-    
+
     Parameters:
     - rtde_c: RTDE control interface (for robot control).
     - rtde_r: RTDE read interface (for reading robot state).
     - rtde_io: RTDE IO interface (for input/output communication).
     - force (float, optional): Force to apply when closing the gripper. Default is 25 N.
+    - timeout (float, optional): Seconds to wait for the gripper to finish.
+
+    Returns:
+    - float: Measured finger width in mm (the part thickness if something was grasped),
+             None without width feedback.
     """
-    force = 25  # Apply 25 N of force to ensure a firm grip
     closed_distance = 0  # Target position is 0 mm, meaning fully closed
-    
-    # Set the applied force in input register 19
-    rtde_io.setInputDoubleRegister(19, force)
-    
-    # Set the desired closing distance in input register 18
-    rtde_io.setInputDoubleRegister(18, closed_distance)
-    
-    # Write 1 to input register 18 to trigger the closing action
-    rtde_io.setInputIntRegister(18, 1)
-
-    time.sleep(0.5)
-    
-    # Check if the gripper has fully closed by reading output register 18
-    if rtde_r.getOutputIntRegister(18) == 1:
-        time.sleep(0.1)
-    
-    # Reset the input register by writing 0 to prepare for the next operation
-    rtde_io.setInputIntRegister(18, 0)
+    return _command(closed_distance, force, rtde_r, rtde_io, timeout)
+
+def width(rtde_r):
+    """
+    Returns the measured finger width in mm, or None (unknown) unless SETTINGS["width_feedback"] is set.
+    """
+    if not SETTINGS["width_feedback"]:
+        return None
+    return rtde_r.getOutputDoubleRegister(WIDTH_REGISTER)
+
+def holding(finger_width, min_width=MIN_PART_WIDTH):
+    """
+    Returns True if the width measured after closing shows that a part was grasped.
+    An unknown width (None) counts as holding, as before the width was read.
+    """
+    return finger_width is None or finger_width >= min_width
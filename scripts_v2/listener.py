@@ -1,7 +1,8 @@
-import socket
+import asyncio
 import threading
 import queue, time
 import json
+import traceback
 
 import time
 import os
@@ -18,24 +19,43 @@ import gripper
 import environment
 import data_processing
 import degradation
+import scheduler
+import simulator
+import tracing
 
-# Queue to hold incoming commands
-command_queue = queue.Queue()
+PORT = 5000
+MAX_LINE = 1024 * 1024  # Largest accepted command line in bytes (reader buffer limit)
+MAX_OUTGOING = 64  # Messages queued per client before replies wait and progress events are dropped
 
-# Flag to indicate if the robot is busy
-is_busy = False
+registry_marks = {}  # Registry file -> epoch time up to which it has been written
 
-PORT = 5000
+def write_registry(registry, sampler, sensor, every=600):
+    """
+    Appends the temperature averages of the completed `every`-second bins not yet in the registry.
+    """
+    starts, means = sampler.downsample(sensor, every, start=registry_marks.get(registry))
+    if len(starts) == 0:
+        return
+    with open(registry, 'a') as f:
+        for start, mean in zip(starts, means):
+            f.write(time.strftime('%m/%d, %H:%M:%S', time.localtime(start)) + f', {mean:.2f}\n')
+    registry_marks[registry] = starts[-1] + every
 
 # CODE FOR EXPERIMENT IN THIS FUNCTION
 
-def execute_command(command_data):
+def execute_command(command_data, report=None):
     """
     Execute a robot command using the ur-rtde API.
+
+    Args:
+    - command_data: Cycle description sent by client.py.
+    - report: Optional callable report(event, **fields) that receives per-sample
+              progress events ("calibrated", "picked", "dried", "photos", "weighed", "returned"),
+              each sent when its work is done. "weighed" carries the scale photos, "returned" the
+              temperature at the time of test.
     """
-    global is_busy
-    is_busy = True
-    
+    if report is None:
+        report = lambda event, **fields: None
     print("Experiment running") 
     
     setup = command_data.get("setup")
@@ -56,8 +76,20 @@ def execute_command(command_data):
 
     print("\n--- Robot Connection ---")
     print("Connecting to the robot...")
-    rtde_c, rtde_r, rtde_io = robot.connect_robot(robot_ip)
+    simulator.configure(**config["robot"].get("simulator", {}))  # Only used by the "sim" backend
+    gripper.configure(**config["robot"].get("gripper", {}))
+    environment.configure_devices(**config.get("devices", {}))  # e.g. {"host": "127.0.0.1"} for device_emulator.py
+    session = robot.get_session(robot_ip, config["robot"].get("backend", "rtde"))
+    rtde_c, rtde_r, rtde_io = session.interfaces()
     print("Robot connected successfully.")
+
+    # Per-step timing spans of this cycle (moves, device calls, grip actions), see tracing.py
+    cycle_number = command_data.get("cycle_number", config["experiment"]["starting_cycle"])
+    tracing_settings = config.get("tracing", {})
+    if command_data.get("trace", tracing_settings.get("enabled", False)):
+        trace_file = tracing_settings.get("file", "../data/Trace_{name}.jsonl").format(name=name)
+        tracing.enable(trace_file, cycle=cycle_number, setup=setup)
+        rtde_c = tracing.instrument(rtde_c, "motion", robot.MOTION_METHODS)
     robot.set_initial_position(rtde_c, setup)
 
     photo_dir = f"../data/Photos_{name}"
@@ -68,320 +100,603 @@ def execute_command(command_data):
         print(f"Directory '{photo_dir}' already exists.")
     
     temperature_registry = f"../data/TemperatureRegistry_{name}.txt"
-    prev_time = int(time.strftime('%H%M%S', time.localtime()))
 
-    # Robot Environment settings
-    SAMPLE = environment.generate_sample_grid(columns,rows)
-
-    OFFSET = -.068  # Z offset
-    gripper_length = .05  # Gripper length adjustment
-    OFFSET += gripper_length
+    # Both bath sensors are polled in the background; the sensor of this bath is the setup number
+    telemetry = config.get("telemetry", {})
+    sampler = environment.running_temperature_sampler()
+    if sampler is None:
+        # Every reading is also kept in the binary store (both sensors, full resolution)
+        store = data_processing.TemperatureStore(telemetry.get("store", "../data/TemperatureStore"),
+                                                 sensors=list(environment.TEMPERATURE_SENSORS))
+        sampler = environment.get_temperature_sampler(period=telemetry.get("period", 10.0), store=store)
+
+    # Photos are encoded and written in the background while the robot keeps moving
+    photo_settings = config.get("photos", {})
+    writer = data_processing.ImageWriter(codec=photo_settings.get("codec", "png"),
+                                         quality=photo_settings.get("quality"),
+                                         max_pending=photo_settings.get("max_pending", 16))
+
+    # With async motion, device calls (tare, temperature) run while the arm travels
+    overlap = robot.Overlap(rtde_c, command_data.get("async_motion", config["robot"].get("async_motion", False)))
+
+    try:
+        # Robot Environment settings
+        SAMPLE = environment.generate_sample_grid(columns,rows)
+
+        OFFSET = -.068  # Z offset
+        gripper_length = .05  # Gripper length adjustment
+        OFFSET += gripper_length
     
-    scale_access_remote = input("Allow remote scale access? (y/n): ").lower() == "y"
-    remote, balance = environment.setup_remote_scale(scale_access_remote)
-
-    # Obtener la posición actual del robot
-    lid_position = rtde_r.getActualTCPPose()  # Devuelve [X, Y, Z, RX, RY, RZ]
-    print(f"Posición actual: {lid_position}")
-
-    # Posición base del primer setup
-    if setup == 1:
-        lid_deposition = [-0.24133534388522648, 0.2131944897595923, 0.35, 2.224008047304794, -2.2121364315342986, -0.010991599941659188]
-    elif setup == 2:
-        lid_deposition = [0.6556738335891733, -0.32250568064465923, 0.4362477404307668, 2.267314033738123, -2.13353507951682, 0.026926286486254704]
-
-    cycle_number = config["experiment"]["starting_cycle"]
-    fields = ['Sample', 'Measure 1 (g)', 'Measure 2 (g)', 'Measure 3 (g)', 'Average (g)', 'Time of Test', 'Temperature (C)']  # Fields for the CSV
-
-    print("_Removing lid...")
-    rtde_c.moveL(lid_position, 3, 1)
-    temporal_position = rtde_r.getActualTCPPose()
-    degradation.move_lid('off', rtde_c, rtde_r, rtde_io)
-    temporal_position[2] = .3 + OFFSET
-    print("_Callibrating...")
-    intersection, angle_deviation = degradation.center(temporal_position, rtde_c, rtde_r, rtde_io, OFFSET)
-    X_intersection = intersection[0]
-    Y_intersection = intersection[1]
+        scale_access_remote = command_data.get("remote_scale")  # Unattended runs (e.g. benchmark.py) set it in the command
+        if scale_access_remote is None:
+            scale_access_remote = input("Allow remote scale access? (y/n): ").lower() == "y"
+        remote, balance = environment.setup_remote_scale(scale_access_remote)
+        environment.WEIGHING.update(config.get("weighing", {}))
+
+        # Obtener la posición actual del robot
+        lid_position = rtde_r.getActualTCPPose()  # Devuelve [X, Y, Z, RX, RY, RZ]
+        print(f"Posición actual: {lid_position}")
+
+        # Posición base del primer setup
+        if setup == 1:
+            lid_deposition = [-0.24133534388522648, 0.2131944897595923, 0.35, 2.224008047304794, -2.2121364315342986, -0.010991599941659188]
+        elif setup == 2:
+            lid_deposition = [0.6556738335891733, -0.32250568064465923, 0.4362477404307668, 2.267314033738123, -2.13353507951682, 0.026926286486254704]
+
+        fields = ['Sample', 'Measure 1 (g)', 'Measure 2 (g)', 'Measure 3 (g)', 'Average (g)', 'Time of Test', 'Temperature (C)']  # Fields for the CSV
+
+        print("_Removing lid...")
+        rtde_c.moveL(lid_position, 3, 1)
+        temporal_position = rtde_r.getActualTCPPose()
+        degradation.move_lid('off', rtde_c, rtde_r, rtde_io, setup)
+        temporal_position[2] = .3 + OFFSET
+        print("_Callibrating...")
+        intersection, angle_deviation = degradation.calibrate(temporal_position, rtde_c, rtde_r, rtde_io, OFFSET, setup)
+        X_intersection = intersection[0]
+        Y_intersection = intersection[1]
         
-    # Preparation
-    gripper.open_grip(15, rtde_c, rtde_r, rtde_io)
-    rtde_c.moveL(intersection, 3, 1)
-
-    # Calculate positions for sponge and scale
-    sponge_position = rtde_r.getActualTCPPose()
-    X_sponge = .225
-    Y_sponge = -.125 + .02
-    sponge_position[0] = X_intersection + (X_sponge * math.cos(angle_deviation) - Y_sponge * math.sin(angle_deviation))
-    sponge_position[1] = Y_intersection + (Y_sponge * math.cos(angle_deviation) + X_sponge * math.sin(angle_deviation))
-
-    if setup == 2:
-        scale_position = [0.10645207840498347, 0.6936982017571437, 0.28658622705355286, -2.222037213084921, 2.2142596251486433, -0.007182138314705186]
-
-    elif setup == 1:
-        scale_position = rtde_r.getActualTCPPose()
-
-        X_scale = 0.1365 + 0.165
-        Y_scale = -0.1875
-
-        scale_position[0] = X_intersection + (
-            X_scale * math.cos(angle_deviation) - Y_scale * math.sin(angle_deviation)
-        )
-        scale_position[1] = Y_intersection + (
-            Y_scale * math.cos(angle_deviation) + X_scale * math.sin(angle_deviation)
-        )
-        scale_position[2] -= 0.095
+        # Preparation
+        gripper.open_grip(15, rtde_c, rtde_r, rtde_io)
+        rtde_c.moveL(intersection, 3, 1)
+
+        # Calculate positions for sponge and scale
+        sponge_position = rtde_r.getActualTCPPose()
+        X_sponge = .225
+        Y_sponge = -.125 + .02
+        sponge_position[0] = X_intersection + (X_sponge * math.cos(angle_deviation) - Y_sponge * math.sin(angle_deviation))
+        sponge_position[1] = Y_intersection + (Y_sponge * math.cos(angle_deviation) + X_sponge * math.sin(angle_deviation))
+
+        if setup == 2:
+            scale_position = [0.10645207840498347, 0.6936982017571437, 0.28658622705355286, -2.222037213084921, 2.2142596251486433, -0.007182138314705186]
+
+        elif setup == 1:
+            scale_position = rtde_r.getActualTCPPose()
+
+            X_scale = 0.1365 + 0.165
+            Y_scale = -0.1875
+
+            scale_position[0] = X_intersection + (
+                X_scale * math.cos(angle_deviation) - Y_scale * math.sin(angle_deviation)
+            )
+            scale_position[1] = Y_intersection + (
+                Y_scale * math.cos(angle_deviation) + X_scale * math.sin(angle_deviation)
+            )
+            scale_position[2] -= 0.095
         
-    # Move and rotate the gripper
-    J0 = rtde_r.getActualQ()
-    J0[-1] -= angle_deviation
-    rtde_c.moveJ(J0, 3, 1)
-    P0 = rtde_r.getActualTCPPose()
-    P0[2] -= .16
-    rtde_c.moveL(P0, 3, 1)
-
-    filename = f"../data/WT_{time.strftime('%d.%m.%y', time.localtime())}_{name}"
-    csv_file = filename + '.csv'
-    png_file = filename + '.png'
-    time.sleep(1)
-    
-   
-    for sample in command_data.get("samples"):
-        print("__Measuring sample " + str(sample))
-        n =int(sample)
-        time.sleep(1)
-
-        # CALCULATE GRID POSITION 
+        # Move and rotate the gripper
+        J0 = rtde_r.getActualQ()
+        J0[-1] -= angle_deviation
+        rtde_c.moveJ(J0, 3, 1)
         P0 = rtde_r.getActualTCPPose()
-        # Pull coords from class
-        xtemp = .02 * (SAMPLE[n].index[0] - 1)
-        ytemp = .02 * (SAMPLE[n].index[1] - 1)
-        P0[0] = X_intersection + (xtemp * math.cos(angle_deviation) - ytemp * math.sin(angle_deviation))  # Rot transformation X
-        if n > 121:
-            P0[0] += 0.003
-        P0[1] = Y_intersection + (ytemp * math.cos(angle_deviation) + xtemp * math.sin(angle_deviation))  # Rot transformation Y
-        rtde_c.moveL(P0, 0.3, 1)
-
-        # CALCULATE DEPOSIT POSITION
-        PD = copy.copy(lid_deposition)
-
-        PD[0] += xtemp
-        PD[1] += ytemp
-
-        # Sample collection (Picking the sample)
-        P0 = rtde_r.getActualTCPPose()
-        initial_position = copy.copy(P0)
+        P0[2] -= .16
+        rtde_c.moveL(P0, 3, 1)
 
-        # Move down to collect sample
-        P0[2] -= .04  # .05 or .21 depending on the position
-        rtde_c.moveL(P0, .05)
+        # Pick and deposit poses of the whole grid, computed once from the calibration
+        targets = environment.GridTargets.compute(SAMPLE, P0, intersection, angle_deviation, lid_deposition)
+        targets.save(f"../data/GridTargets_{name}_cycle_{cycle_number}")
+
+        # Free-space transits between stations run as joint moves; their IK is solved once here.
+        # Moves over the sample tray and the final approach onto each position stay moveL.
+        planner = robot.TransitPlanner(rtde_c, rtde_r)
+        unreachable = planner.precompute([P0, sponge_position, scale_position] + targets.deposit.tolist() + [lid_position])
+        if unreachable:
+            print(f"{unreachable} poses have no IK solution; they are reached with moveL.")
+        report("calibrated", angle=float(angle_deviation), unreachable=unreachable)
+
+        filename = f"../data/WT_{time.strftime('%d.%m.%y', time.localtime())}_{name}"
+        csv_file = filename + '.csv'
+        png_file = filename + '.png'
+        tracing.sleep(1)
+    
+   
+        for sample in command_data.get("samples"):
+            print("__Measuring sample " + str(sample))
+            n =int(sample)
+            tracing.set_context(sample=n)
+            tracing.sleep(1)
+
+            try:
+                # GRID AND DEPOSIT POSITIONS
+                P0 = targets.pick_pose(n)
+                rtde_c.moveL(P0, 0.3, 1)  # Straight and slow over the sample tray (the arm comes from the previous grid position)
+                PD = targets.deposit_pose(n)
+
+                # Sample collection (Picking the sample)
+                initial_position = copy.copy(P0)
+
+                # Move down to collect sample
+                P0[2] -= .04  # .05 or .21 depending on the position
+                rtde_c.moveL(P0, .05)
             
-        # Open grip slightly to help center the sample
-        gripper.open_grip(15, rtde_c, rtde_r, rtde_io)  # Opening the gripper slightly
+                # Open grip slightly to help center the sample
+                gripper.open_grip(15, rtde_c, rtde_r, rtde_io)  # Opening the gripper slightly
             
-        # Shake sample to ensure it's secured
-        degradation.shake(rtde_c, rtde_r, rtde_io)
-        gripper.open_grip(10, rtde_c, rtde_r, rtde_io)  # Slightly opening to release tension
+                # Shake sample to ensure it's secured
+                degradation.shake(rtde_c, rtde_r, rtde_io)
+                gripper.open_grip(10, rtde_c, rtde_r, rtde_io)  # Slightly opening to release tension
             
-        # Shake it again to make sure it's secure
-        degradation.shake(rtde_c, rtde_r, rtde_io)
+                # Shake it again to make sure it's secure
+                degradation.shake(rtde_c, rtde_r, rtde_io)
             
-        # Close the grip to secure the sample
-        gripper.close_grip(rtde_c, rtde_r, rtde_io, force=25)
+                # Close the grip to secure the sample
+                finger_width = gripper.close_grip(rtde_c, rtde_r, rtde_io, force=25)
             
-        # Move the gripper up to the collection position
-        P0[2] += .2  # .21 or appropriate distance for sample collection
-        rtde_c.moveL(P0, 3, 1)
-
-        # TASKS: Move over the basin and apply delay for the use of compressed air and sponge
-        if setup == 1:
-            Pi = rtde_r.getActualTCPPose()
-            P1 = copy.copy(Pi)
-            P1[0] = -0.1961714502764558
-            P1[1] = 0.6999493118395084
-            rtde_c.moveL(P1, 3, 1)
-            P1[2] -= 0.25
-            rtde_c.moveL(P1, 3, 1)
-            # Use compressed air here!
-            environment.arduino(b'OPEN_VALVE')
-            time.sleep(1)
-            environment.arduino(b'CLOSE_VALVE')
-            time.sleep(1)
-            environment.arduino(b'OPEN_VALVE')
-            time.sleep(0.5)
-            environment.arduino(b'CLOSE_VALVE')
+                # Move the gripper up to the collection position
+                P0[2] += .2  # .21 or appropriate distance for sample collection
+                rtde_c.moveL(P0, 3, 1)
+
+                # Nothing between the fingers: skip the sample instead of weighing an empty gripper
+                if not gripper.holding(finger_width):
+                    print(f"Sample {n} was not picked (finger width {finger_width:.1f} mm). Skipping.")
+                    report("missed", sample=n, width=finger_width)
+                    gripper.open_grip(15, rtde_c, rtde_r, rtde_io)
+                    rtde_c.moveL(initial_position, 3, 1)
+                    continue
+                report("picked", sample=n, width=finger_width)
+
+                # TASKS: Move over the basin and apply delay for the use of compressed air and sponge
+                if setup == 1:
+                    Pi = rtde_r.getActualTCPPose()
+                    P1 = copy.copy(Pi)
+                    P1[0] = -0.1961714502764558
+                    P1[1] = 0.6999493118395084
+                    planner.transit(P1)
+                    P1[2] -= 0.25
+                    rtde_c.moveL(P1, 3, 1)
+                    # Use compressed air here!
+                    environment.arduino(b'OPEN_VALVE')
+                    tracing.sleep(1, "air")
+                    environment.arduino(b'CLOSE_VALVE')
+                    tracing.sleep(1, "air")
+                    environment.arduino(b'OPEN_VALVE')
+                    tracing.sleep(0.5, "air")
+                    environment.arduino(b'CLOSE_VALVE')
                 
-            # Move back up after using air
-            P1[2] += .25
-            rtde_c.moveL(P1, 3, 1)
+                    # Move back up after using air
+                    P1[2] += .25
+                    rtde_c.moveL(P1, 3, 1)
                 
 
-        elif setup == 2:
-            Pi = rtde_r.getActualTCPPose()
-            P1 = copy.copy(Pi)
-            P1[0] = 0.5416628641896849
-            P1[1] = 0.09024120194746174 - 0.20
-            rtde_c.moveL(P1, 3, 1)
-            P1[2] -= 0.25
-            rtde_c.moveL(P1, 3, 1)
-            # Use compressed air here!
-            environment.arduino(b'OPEN_VALVE')
-            time.sleep(1)
-            environment.arduino(b'CLOSE_VALVE')
-            time.sleep(1)
-            environment.arduino(b'OPEN_VALVE')
-            time.sleep(0.5)
-            environment.arduino(b'CLOSE_VALVE')
+                elif setup == 2:
+                    Pi = rtde_r.getActualTCPPose()
+                    P1 = copy.copy(Pi)
+                    P1[0] = 0.5416628641896849
+                    P1[1] = 0.09024120194746174 - 0.20
+                    planner.transit(P1)
+                    P1[2] -= 0.25
+                    rtde_c.moveL(P1, 3, 1)
+                    # Use compressed air here!
+                    environment.arduino(b'OPEN_VALVE')
+                    tracing.sleep(1, "air")
+                    environment.arduino(b'CLOSE_VALVE')
+                    tracing.sleep(1, "air")
+                    environment.arduino(b'OPEN_VALVE')
+                    tracing.sleep(0.5, "air")
+                    environment.arduino(b'CLOSE_VALVE')
                 
-            # Move back up after using air
-            P1[2] += .25
-            rtde_c.moveL(P1, 3, 1)
+                    # Move back up after using air
+                    P1[2] += .25
+                    rtde_c.moveL(P1, 3, 1)
         
             
-        # Move to sponge position and use sponge to clean the sample
-        if robot.robot_online(rtde_r) == 'False':
-            continuation = input("Robot Offline! If you want to continue, reconnect and press ENTER")
-        rtde_c.moveL(sponge_position, 3, 1)
-        degradation.use_sponge(rtde_c, rtde_r, rtde_io)
+                # Move to sponge position and use sponge to clean the sample
+                if robot.robot_online(rtde_r) == 'False':
+                    continuation = input("Robot Offline! If you want to continue, reconnect and press ENTER")
+                planner.transit(sponge_position)
+                degradation.use_sponge(rtde_c, rtde_r, rtde_io)
+                report("dried", sample=n)
             
-        # Move to scale position to measure the sample
-        rtde_c.moveL(scale_position, 3, 1)
-        degradation.photo_stand(n, cycle_number, rtde_c, rtde_r, rtde_io, photo_dir)
+                # Move to scale position to measure the sample
+                planner.transit(scale_position)
+                photos = degradation.photo_stand(n, cycle_number, rtde_c, rtde_r, rtde_io, photo_dir, writer)
+                report("photos", sample=n, files=photos)
             
-        # Measure the weight of the sample on the scale
-        rtde_c.moveL(scale_position, 3, 1)
-        degradation.use_scale(n, cycle_number, SAMPLE, rtde_c, rtde_r, rtde_io, balance, remote, photo_dir)
-
-        # Add timestamp and temperature measurement for the sample
-        SAMPLE[n].data.append(time.strftime('%H:%M:%S | %Y-%m-%d', time.localtime()))
-        temperature = environment.arduino(b'TEMPERATURE')
-        while len(temperature.split()) < 5:  # Ensure temperature is valid
-            temperature = environment.arduino(b'TEMPERATURE')
-            time.sleep(1)
-        SAMPLE[n].data.append(temperature.split()[4])  # Append temperature data
-
-        # Execution loop
-        if choice == 1:
-            print("Running 'Remove sample to external tray'...")
-            degradation.replace_sample_out(rtde_c, rtde_r, rtde_io, PD, initial_position)
+                # Measure the weight of the sample on the scale
+                planner.transit(scale_position)
+                scale_photos = degradation.use_scale(n, cycle_number, SAMPLE, rtde_c, rtde_r, rtde_io, balance, remote, photo_dir, writer, overlap)
+
+                # Add timestamp of the test; its temperature is looked up in the telemetry buffer after the return
+                time_of_test = time.time()
+                SAMPLE[n].data.append(time.strftime('%H:%M:%S | %Y-%m-%d', time.localtime(time_of_test)))
+                report("weighed", sample=n, measurements=SAMPLE[n].data[:3], average=SAMPLE[n].data[3],
+                       time_of_test=SAMPLE[n].data[4], files=scale_photos, unstable=SAMPLE[n].unstable)
+
+                # Execution loop
+                if choice == 1:
+                    print("Running 'Remove sample to external tray'...")
+                    degradation.replace_sample_out(rtde_c, rtde_r, rtde_io, PD, initial_position, planner)
                 
-        elif choice == 2:
-            print("Running 'Insert sample into water bath'...")
-            degradation.replace_sample_in(rtde_c, rtde_r, rtde_io, P0)
+                elif choice == 2:
+                    print("Running 'Insert sample into water bath'...")
+                    degradation.replace_sample_in(rtde_c, rtde_r, rtde_io, P0, planner)
+
+                sample_temperature = sampler.value_at(setup, time_of_test)
+                if sample_temperature is None:  # No valid reading in the buffer yet
+                    sample_temperature = float(environment.read_temperature())
+                SAMPLE[n].data.append(f"{sample_temperature:.2f}")  # Append temperature data
+                report("returned", sample=n, temperature=SAMPLE[n].data[5])
+            except gripper.GripperTimeout as error:
+                # The gripper stopped answering partway through the sample: put it back and go on
+                print(f"Sample {n}: {error}. Returning the sample to its slot.")
+                released = degradation.release_sample(targets.pick_pose(n), rtde_c, rtde_r, rtde_io, planner)
+                report("gripper_timeout", sample=n, released=released)
+                if not released:
+                    raise
                 
-        # >>> RETURN AND REPEAT
-        # After completing the cycle for all samples, proceed to save and repeat the cycle
-
-        # Index and save data every cycle
-    CSV = []
-    for n in SAMPLE.keys():
-        if SAMPLE[n].data == []:
-            pass
-        else:
-            row = [SAMPLE[n].id]
-            for value in SAMPLE[n].data:
-                row.append(value)
-            CSV.append(row)
-
-    # Save CSV file with the collected data
-    with open(csv_file, 'w') as csvfile:
-        # Create a csv writer object
-        csv_writer = csv.writer(csvfile)
-        # Write header (fields)
-        csv_writer.writerow(fields)
-        # Write data rows
-        for row in CSV:
-            csv_writer.writerow(row)
-
-        # Replace the lid and move to the next cycle
-    rtde_c.moveL(lid_position, 3, 1)
-    degradation.move_lid("on", rtde_c, rtde_r, rtde_io)
+            # >>> RETURN AND REPEAT
+            # After completing the cycle for all samples, proceed to save and repeat the cycle
+
+            # Index and save data every cycle
+        tracing.set_context(sample=None)
+        overlap.sync()
+        CSV = []
+        for n in SAMPLE.keys():
+            if SAMPLE[n].data == []:
+                pass
+            else:
+                row = [SAMPLE[n].id]
+                for value in SAMPLE[n].data:
+                    row.append(value)
+                CSV.append(row)
+
+        # Save CSV file with the collected data
+        with open(csv_file, 'w') as csvfile:
+            # Create a csv writer object
+            csv_writer = csv.writer(csvfile)
+            # Write header (fields)
+            csv_writer.writerow(fields)
+            # Write data rows
+            for row in CSV:
+                csv_writer.writerow(row)
+
+            # Replace the lid and move to the next cycle
+        planner.transit(lid_position)
+        degradation.move_lid("on", rtde_c, rtde_r, rtde_io, setup)
+
+        # Photos are checked only once the results are saved and the bath is covered: a missing frame is a warning
+        photo_errors = []
+        try:
+            writer.flush()
+        except IOError as e:
+            photo_errors.append(str(e))
+            print(f"Warning: {e}")
+        report("measured", csv_file=csv_file, photo_errors=photo_errors)
+    finally:
+        # Also on a failed cycle, so no writer or overlap threads are left behind
+        try:
+            overlap.close()
+        finally:
+            try:
+                writer.close()
+            except IOError as e:
+                print(f"Warning: {e}")
 
         # Log temperature during the cycle
-    with open(temperature_registry, 'a') as f:
-        while True:
-            if robot.robot_online(rtde_r) == 'False':
-                continuation = input("Robot Offline! If you want to continue, reconnect and press Enter")
-                
-            # Log temperature data every 10 minutes
-            current_time = int(time.strftime('%H%M', time.localtime()))
-            if current_time % 10 == 0 and current_time != prev_time:
-                temperature = environment.arduino(b'TEMPERATURE')
-                while len(temperature.split()) < 5:  # Ensure temperature is valid
-                    temperature = environment.arduino(b'TEMPERATURE')
-                    time.sleep(1)
-                f.write(str(time.strftime('%m/%d, %H:%M:%S', time.localtime())+', '+temperature.split()[4]) + '\n')
-                prev_time = current_time
-                time.sleep(1)
-                
-                # Check if it is time to break the cycle
-            if time.strftime('%H%M', time.localtime()) == time_delay:
-                break
-            time.sleep(1)
+    registry_every = telemetry.get("registry_every", 600)
+    def log_temperature():
+        if robot.robot_online(rtde_r) == 'False':
+            continuation = input("Robot Offline! If you want to continue, reconnect and press Enter")
+        write_registry(temperature_registry, sampler, setup, registry_every)
+
+    # Hold the robot until the next cycle of this bath is due; the registry gets the 10-minute averages of the buffer
+    next_cycle = scheduler.from_wall_time(command_data.get("next_cycle_at", time.time()))
+    with tracing.span("wait_next_cycle", "sleep"):
+        scheduler.wait_until(next_cycle, log_temperature, every=registry_every)
+    tracing.disable()
                 
     print("_Closing lid...")
-    is_busy = False
-        
-def process_queue():
-    """
-    Process commands from the queue.
+
+# WORKER
+
+_STOP = object()  # Sentinel that tells the worker thread to exit
+
+class CommandWorker:
     """
-    while True:
-        if not command_queue.empty() and not is_busy:
-            command = command_queue.get()
-            print(f"Executing command: {command}")
+    Runs queued commands one at a time on a background thread.
 
-            execute_command(command)
-            command_queue.task_done()
+    The thread waits on a condition variable while idle, so it costs no CPU between cycles.
+    The queue, the busy flag and the current command are guarded by that condition
+    so client handlers can read a consistent snapshot from any thread.
 
-def handle_client(conn, addr):
+    Args:
+    - handler: Callable that executes a single command (normally execute_command).
+               It is called as handler(command, report), where report(event, **fields)
+               forwards a progress event to whoever submitted the command.
     """
-    Handle incoming commands from a client.
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._queue = queue.Queue()
+        self._state = threading.Condition()
+        self._busy = False
+        self._current = None
+        self._accepting = True
+        self._thread = None
+
+    def start(self):
+        """Start the worker thread."""
+        self._thread = threading.Thread(target=self._run, name="command-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, command, sink=None):
+        """
+        Queue a command for execution.
+
+        Args:
+        - command: Command data received from the client.
+        - sink: Optional callable that receives each progress event (a dict) of this command.
+                It is called from the worker thread and must not block.
+
+        Returns:
+        - dict: Response for the client ("accepted", "busy" or "error").
+        """
+        with self._state:
+            if not self._accepting:
+                return {"status": "error", "message": "Listener is shutting down."}
+            # Decide and enqueue under the lock so two clients never both get "accepted"
+            busy = self._busy or not self._queue.empty()
+            self._queue.put((command, sink))
+            self._state.notify_all()
+        if busy:
+            return {"status": "busy", "message": "Robot is busy. Command queued."}
+        return {"status": "accepted", "message": "Command accepted. Executing."}
+
+    def status(self):
+        """Return a snapshot of the worker state."""
+        with self._state:
+            current = self._current
+            if isinstance(current, dict):
+                # Report the sample count rather than echoing the whole plan to every poller
+                current = {key: value for key, value in current.items() if key != "samples"}
+                current["samples"] = len(self._current.get("samples") or [])
+            return {
+                "status": "busy" if self._busy else "idle",
+                "current": current,
+                "queued": self._queue.qsize(),
+            }
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until the queue is empty and no command is running.
+
+        Returns:
+        - bool: False if the timeout expired first.
+        """
+        with self._state:
+            return self._state.wait_for(lambda: not self._busy and self._queue.empty(), timeout)
+
+    def shutdown(self, drain=True, timeout=None):
+        """
+        Stop accepting commands and stop the worker thread.
+
+        Args:
+        - drain: If True, queued commands are executed before the thread exits.
+                 If False, they are discarded and only the running command finishes.
+        - timeout: Maximum time in seconds to wait for the thread.
+        """
+        with self._state:
+            self._accepting = False
+            if not drain:
+                while True:
+                    try:
+                        self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self._queue.task_done()
+            self._queue.put(_STOP)
+            self._state.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._state:
+                # Dequeue and mark busy under one lock, so no client sees an idle worker with an empty queue
+                # while a command is being taken (the wait releases the lock while idle)
+                self._state.wait_for(lambda: not self._queue.empty())
+                item = self._queue.get_nowait()
+                if item is not _STOP:
+                    self._busy = True
+                    self._current = item[0]
+            if item is _STOP:
+                self._queue.task_done()
+                break
+            command, sink = item
+            report = self._reporter(command, sink)
+            try:
+                print(f"Executing command: {command}")
+                report("started")
+                self.handler(command, report)
+                report("completed")
+            except Exception as e:
+                # A failed cycle must not kill the worker; later commands still run
+                print("Error while executing command:", e)
+                traceback.print_exc()
+                report("failed", message=str(e))
+            finally:
+                tracing.disable()  # A failed cycle must not leave its trace file open
+                with self._state:
+                    self._busy = False
+                    self._current = None
+                    self._state.notify_all()
+                self._queue.task_done()
+
+    @staticmethod
+    def _reporter(command, sink):
+        """Build the report(event, **fields) callable passed to the handler."""
+        def report(event, **fields):
+            if sink is None:
+                return
+            message = {
+                "event": event,
+                "time": time.time(),
+                "setup": command.get("setup"),
+                "cycle": command.get("cycle_number"),
+            }
+            message.update(fields)
+            try:
+                sink(message)
+            except Exception as e:
+                # Losing the monitoring client must not stop the experiment
+                print("Error while reporting progress:", e)
+        return report
+
+# SERVER
+
+async def send_message(writer, message):
     """
-    print(f"Connected by {addr}")
-    while True:
-        data = conn.recv(1024).decode()
-        if not data:
-            break
+    Send one JSON line to a client.
 
-        try:
-            # Parse the incoming JSON data
-            command_data = json.loads(data)
-            print(f"Received command: {command_data}")
+    drain() suspends the handler while the client's socket buffer is full, so a
+    slow reader throttles only its own connection.
+    """
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
 
-            if is_busy:
-                response = {"status": "busy", "message": "Robot is busy. Command queued."}
-                command_queue.put(command_data)
-            else:
-                response = {"status": "accepted", "message": "Command accepted. Executing."}
-                command_queue.put(command_data)
+async def send_messages(writer, outgoing):
+    """Write queued messages to a client until None is queued."""
+    while True:
+        message = await outgoing.get()
+        if message is None:
+            break
+        await send_message(writer, message)
 
-            # Send a JSON response back to the client
-            conn.sendall(json.dumps(response).encode())
-        except json.JSONDecodeError:
-            response = {"status": "error", "message": "Invalid JSON format."}
-            conn.sendall(json.dumps(response).encode())
-    conn.close()
+async def handle_client(reader, writer):
+    """
+    Handle incoming commands from a client.
 
+    Each line received is one JSON command, so payloads of any size up to
+    MAX_LINE are accepted regardless of how TCP splits them. Replies and the
+    progress events of the commands submitted on this connection share one
+    outgoing queue of MAX_OUTGOING messages, drained by a single sender task.
 
+    While the queue is full, the next command is not read until its reply fits,
+    so a client that does not read its replies throttles only itself. Progress
+    events cannot wait (they come from the worker thread), so they are dropped
+    and the next event that fits carries the number lost as "dropped".
+    """
+    addr = writer.get_extra_info("peername")
+    print(f"Connected by {addr}")
+    loop = asyncio.get_running_loop()
+    outgoing = asyncio.Queue(maxsize=MAX_OUTGOING)
+    sender = asyncio.create_task(send_messages(writer, outgoing))
+    connected = True
+    dropped = 0
+
+    def post_event(message):
+        # Runs on the event loop
+        nonlocal dropped
+        if outgoing.full():
+            dropped += 1
+            return
+        if dropped:
+            message = dict(message, dropped=dropped)
+            dropped = 0
+        outgoing.put_nowait(message)
+
+    def sink(message):
+        # Called from the worker thread; hand the event over to the event loop
+        if connected:
+            loop.call_soon_threadsafe(post_event, message)
+
+    async def reply(message):
+        # Waits for room in the queue, unless the sender stopped (client gone)
+        put = asyncio.ensure_future(outgoing.put(message))
+        await asyncio.wait({put, sender}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            raise ConnectionError("Client connection lost")
+
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                # The line exceeded the reader limit; the stream cannot be resynchronised
+                await reply({"status": "error", "message": f"Command exceeds {MAX_LINE} bytes."})
+                break
+            if not line:
+                break
+            if not line.strip():
+                continue
+
+            try:
+                # Parse the incoming JSON data
+                command_data = json.loads(line)
+                if not isinstance(command_data, dict):
+                    raise json.JSONDecodeError("Expected a JSON object", line.decode(errors="replace"), 0)
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                response = {"status": "error", "message": "Invalid JSON format."}
+            else:
+                print(f"Received command: {command_data}")
+                if command_data.get("type") == "status":
+                    response = worker.status()
+                else:
+                    response = worker.submit(command_data, sink)
+
+            # Send a JSON response back to the client (waits while the outgoing queue is full)
+            await reply(response)
+    except ConnectionError:
+        pass
+    finally:
+        connected = False
+        try:
+            outgoing.put_nowait(None)
+        except asyncio.QueueFull:
+            sender.cancel()  # The client stopped reading; drop what is still queued
+        try:
+            await sender
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+        print(f"Disconnected {addr}")
 
-def start_server():
+async def start_server():
     """
-    Start a socket server to listen for incoming commands.
+    Start an asyncio server to listen for incoming commands.
     """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.bind(('0.0.0.0', PORT))
-        s.listen()
-        print(f"Listening for commands on port {PORT}...")
+    server = await asyncio.start_server(handle_client, '0.0.0.0', PORT, limit=MAX_LINE)
+    print(f"Listening for commands on port {PORT}...")
+    async with server:
+        await server.serve_forever()
 
-        while True:
-            conn, addr = s.accept()
-            client_thread = threading.Thread(target=handle_client, args=(conn, addr))
-            client_thread.start()
+worker = CommandWorker(execute_command)
 
 if __name__ == "__main__":
-    # Start the queue processing thread
-    queue_thread = threading.Thread(target=process_queue, daemon=True)
-    queue_thread.start()
+    # Start the command worker thread
+    worker.start()
 
     # Start the server to listen for commands
-    start_server()
\ No newline at end of file
+    try:
+        asyncio.run(start_server())
+    except KeyboardInterrupt:
+        print(f"Shutting down, draining {worker.status()['queued']} queued command(s)...")
+        worker.shutdown(drain=True)
+        robot.close_sessions()
+        environment.stop_cameras()
+        environment.stop_temperature_sampler()
+        environment.close_devices()
@@ -3,19 +3,77 @@
 # BS. 11.04.25                 #
 # ---------------------------- #
 
-from rtde_control import RTDEControlInterface as RTDEControl
-from rtde_receive import RTDEReceiveInterface as RTDEReceive
-from rtde_io import RTDEIOInterface as RTDEIO
+try:
+    from rtde_control import RTDEControlInterface as RTDEControl
+    from rtde_receive import RTDEReceiveInterface as RTDEReceive
+    from rtde_io import RTDEIOInterface as RTDEIO
+except ImportError:
+    # ur_rtde is only needed for the real robot; the simulated backend works without it
+    RTDEControl = RTDEReceive = RTDEIO = None
 
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import simulator
+import tracing
+
+# Control interface calls recorded as "motion" spans when tracing is enabled (see tracing.instrument())
+MOTION_METHODS = ("moveL", "moveJ", "moveUntilContact", "stopL", "stopJ")
 
 # 1. ROBOT CONNECTION 
-def connect_robot(robot_ip):
+def _open_interfaces(robot_ip, backend="rtde"):
+    """
+    Opens the control, receive and IO interfaces concurrently.
+
+    Args:
+    - robot_ip
+    - backend: "rtde" for the real robot or "sim" for the simulated UR10e ("fake" is accepted too).
+
+    Returns:
+    - tuple: rtde_c, rtde_r, rtde_io.
+    """
+    if backend in ("sim", "fake"):
+        return simulator.connect(robot_ip)
+    if backend != "rtde":
+        raise ValueError(f"Unknown robot backend: {backend}")
+    if RTDEControl is None:
+        raise ImportError("ur_rtde is not installed. Install it or use the 'sim' backend.")
+
+    # The three handshakes are independent, so open them in parallel
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = {
+            "control": pool.submit(RTDEControl, robot_ip, 500.0, RTDEControl.FLAG_USE_EXT_UR_CAP),
+            "receive": pool.submit(RTDEReceive, robot_ip),
+            "IO": pool.submit(RTDEIO, robot_ip),
+        }
+        interfaces = {}
+        error = None
+        for name, future in futures.items():
+            try:
+                interfaces[name] = future.result()
+                print(f"Connection to {name} interface established.")
+            except Exception as e:
+                error = error or e
+
+    if error is not None:
+        # Do not leak the sessions that did connect
+        for interface in interfaces.values():
+            try:
+                interface.disconnect()
+            except Exception:
+                pass
+        raise error
+
+    return interfaces["control"], interfaces["receive"], interfaces["IO"]
+
+def connect_robot(robot_ip, backend="rtde"):
     """
     Connects to the robot using RTDE interfaces for control, receive, and IO.
 
     Args:
     - robot_ip
+    - backend: "rtde" for the real robot or "sim" for the simulated UR10e ("fake" is accepted too).
     
     Returns:
     - tuple: rtde_c (RTDE control interface), rtde_r (RTDE receive interface), rtde_io (RTDE IO interface).
@@ -24,17 +82,7 @@ def connect_robot(robot_ip):
     - Exception: If any of the interfaces fail to connect.
     """
     try:
-        # Connect to RTDE Control interface
-        rtde_c = RTDEControl(robot_ip, 500.0, RTDEControl.FLAG_USE_EXT_UR_CAP)
-        print("Connection to control interface established.")
-
-        # Connect to RTDE Receive interface
-        rtde_r = RTDEReceive(robot_ip)
-        print("Connection to receive interface established.")
-
-        # Connect to RTDE IO interface
-        rtde_io = RTDEIO(robot_ip)
-        print("Connection to IO interface established.")
+        rtde_c, rtde_r, rtde_io = _open_interfaces(robot_ip, backend)
 
         # Optionally, retrieve and print the current joint positions
         current_pos = rtde_r.getActualQ()
@@ -46,7 +94,114 @@ def connect_robot(robot_ip):
         print("Error while connecting to the robot:", e)
         raise
 
+class RobotSession:
+    """
+    Long-lived RTDE session shared by every cycle.
+
+    The interfaces are opened once and reused. Each call to interfaces() checks
+    their health and reconnects the ones that dropped, so the control script is
+    only uploaded again when the connection was actually lost.
+
+    Args:
+    - robot_ip
+    - backend: "rtde" for the real robot or "sim" for the simulated UR10e ("fake" is accepted too).
+    """
+
+    def __init__(self, robot_ip, backend="rtde"):
+        self.robot_ip = robot_ip
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._interfaces = None
+
+    def interfaces(self):
+        """
+        Returns healthy interfaces, connecting or reconnecting if needed.
+
+        Returns:
+        - tuple: rtde_c, rtde_r, rtde_io.
+        """
+        with self._lock:
+            if self._interfaces is None:
+                self._interfaces = connect_robot(self.robot_ip, self.backend)
+            elif not self._healthy():
+                self._reconnect()
+            return self._interfaces
+
+    def healthy(self):
+        """Returns True if all interfaces are connected."""
+        with self._lock:
+            return self._interfaces is not None and self._healthy()
+
+    def close(self):
+        """Stops the control script and disconnects all interfaces."""
+        with self._lock:
+            if self._interfaces is None:
+                return
+            rtde_c, rtde_r, rtde_io = self._interfaces
+            self._interfaces = None
+            for action in (rtde_c.stopScript, rtde_c.disconnect, rtde_r.disconnect, rtde_io.disconnect):
+                try:
+                    action()
+                except Exception as e:
+                    print("Error while closing robot session:", e)
+
+    def _healthy(self):
+        rtde_c, rtde_r, rtde_io = self._interfaces
+        # RTDEIOInterface has no isConnected(); it reconnects on its own when a call fails
+        return rtde_c.isConnected() and rtde_r.isConnected()
+
+    def _reconnect(self):
+        rtde_c, rtde_r, rtde_io = self._interfaces
+        print("Robot session lost, reconnecting...")
+        try:
+            for interface in (rtde_c, rtde_r):
+                if not interface.isConnected():
+                    interface.reconnect()
+            rtde_io.reconnect()
+        except Exception as e:
+            # Fall back to fresh interfaces if an in-place reconnect is refused
+            print("Reconnect failed, opening new interfaces:", e)
+            self._interfaces = None
+            for interface in (rtde_c, rtde_r, rtde_io):
+                try:
+                    interface.disconnect()
+                except Exception:
+                    pass
+            self._interfaces = connect_robot(self.robot_ip, self.backend)
+
+    def __enter__(self):
+        return self.interfaces()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+def get_session(robot_ip, backend="rtde"):
+    """
+    Returns the shared session for a robot, creating it on first use.
+
+    Args:
+    - robot_ip
+    - backend: "rtde" for the real robot or "sim" for the simulated UR10e ("fake" is accepted too).
+    """
+    with _sessions_lock:
+        key = (robot_ip, backend)
+        if key not in _sessions:
+            _sessions[key] = RobotSession(robot_ip, backend)
+        return _sessions[key]
+
+def close_sessions():
+    """Closes every shared session."""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
 # 2. SET POSITION
+@tracing.traced()
 def set_initial_position(rtde_c, setup):
     """
     Moves the robot to the specified initial position before performing any actions.
@@ -70,10 +225,272 @@ def set_initial_position(rtde_c, setup):
     rtde_c.moveJ(positions[setup])  # Use moveJ for joint space movement
 
     # Optional: Wait a short time for the robot to reach the position
-    time.sleep(1)
+    tracing.sleep(1)
     print(f"Robot moved to Setup {setup}.")
 
 # 3. ROBOT ONLINE
 def robot_online(rtde_r):
     return not (not rtde_r.isConnected() or rtde_r.isProtectiveStopped() or rtde_r.isEmergencyStopped())
 
+
+# 4. BLENDED PATHS
+class Path:
+    """
+    Builds a sequence of waypoints that the robot follows as one blended motion.
+
+    Separate moveL calls stop at every waypoint. A path is sent as a single
+    command using the RTDE path form ([x, y, z, rx, ry, rz, speed, acceleration,
+    blend] per waypoint), so the arm only slows down where the blend radius
+    requires it.
+
+    Blend radii are clamped to half of the shorter neighbouring segment so that
+    consecutive blends never overlap, and the last waypoint always has blend 0.
+
+    Args:
+    - start: Pose (or joint positions for joint=True) the path starts from.
+    - speed, acceleration: Defaults for the waypoints.
+    - blend: Default blend radius in metres.
+    - joint: If True the waypoints are joint positions and the path runs with moveJ.
+             The blend radius then refers to the TCP, so keep it 0 for pure wrist turns.
+    """
+
+    def __init__(self, start, speed=0.25, acceleration=1.2, blend=0.0, joint=False):
+        self.start = list(start[:6])
+        self.speed = speed
+        self.acceleration = acceleration
+        self.blend = blend
+        self.joint = joint
+        self._waypoints = []  # [target, speed, acceleration, blend]
+
+    def to(self, target, speed=None, acceleration=None, blend=None):
+        """Adds an absolute waypoint. Returns the path so calls can be chained."""
+        self._waypoints.append([
+            list(target[:6]),
+            self.speed if speed is None else speed,
+            self.acceleration if acceleration is None else acceleration,
+            self.blend if blend is None else blend,
+        ])
+        return self
+
+    def offset(self, dx=0.0, dy=0.0, dz=0.0, speed=None, acceleration=None, blend=None):
+        """Adds a waypoint relative to the previous one (metres, or radians on the first three joints)."""
+        target = list(self.end())
+        target[0] += dx
+        target[1] += dy
+        target[2] += dz
+        return self.to(target, speed, acceleration, blend)
+
+    def rotate(self, joint, angle, speed=None, acceleration=None, blend=None):
+        """Adds a joint-path waypoint that turns one joint by angle radians."""
+        if not self.joint:
+            raise ValueError("rotate() is only available on joint paths")
+        target = list(self.end())
+        target[joint] += angle
+        return self.to(target, speed, acceleration, blend)
+
+    def end(self):
+        """Returns the last target of the path."""
+        return self._waypoints[-1][0] if self._waypoints else self.start
+
+    def waypoints(self):
+        """
+        Returns the waypoints in RTDE path form with clamped blend radii.
+        """
+        points = [self.start] + [waypoint[0] for waypoint in self._waypoints]
+        lengths = [sum((b - a) ** 2 for a, b in zip(p[:3], q[:3])) ** 0.5 for p, q in zip(points, points[1:])]
+        path = []
+        for i, (target, speed, acceleration, blend) in enumerate(self._waypoints):
+            if i == len(self._waypoints) - 1:
+                blend = 0.0
+            elif not self.joint:
+                blend = min(blend, 0.5 * lengths[i], 0.5 * lengths[i + 1])
+            path.append(target + [speed, acceleration, blend])
+        return path
+
+    def run(self, rtde_c, asynchronous=False):
+        """
+        Sends the path to the robot as one command.
+        """
+        if not self._waypoints:
+            return True
+        move = rtde_c.moveJ if self.joint else rtde_c.moveL
+        return move(self.waypoints(), asynchronous)
+
+
+# 5. JOINT-SPACE TRANSITS
+class TransitPlanner:
+    """
+    Moves between stations in joint space using cached inverse kinematics.
+
+    Long Cartesian moves (moveL) are slow and fail near singularities. The
+    planner solves the IK of each station once (getInverseKinematics, seeded
+    with the previous solution so every station uses the same arm
+    configuration) and reaches it with a blended moveJ. Final approaches,
+    descents and contacts stay Cartesian moveL calls in the callers.
+
+    Only the fixed stations given to precompute() are cached. Other targets, such
+    as poses built from the current TCP pose, never repeat exactly, so their IK is
+    solved on every transit instead of filling the cache.
+
+    If a pose has no IK solution the transit falls back to moveL.
+
+    Args:
+    - rtde_c, rtde_r: RTDE control and receive interfaces.
+    - speed, acceleration: Joint speed (rad/s) and acceleration (rad/s^2) of the transits.
+    - blend: Blend radius (m) at the via points of a transit.
+    - fallback_speed, fallback_acceleration: Parameters of the moveL fallback.
+    """
+
+    def __init__(self, rtde_c, rtde_r, speed=3, acceleration=1, blend=0.05, fallback_speed=3, fallback_acceleration=1):
+        self.rtde_c = rtde_c
+        self.rtde_r = rtde_r
+        self.speed = speed
+        self.acceleration = acceleration
+        self.blend = blend
+        self.fallback_speed = fallback_speed
+        self.fallback_acceleration = fallback_acceleration
+        self.solutions = {}  # Rounded station pose -> joint positions, or None if unreachable
+        self._seed = None
+
+    @staticmethod
+    def _key(pose):
+        return tuple(round(value, 5) for value in pose[:6])
+
+    def ik(self, pose, qnear=None, cache=True):
+        """
+        Returns the cached joint positions for pose, or solves them.
+
+        Args:
+        - cache: Keep the solution for the next transits (fixed stations only).
+
+        Returns:
+        - list or None: Joint positions, or None if the controller found no solution.
+        """
+        key = self._key(pose)
+        if key in self.solutions:
+            return self.solutions[key]
+        if qnear is None:
+            qnear = self._seed if self._seed is not None else self.rtde_r.getActualQ()
+        try:
+            q = self.rtde_c.getInverseKinematics(list(pose[:6]), list(qnear))
+        except RuntimeError:
+            q = None
+        q = list(q) if q is not None and len(q) == 6 else None
+        if cache:
+            self.solutions[key] = q
+        if q is not None:
+            self._seed = q
+        return q
+
+    def precompute(self, poses):
+        """
+        Solves the IK of a list of poses (stations, grid table), each seeded with the previous solution.
+
+        Returns:
+        - int: Number of poses without a solution.
+        """
+        return sum(self.ik(pose) is None for pose in poses)
+
+    @tracing.traced(category="motion")
+    def transit(self, target, via=(), asynchronous=False):
+        """
+        Moves to target in joint space, blending through the via poses.
+
+        Args:
+        - target: Final TCP pose of the transit.
+        - via: Intermediate TCP poses passed with the blend radius.
+        - asynchronous: Return as soon as the motion is started.
+        """
+        poses = list(via) + [target]
+        joints = [self.ik(pose, cache=False) for pose in poses]  # Cached if precomputed
+        if any(q is None for q in joints):
+            # No IK solution for some pose: keep the Cartesian path
+            path = Path(self.rtde_r.getActualTCPPose(), self.fallback_speed, self.fallback_acceleration, self.blend)
+            for pose in poses:
+                path.to(pose)
+            return path.run(self.rtde_c, asynchronous)
+
+        path = Path(self.rtde_r.getActualQ(), self.speed, self.acceleration, self.blend, joint=True)
+        for q in joints:
+            path.to(q)
+        return path.run(self.rtde_c, asynchronous)
+
+
+# 6. ASYNCHRONOUS MOTION
+class Overlap:
+    """
+    Runs independent device calls while the arm is moving.
+
+    With enabled=True, motions are started with the RTDE asynchronous flag and
+    return at once, and background() runs device calls (tare, temperature
+    reads, ...) on worker threads. sync() is the explicit sync point: it waits
+    until the arm has stopped. A new motion always syncs first, because a move
+    command replaces the one still running on the controller.
+
+    With enabled=False everything runs in order, exactly as plain calls.
+
+    Args:
+    - rtde_c: RTDE control interface.
+    - enabled: Overlap motion and device calls.
+    - workers: Threads for the background calls.
+    - timeout: Maximum seconds sync() waits for the arm.
+    """
+
+    POLL_PERIOD = 0.002
+
+    def __init__(self, rtde_c, enabled=False, workers=2, timeout=60.0):
+        self.rtde_c = rtde_c
+        self.enabled = enabled
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="overlap") if enabled else None
+
+    def motion(self, move, *args, **kwargs):
+        """
+        Starts a motion, e.g. motion(rtde_c.moveL, pose, 3, 1), motion(path.run, rtde_c)
+        or motion(planner.transit, pose). The callable must accept an asynchronous keyword.
+        """
+        if not self.enabled:
+            return move(*args, **kwargs)
+        self.sync()
+        return move(*args, asynchronous=True, **kwargs)
+
+    def background(self, function, *args, **kwargs):
+        """
+        Runs a device call while the arm moves.
+
+        Returns:
+        - Future: Call result() at the point where the value is needed.
+        """
+        if self.enabled:
+            return self._executor.submit(function, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(function(*args, **kwargs))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    def sync(self):
+        """
+        Waits until the asynchronous motion has finished.
+
+        Raises:
+        - TimeoutError: If the arm is still moving after the timeout.
+        """
+        if not self.enabled:
+            return
+        with tracing.span("sync", "motion"):
+            deadline = time.monotonic() + self.timeout
+            while self.rtde_c.getAsyncOperationProgress() >= 0:
+                if time.monotonic() >= deadline:
+                    self.rtde_c.stopL()
+                    raise TimeoutError(f"Asynchronous motion still running after {self.timeout} s")
+                time.sleep(self.POLL_PERIOD)
+
+    def close(self):
+        """Waits for the running motion and background calls to finish (the threads stop even if sync() fails)."""
+        try:
+            self.sync()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
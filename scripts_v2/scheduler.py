@@ -0,0 +1,104 @@
+# ------------------------------------------ #
+# CYCLE SCHEDULING FOR UR ROBOT DEGRADATION  #
+# ------------------------------------------ #
+
+import time
+
+# 1. CYCLE SCHEDULER
+class CycleScheduler:
+    """
+    Computes cycle start deadlines anchored to the start of the experiment.
+
+    Cycle k is due at start + k * interval on the monotonic clock, so the time a
+    cycle takes never shifts the following ones, changes to the wall clock (NTP,
+    daylight saving) do not affect the schedule, and intervals of a day or more
+    work like any other.
+
+    Args:
+    - interval: Time between cycle starts in seconds.
+    - start: Monotonic time of cycle 0. Defaults to now.
+    """
+
+    def __init__(self, interval, start=None):
+        if interval <= 0:
+            raise ValueError("The cycle interval must be positive.")
+        self.interval = interval
+        self.start = time.monotonic() if start is None else start
+
+    def deadline(self, index):
+        """Monotonic time at which cycle `index` (0 = first cycle) is due."""
+        return self.start + index * self.interval
+
+    def wall_time(self, index):
+        """Wall-clock time (epoch seconds) at which cycle `index` is due."""
+        return to_wall_time(self.deadline(index))
+
+    def wait(self, index, callback=None, every=None):
+        """
+        Sleeps until cycle `index` is due.
+
+        Args:
+        - index: Cycle index (0 = first cycle).
+        - callback: Optional function called while waiting (e.g. to log the temperature).
+        - every: Seconds between callback calls.
+
+        Returns:
+        - float: Lateness in seconds, i.e. how long after the deadline this returned.
+        """
+        return wait_until(self.deadline(index), callback, every)
+
+# 2. HELPERS
+def interval_from_config(timing):
+    """
+    Returns the cycle interval in seconds from the "timing" block of the config.
+
+    "days_delay" is optional; "hours_delay" may also exceed 24.
+    """
+    return (timing.get("days_delay", 0) * 86400
+            + timing.get("hours_delay", 0) * 3600
+            + timing.get("minutes_delay", 0) * 60)
+
+def to_wall_time(deadline):
+    """Converts a monotonic deadline to epoch seconds."""
+    return time.time() + (deadline - time.monotonic())
+
+def from_wall_time(epoch):
+    """Converts epoch seconds (e.g. received from another process) to a monotonic deadline."""
+    return time.monotonic() + (epoch - time.time())
+
+def wait_until(deadline, callback=None, every=None):
+    """
+    Sleeps until a monotonic deadline.
+
+    The process sleeps for the whole remaining time (or until the next callback)
+    instead of polling, and re-checks the clock after waking in case the sleep
+    ended early.
+
+    Args:
+    - deadline: Monotonic time to wait for.
+    - callback: Optional function called while waiting.
+    - every: Seconds between callback calls.
+
+    Returns:
+    - float: Lateness in seconds (0 or more).
+    """
+    next_call = time.monotonic() if callback is not None and every else None
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            return now - deadline
+        if next_call is not None and now >= next_call:
+            callback()
+            next_call = now + every
+            continue
+        wake = deadline if next_call is None else min(deadline, next_call)
+        time.sleep(wake - now)
+
+def format_duration(seconds):
+    """Formats a duration in seconds as e.g. '1d 02:30:00'."""
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    text = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+    return f"{days}d {text}" if days else text
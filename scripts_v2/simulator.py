@@ -0,0 +1,489 @@
+# ------------------------------------------ #
+# SIMULATED UR10e BACKEND FOR OFFLINE RUNS   #
+# ------------------------------------------ #
+
+import copy
+import math
+import random
+import threading
+import time
+
+import numpy as np
+
+# UR10e Denavit-Hartenberg parameters (m, rad)
+DH_D = [0.1807, 0, 0, 0.17415, 0.11985, 0.11655]
+DH_A = [0, -0.6127, -0.57155, 0, 0, 0]
+DH_ALPHA = [math.pi / 2, 0, 0, math.pi / 2, -math.pi / 2, 0]
+TCP_OFFSET = 0.2  # Distance (m) from the flange to the gripper TCP along the tool Z axis
+
+# Joint positions used when the simulated robot is created (setup 1 home position)
+HOME_Q = [1.7239642143249512, -2.054093977014059, -0.8874862194061279, -1.7807942829527796, 1.5661470890045166, 1.714949131011963]
+
+# Defaults of every simulated robot; change them with configure()
+SETTINGS = {
+    "time_scale": 1.0,        # 1 = motions take their real duration, 0 = instantaneous, 0.1 = ten times faster
+    "part_width": 3.0,        # Finger width (mm) reported when the gripper closes on a part
+    "miss_rate": 0.0,         # Probability that a close grips nothing (failure injection)
+    "gripper_speed": 50.0,    # Finger speed (mm/s)
+    "gripper_delay": 0.1,     # Fixed time (s) of every gripper command
+    "contact_force": 20.0,    # Force (N) reported after a contact
+    "contact_travel": 0.05,   # Travel (m) of a contact probe that hits no configured surface
+    "contact_bounds": 0.25,   # Half size (m) of the surface created by such a probe
+    "surfaces": [],           # Contact surfaces, e.g. {"name": "table", "axis": "z", "position": 0.1, "bounds": {"x": [0, 1]}}
+    "seed": None,             # Seed of the failure injection
+}
+
+def configure(**settings):
+    """
+    Changes the defaults of the simulated robots created afterwards (see SETTINGS).
+    """
+    unknown = set(settings) - set(SETTINGS)
+    if unknown:
+        raise ValueError(f"Unknown simulator settings: {sorted(unknown)}")
+    SETTINGS.update(settings)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 1. KINEMATICS
+
+def rotvec_to_matrix(rotvec):
+    """Rotation vector (axis * angle) to rotation matrix."""
+    rotvec = np.asarray(rotvec, dtype=float)
+    angle = np.linalg.norm(rotvec)
+    if angle < 1e-12:
+        return np.eye(3)
+    k = rotvec / angle
+    K = np.array([[0, -k[2], k[1]], [k[2], 0, -k[0]], [-k[1], k[0], 0]])
+    return np.eye(3) + math.sin(angle) * K + (1 - math.cos(angle)) * K @ K
+
+def matrix_to_rotvec(R):
+    """Rotation matrix to rotation vector (axis * angle)."""
+    angle = math.acos(max(-1.0, min(1.0, (np.trace(R) - 1) / 2)))
+    if angle < 1e-12:
+        return np.zeros(3)
+    if math.pi - angle < 1e-6:
+        # 180 degrees: the axis is the column of R + I with the largest norm
+        M = (R + np.eye(3)) / 2
+        axis = M[:, np.argmax(np.diag(M))]
+        return axis / np.linalg.norm(axis) * angle
+    axis = np.array([R[2, 1] - R[1, 2], R[0, 2] - R[2, 0], R[1, 0] - R[0, 1]]) / (2 * math.sin(angle))
+    return axis * angle
+
+def _transform(q):
+    T = np.eye(4)
+    for i in range(6):
+        ct, st = math.cos(q[i]), math.sin(q[i])
+        ca, sa = math.cos(DH_ALPHA[i]), math.sin(DH_ALPHA[i])
+        T = T @ np.array([[ct, -st * ca, st * sa, DH_A[i] * ct],
+                          [st, ct * ca, -ct * sa, DH_A[i] * st],
+                          [0, sa, ca, DH_D[i]],
+                          [0, 0, 0, 1]])
+    tool = np.eye(4)
+    tool[2, 3] = TCP_OFFSET
+    return T @ tool
+
+def forward_kinematics(q):
+    """
+    Returns the TCP pose [x, y, z, rx, ry, rz] of joint positions q.
+    """
+    T = _transform(q)
+    return [float(v) for v in T[:3, 3]] + [float(v) for v in matrix_to_rotvec(T[:3, :3])]
+
+def _pose_error(pose, q):
+    T = _transform(q)
+    position = np.asarray(pose[:3]) - T[:3, 3]
+    rotation = matrix_to_rotvec(rotvec_to_matrix(pose[3:6]) @ T[:3, :3].T)
+    return np.concatenate([position, rotation])
+
+def inverse_kinematics(pose, qnear, iterations=100, tolerance=1e-7):
+    """
+    Solves the joint positions of a TCP pose closest to qnear (damped least squares).
+
+    Returns:
+    - list or None: Joint positions, or None if the pose is not reached.
+    """
+    q = np.array(qnear, dtype=float)
+    step = 1e-6
+    for _ in range(iterations):
+        error = _pose_error(pose, q)
+        if np.linalg.norm(error) < tolerance:
+            return [float(v) for v in q]
+        J = np.empty((6, 6))
+        for j in range(6):
+            dq = q.copy()
+            dq[j] += step
+            J[:, j] = (error - _pose_error(pose, dq)) / step
+        q += J.T @ np.linalg.solve(J @ J.T + 1e-4 * np.eye(6), error)
+    return None
+
+def trapezoid_time(distance, speed, acceleration):
+    """
+    Duration of a move of `distance` with a trapezoidal velocity profile
+    (triangular if the speed is never reached).
+    """
+    if distance <= 0:
+        return 0.0
+    if speed * speed / acceleration >= distance:
+        return 2 * math.sqrt(distance / acceleration)
+    return distance / speed + speed / acceleration
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 2. CONTACT SURFACES
+
+AXES = {"x": 0, "y": 1, "z": 2}
+
+class ContactSurface:
+    """
+    Plane perpendicular to a base axis that stops moveUntilContact.
+
+    Args:
+    - axis: "x", "y" or "z".
+    - position: Coordinate (m) of the plane along the axis.
+    - bounds: Optional {"x": [min, max], ...} limits of the plane along the other axes.
+    - name: For inspection.
+    """
+
+    def __init__(self, axis, position, bounds=None, name=None):
+        self.axis = AXES[axis] if isinstance(axis, str) else axis
+        self.position = position
+        self.bounds = {AXES[key] if isinstance(key, str) else key: value for key, value in (bounds or {}).items()}
+        self.name = name
+
+    def distance(self, start, direction):
+        """
+        Returns the travel from start along the unit direction until the plane, or None if it is not hit.
+        """
+        if abs(direction[self.axis]) < 1e-9:
+            return None
+        travel = (self.position - start[self.axis]) / direction[self.axis]
+        if travel < 0:
+            return None
+        point = [start[i] + direction[i] * travel for i in range(3)]
+        for axis, (low, high) in self.bounds.items():
+            if not low <= point[axis] <= high:
+                return None
+        return travel
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 3. SIMULATED ROBOT
+
+class SimulatedRobot:
+    """
+    Shared state of a simulated UR10e.
+
+    The three interface classes below all act on one SimulatedRobot, like the
+    real interfaces act on one arm. Motions take the duration of a trapezoidal
+    velocity profile (multiplied by time_scale); moveJ updates the pose through
+    the UR10e forward kinematics and moveL the joints through the inverse
+    kinematics. moveUntilContact stops at the first contact surface in its way.
+    """
+
+    def __init__(self, robot_ip="sim", **settings):
+        self.robot_ip = robot_ip
+        self.settings = dict(SETTINGS, **settings)
+        self.lock = threading.RLock()
+        self.q = list(HOME_Q)
+        self.pose = forward_kinematics(self.q)
+        self.force = [0.0] * 6
+        self.input_int = {}
+        self.input_double = {}
+        self.output_int = {}
+        self.output_double = {18: 0.0}
+        self.surfaces = [surface if isinstance(surface, ContactSurface) else ContactSurface(**surface)
+                         for surface in self.settings["surfaces"]]
+        self.random = random.Random(self.settings["seed"])
+        self.calls = []          # (method, args) of every command, for inspection
+        self.motion_time = 0.0   # Simulated seconds spent moving
+        self.gripper_time = 0.0  # Simulated seconds spent in gripper commands
+        self.connected = True
+        self.protective_stopped = False
+        self._motion = None      # (thread, cancel event) of the running asynchronous motion
+
+    def record(self, method, *args):
+        with self.lock:
+            self.calls.append((method, copy.deepcopy(args)))
+
+    def protective_stop(self):
+        """Simulates a protective stop: motions are refused until clear_stop()."""
+        self.finish_motion()
+        self.protective_stopped = True
+
+    def clear_stop(self):
+        self.protective_stopped = False
+
+    def wait(self, duration, cancel=None):
+        """Sleeps for a simulated duration scaled by time_scale."""
+        seconds = duration * self.settings["time_scale"]
+        if seconds > 0:
+            if cancel is None:
+                time.sleep(seconds)
+            else:
+                cancel.wait(seconds)
+
+    def run_motion(self, duration, apply, asynchronous=False):
+        """
+        Runs a motion of a simulated duration and applies its final state.
+
+        Returns:
+        - bool: False if the robot is protective stopped.
+        """
+        self.finish_motion()  # A new command replaces the running one
+        if self.protective_stopped:
+            return False
+        self.motion_time += duration
+        if not asynchronous:
+            self.wait(duration)
+            apply()
+            return True
+
+        cancel = threading.Event()
+        def run():
+            self.wait(duration, cancel)
+            apply()
+        thread = threading.Thread(target=run, name="simulated motion", daemon=True)
+        self._motion = (thread, cancel)
+        thread.start()
+        return True
+
+    def finish_motion(self):
+        """Ends the running asynchronous motion at its target."""
+        motion, self._motion = self._motion, None
+        if motion is not None:
+            thread, cancel = motion
+            cancel.set()
+            thread.join()
+
+    def moving(self):
+        return self._motion is not None and self._motion[0].is_alive()
+
+    def set_pose(self, pose):
+        with self.lock:
+            q = inverse_kinematics(pose, self.q)
+            self.pose = list(pose[:6])
+            if q is not None:
+                self.q = q
+
+    def set_q(self, q):
+        with self.lock:
+            self.q = list(q[:6])
+            self.pose = forward_kinematics(self.q)
+
+    def contact_distance(self, start, direction):
+        """
+        Travel until the nearest contact surface. If none is in the way, a surface is
+        created contact_travel ahead, so later probes in the same area touch it again.
+        """
+        hits = [d for d in (surface.distance(start, direction) for surface in self.surfaces) if d is not None]
+        if hits:
+            return min(hits)
+        travel = self.settings["contact_travel"]
+        axis = int(np.argmax(np.abs(direction)))
+        point = [start[i] + direction[i] * travel for i in range(3)]
+        size = self.settings["contact_bounds"]
+        bounds = {i: [point[i] - size, point[i] + size] for i in range(3) if i != axis}
+        surface = ContactSurface(axis, point[axis], bounds, name="implicit")
+        self.surfaces.append(surface)
+        return surface.distance(start, direction)
+
+    def gripper_command(self):
+        """Runs the command written to the gripper registers (see gripper.py)."""
+        target = self.input_double.get(18, 0.0)
+        if target <= 0:
+            target = 0.0 if self.random.random() < self.settings["miss_rate"] else self.settings["part_width"]
+        width = self.output_double.get(18, 0.0)
+        duration = self.settings["gripper_delay"] + abs(target - width) / self.settings["gripper_speed"]
+        self.gripper_time += duration
+        self.output_int[18] = 1
+
+        def finish():
+            self.output_double[18] = target
+            self.output_int[18] = 0
+        # The busy flag stays up for at least a few polls, even when the time is scaled to zero
+        timer = threading.Timer(max(duration * self.settings["time_scale"], 0.005), finish)
+        timer.daemon = True
+        timer.start()
+
+def _path_duration(start, path, distance):
+    """
+    Duration of a path in RTDE path form. Waypoints joined by a blend are
+    timed as one continuous move; the arm only stops where the blend is 0.
+    """
+    total = 0.0
+    length = 0.0
+    previous = start
+    speed, acceleration = path[0][6], path[0][7]
+    for waypoint in path:
+        length += distance(previous, waypoint[:6])
+        previous = waypoint[:6]
+        if waypoint[8] <= 0:
+            total += trapezoid_time(length, speed, acceleration)
+            length = 0.0
+            speed, acceleration = waypoint[6], waypoint[7]
+        else:
+            speed, acceleration = min(speed, waypoint[6]), min(acceleration, waypoint[7])
+    return total + trapezoid_time(length, speed, acceleration)
+
+def _cartesian_distance(a, b):
+    position = math.dist(a[:3], b[:3])
+    rotation = np.linalg.norm(matrix_to_rotvec(rotvec_to_matrix(b[3:6]) @ rotvec_to_matrix(a[3:6]).T))
+    return max(position, rotation)
+
+def _joint_distance(a, b):
+    return max(abs(x - y) for x, y in zip(a[:6], b[:6]))
+
+def _is_path(target):
+    return bool(target) and isinstance(target[0], (list, tuple))
+
+class SimulatedControl:
+    """Stand-in for RTDEControlInterface."""
+
+    def __init__(self, robot):
+        self.robot = robot
+
+    def moveL(self, pose, speed=0.25, acceleration=1.2, asynchronous=False):
+        robot = self.robot
+        robot.record("moveL", pose, speed, acceleration)
+        if _is_path(pose):
+            asynchronous = speed if isinstance(speed, bool) else asynchronous  # moveL(path, asynchronous)
+            path = [list(waypoint) for waypoint in pose]
+        else:
+            path = [list(pose[:6]) + [speed, acceleration, 0.0]]
+        duration = _path_duration(robot.pose, path, _cartesian_distance)
+        return robot.run_motion(duration, lambda: robot.set_pose(path[-1][:6]), asynchronous)
+
+    def moveJ(self, q, speed=1.05, acceleration=1.4, asynchronous=False):
+        robot = self.robot
+        robot.record("moveJ", q, speed, acceleration)
+        if _is_path(q):
+            asynchronous = speed if isinstance(speed, bool) else asynchronous
+            path = [list(waypoint) for waypoint in q]
+        else:
+            path = [list(q[:6]) + [speed, acceleration, 0.0]]
+        duration = _path_duration(robot.q, path, _joint_distance)
+        return robot.run_motion(duration, lambda: robot.set_q(path[-1][:6]), asynchronous)
+
+    def moveUntilContact(self, xd, direction=None, acceleration=0.5):
+        robot = self.robot
+        robot.record("moveUntilContact", xd)
+        speed = math.sqrt(sum(v * v for v in xd[:3]))
+        if speed == 0:
+            return True
+        unit = [v / speed for v in xd[:3]]
+        start = list(robot.pose)
+        travel = robot.contact_distance(start, unit)
+        target = [start[i] + unit[i] * travel for i in range(3)] + start[3:6]
+
+        def touch():
+            robot.set_pose(target)
+            robot.force = [-robot.settings["contact_force"] * u for u in unit] + [0.0, 0.0, 0.0]
+        return robot.run_motion(trapezoid_time(travel, speed, acceleration), touch)
+
+    def getInverseKinematics(self, x, qnear=None, max_position_error=1e-10, max_orientation_error=1e-10):
+        q = inverse_kinematics(x, self.robot.q if qnear is None else qnear)
+        if q is None:
+            raise RuntimeError("No inverse kinematics solution found")
+        return q
+
+    def getAsyncOperationProgress(self):
+        return 0 if self.robot.moving() else -1
+
+    def zeroFtSensor(self):
+        self.robot.record("zeroFtSensor")
+        self.robot.force = [0.0] * 6
+        return True
+
+    def stopL(self, acceleration=10.0):
+        self.robot.record("stopL")
+        self.robot.finish_motion()
+
+    def stopJ(self, acceleration=2.0):
+        self.robot.record("stopJ")
+        self.robot.finish_motion()
+
+    def stopScript(self):
+        self.robot.record("stopScript")
+        self.robot.finish_motion()
+
+    def isConnected(self):
+        return self.robot.connected
+
+    def reconnect(self):
+        self.robot.connected = True
+        return True
+
+    def disconnect(self):
+        self.robot.finish_motion()
+        self.robot.connected = False
+
+class SimulatedReceive:
+    """Stand-in for RTDEReceiveInterface."""
+
+    def __init__(self, robot):
+        self.robot = robot
+
+    def getActualTCPPose(self):
+        return list(self.robot.pose)
+
+    def getActualQ(self):
+        return list(self.robot.q)
+
+    def getActualTCPForce(self):
+        return list(self.robot.force)
+
+    def getOutputIntRegister(self, register):
+        return self.robot.output_int.get(register, 0)
+
+    def getOutputDoubleRegister(self, register):
+        return self.robot.output_double.get(register, 0.0)
+
+    def isConnected(self):
+        return self.robot.connected
+
+    def isProtectiveStopped(self):
+        return self.robot.protective_stopped
+
+    def isEmergencyStopped(self):
+        return False
+
+    def reconnect(self):
+        self.robot.connected = True
+        return True
+
+    def disconnect(self):
+        self.robot.connected = False
+
+class SimulatedIO:
+    """Stand-in for RTDEIOInterface."""
+
+    def __init__(self, robot):
+        self.robot = robot
+
+    def setInputIntRegister(self, register, value):
+        self.robot.record("setInputIntRegister", register, value)
+        self.robot.input_int[register] = value
+        if register == 18 and value == 1:
+            self.robot.gripper_command()
+        return True
+
+    def setInputDoubleRegister(self, register, value):
+        self.robot.record("setInputDoubleRegister", register, value)
+        self.robot.input_double[register] = value
+        return True
+
+    def reconnect(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+def connect(robot_ip="sim", **settings):
+    """
+    Creates a simulated robot and returns interfaces shaped like connect_robot().
+
+    Args:
+    - settings: Overrides of SETTINGS for this robot.
+
+    Returns:
+    - tuple: rtde_c, rtde_r, rtde_io.
+    """
+    robot = SimulatedRobot(robot_ip, **settings)
+    return SimulatedControl(robot), SimulatedReceive(robot), SimulatedIO(robot)
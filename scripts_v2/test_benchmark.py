@@ -0,0 +1,54 @@
+import pytest
+
+import benchmark
+
+
+SCENARIO = {"setup": 2, "columns": 4, "rows": 3, "samples": 2, "async_motion": True}
+
+def event(name, time, motion, gripper=0.0, sample=None):
+    return {"event": name, "time": time, "motion": motion, "gripper": gripper, "sample": sample}
+
+# Wall times at time_scale 0.5: half of every simulated motion and gripper second is missing from the wall time
+EVENTS = [
+    event("started", 0.0, 0.0),
+    event("calibrated", 10.0, 4.0),
+    event("picked", 12.0, 5.0, 1.0, sample=1),
+    event("weighed", 20.0, 5.0, 1.0, sample=1),
+    event("picked", 23.0, 7.0, 1.0, sample=2),
+    event("measured", 30.0, 8.0, 1.0),
+    event("completed", 30.5, 8.0, 1.0),
+]
+
+
+def test_summary_is_in_real_robot_time():
+    result = benchmark.summarize(SCENARIO, EVENTS, 0.5)
+    assert result["setup"] == pytest.approx(12.0)
+    assert result["teardown"] == pytest.approx(7.5)
+    assert result["makespan"] == pytest.approx(34.5)
+    assert result["seconds_per_sample"] == pytest.approx(7.5)
+    assert (result["motion_time"], result["gripper_time"]) == (8.0, 1.0)
+    assert result["steps"]["picked"]["count"] == 2
+    assert result["steps"]["picked"]["total"] == pytest.approx(7.0)
+    assert result["per_sample"]["total"] == pytest.approx(15.0)
+
+def test_unscaled_run_keeps_the_wall_time():
+    result = benchmark.summarize(SCENARIO, EVENTS, 1.0)
+    assert result["makespan"] == pytest.approx(30.0)
+    assert result["setup"] == pytest.approx(10.0)
+
+def test_projected_makespan():
+    result = benchmark.summarize(SCENARIO, EVENTS, 0.5)
+    assert benchmark.projected_makespan(result, 250) == pytest.approx(12.0 + 7.5 + 250 * 7.5)
+
+def test_compare_reports_slowdowns_beyond_the_tolerance():
+    baseline = {"a": {"seconds_per_sample": 10.0, "makespan": 100.0},
+                "b": {"seconds_per_sample": 10.0, "makespan": 100.0}}
+    results = {"a": {"seconds_per_sample": 10.4, "makespan": 90.0},
+               "b": {"seconds_per_sample": 11.0, "makespan": 100.0},
+               "c": {"seconds_per_sample": 1.0, "makespan": 1.0}}
+    assert benchmark.compare(results, baseline, tolerance=5) == ["b seconds_per_sample +10.0 %"]
+
+def test_command_line_values():
+    assert benchmark.scenario_name(SCENARIO) == "setup2_4x3_2samples_async"
+    assert benchmark._grid("23X11") == (23, 11)
+    assert benchmark._overrides(["miss_rate=0.1", "seed=3", "name=sim"]) == {"miss_rate": 0.1, "seed": 3, "name": "sim"}
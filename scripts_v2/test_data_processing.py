@@ -0,0 +1,110 @@
+import os
+import time
+
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processing
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# IMAGE WRITER
+
+@pytest.mark.parametrize("codec", ["png", "webp"])
+def test_image_writer_saves_lossless_frames(tmp_path, codec):
+    image = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    writer = data_processing.ImageWriter(codec=codec)
+    try:
+        path = writer.save(str(tmp_path / "sample_1.png"), image)
+        writer.flush()
+    finally:
+        writer.close()
+    assert path.endswith(data_processing.ImageWriter.EXTENSIONS[codec])
+    assert not os.path.exists(path + ".part")
+    np.testing.assert_array_equal(cv2.imread(path), image)
+
+def test_image_writer_reports_failed_frames(tmp_path):
+    writer = data_processing.ImageWriter(workers=1)
+    try:
+        writer.save(str(tmp_path / "missing.png"), None)
+        with pytest.raises(IOError):
+            writer.flush()
+        writer.flush()  # Errors are reported once
+    finally:
+        writer.close()
+
+def test_image_writer_rejects_unknown_codecs():
+    with pytest.raises(ValueError):
+        data_processing.ImageWriter(codec="bmp")
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# TEMPERATURE STORE
+
+DAY = data_processing.TemperatureStore.DAY
+T0 = 1_750_000_000.0 - (1_750_000_000.0 % DAY) + DAY - 30  # 30 s before a UTC midnight
+
+def test_store_round_trip_across_days(tmp_path):
+    store = data_processing.TemperatureStore(str(tmp_path), ["bath1", "bath2"])
+    times = T0 + np.arange(6) * 10.0
+    values = np.column_stack([20 + np.arange(6), 30 + np.arange(6)])
+    assert store.append(times, values) == 6
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".bin")]) == 2
+
+    data = data_processing.TemperatureStore(str(tmp_path)).read()  # Reopened from meta.json
+    np.testing.assert_array_equal(data["time"], times)
+    np.testing.assert_array_equal(data["bath1"], values[:, 0])
+    np.testing.assert_array_equal(data["bath2"], values[:, 1])
+
+def test_store_reads_inclusive_ranges_and_selected_sensors(tmp_path):
+    store = data_processing.TemperatureStore(str(tmp_path), ["bath1", "bath2"])
+    times = T0 + np.arange(6) * 10.0
+    store.append(times, np.ones((6, 2)))
+    data = store.read(times[1], times[4], sensors=["bath2"])
+    np.testing.assert_array_equal(data["time"], times[1:5])
+    assert data.dtype.names == ("time", "bath2")
+    assert len(store.read(T0 - 100, T0 - 50)) == 0
+
+def test_store_drops_rows_that_are_not_newer(tmp_path):
+    store = data_processing.TemperatureStore(str(tmp_path), ["bath1"])
+    store.append([T0, T0 + 10], [[1.0], [2.0]])
+    assert store.append([T0 + 5, T0 + 20, T0 + 20], [[3.0], [4.0], [5.0]]) == 1
+    # A reopened store continues after the last stored row
+    reopened = data_processing.TemperatureStore(str(tmp_path))
+    assert reopened.append(T0 + 15, [6.0]) == 0
+    assert reopened.append(T0 + 30, [7.0]) == 1
+    np.testing.assert_array_equal(reopened.read()["bath1"], [1.0, 2.0, 4.0, 7.0])
+
+def test_store_needs_sensor_names_when_new(tmp_path):
+    with pytest.raises(ValueError):
+        data_processing.TemperatureStore(str(tmp_path))
+
+def test_store_downsample_skips_missing_readings(tmp_path):
+    store = data_processing.TemperatureStore(str(tmp_path), ["bath1"])
+    start = T0 - 30  # Aligned to a 60 s bin
+    store.append(start + np.arange(4) * 20.0, [[1.0], [np.nan], [3.0], [5.0]])
+    bins, means = store.downsample("bath1", 60)
+    np.testing.assert_array_equal(bins, [start, start + 60])
+    np.testing.assert_allclose(means, [2.0, 5.0])
+
+def test_store_exports_csv(tmp_path):
+    store = data_processing.TemperatureStore(str(tmp_path / "store"), ["bath1"])
+    store.append([T0, T0 + 10], [[21.5], [22.0]])
+    filename = str(tmp_path / "export.csv")
+    store.to_csv(filename)
+    table = pd.read_csv(filename)
+    assert list(table.columns) == ["time", "local_time", "bath1"]
+    np.testing.assert_allclose(table["bath1"], [21.5, 22.0])
+
+def test_convert_registry_wraps_the_year(tmp_path):
+    registry = tmp_path / "TemperatureRegistry_bath2.txt"
+    registry.write_text("12/31, 23:59:00, 25.5\n\nbroken line\n01/01, 00:01:00, 26.0\n")
+    store = data_processing.TemperatureStore(str(tmp_path / "store"), ["bath1", "bath2"])
+    assert data_processing.convert_registry(str(registry), store, "bath2", year=2024) == 2
+    data = store.read()
+    assert data["time"][1] - data["time"][0] == 120
+    assert time.localtime(data["time"][1]).tm_year == 2025
+    assert np.isnan(data["bath1"]).all()
+    np.testing.assert_allclose(data["bath2"], [25.5, 26.0])
@@ -0,0 +1,221 @@
+import importlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import gripper
+import simulator
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CORNER = np.array([0.31, -0.42])
+
+
+@pytest.fixture(scope="module")
+def degradation(tmp_path_factory):
+    # degradation reads config.json from the working directory at import
+    workdir = tmp_path_factory.mktemp("run")
+    shutil.copy(os.path.join(HERE, "config1.json"), workdir / "config.json")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return importlib.import_module("degradation")
+    finally:
+        os.chdir(cwd)
+
+
+def edge_points(angle, along_y, along_x):
+    """Contacts on the two edges of a tray whose corner is CORNER, rotated by angle."""
+    direction = np.array([np.cos(angle), np.sin(angle)])
+    normal = np.array([-direction[1], direction[0]])
+    return ([CORNER + t * direction for t in along_y],
+            [CORNER + s * normal for s in along_x])
+
+
+@pytest.mark.parametrize("angle", [0.0, 0.012, -0.03])
+def test_fit_corner_recovers_corner_and_angle(degradation, angle):
+    edge_y, edge_x = edge_points(angle, [0.05, 0.1, 0.15], [0.04, 0.08, 0.12])
+    intersection, rotation_angle, residual = degradation.fit_corner(edge_y, edge_x)
+    np.testing.assert_allclose(intersection, CORNER, atol=1e-9)
+    assert rotation_angle == pytest.approx(angle, abs=1e-9)
+    assert residual == pytest.approx(0.0, abs=1e-9)
+
+def test_fit_corner_works_with_two_contacts_per_edge(degradation):
+    edge_y, edge_x = edge_points(0.02, [0.05, 0.15], [0.04, 0.12])
+    intersection, rotation_angle, _ = degradation.fit_corner(edge_y, edge_x)
+    np.testing.assert_allclose(intersection, CORNER, atol=1e-9)
+    assert rotation_angle == pytest.approx(0.02, abs=1e-9)
+
+def test_fit_corner_reports_scattered_contacts(degradation):
+    edge_y, edge_x = edge_points(0.0, [0.05, 0.1, 0.15], [0.04, 0.08, 0.12])
+    edge_y[1] = edge_y[1] + [0.0, 0.003]  # One contact 3 mm off the edge
+    _, _, residual = degradation.fit_corner(edge_y, edge_x)
+    assert residual > degradation.MAX_FIT_RESIDUAL
+
+def test_fit_corner_needs_two_contacts_per_edge(degradation):
+    edge_y, edge_x = edge_points(0.0, [0.05, 0.1], [0.04])
+    with pytest.raises(ValueError):
+        degradation.fit_corner(edge_y, edge_x)
+
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# CONTACT PROBES
+
+def test_expected_contacts_are_kept_per_bath(degradation, monkeypatch):
+    monkeypatch.setattr(degradation, "expected_contacts", {})
+    rtde_c, rtde_r, _ = simulator.connect(time_scale=0.0)
+    start = rtde_r.getActualTCPPose()
+    rtde_c.robot.surfaces.append(simulator.ContactSurface("z", start[2] - 0.2))
+    degradation.probe("lid_pick", [0, 0, -1], rtde_c, rtde_r, 1)
+    assert list(degradation.expected_contacts) == [(1, "lid_pick")]
+
+    # Bath 2 knows no surface yet: the probe goes straight to the slow contact move
+    rtde_c.moveL(start)
+    calls = len(rtde_c.robot.calls)
+    degradation.probe("lid_pick", [0, 0, -1], rtde_c, rtde_r, 2)
+    assert [method for method, _ in rtde_c.robot.calls[calls:] if method.startswith("move")] == ["moveUntilContact"]
+
+    degradation.clear_contacts(1)
+    assert list(degradation.expected_contacts) == [(2, "lid_pick")]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# LID HEIGHT CACHE
+
+@pytest.fixture
+def lid_cache(degradation, tmp_path, monkeypatch):
+    monkeypatch.setattr(degradation, "LID_CACHE", str(tmp_path / "LidHeights_setup{setup}.json"))
+    monkeypatch.setattr(degradation, "lid_heights", {})
+    return lambda setup: tmp_path / f"LidHeights_setup{setup}.json"
+
+def probes(rtde_c):
+    return sum(method == "moveUntilContact" for method, _ in rtde_c.robot.calls)
+
+def test_lid_height_is_probed_once_and_cached(degradation, lid_cache):
+    rtde_c, rtde_r, _ = simulator.connect(time_scale=0.0)
+    start = rtde_r.getActualTCPPose()
+    table = start[2] - 0.06
+    rtde_c.robot.surfaces.append(simulator.ContactSurface("z", table))
+
+    assert degradation.lower_to_lid("pick", rtde_c, rtde_r, 1)
+    assert json.loads(lid_cache(1).read_text()) == {"pick": pytest.approx(table)}
+
+    rtde_c.moveL(start)
+    assert not degradation.lower_to_lid("pick", rtde_c, rtde_r, 1)
+    assert probes(rtde_c) == 1
+    assert rtde_r.getActualTCPPose()[2] == pytest.approx(table + degradation.LID_CLEARANCE)
+
+    rtde_c.moveL(start)
+    assert degradation.lower_to_lid("pick", rtde_c, rtde_r, 1, force_probe=True)
+    assert probes(rtde_c) == 2
+
+def test_each_bath_has_its_own_lid_heights(degradation, lid_cache):
+    rtde_c, rtde_r, _ = simulator.connect(time_scale=0.0)
+    lid_cache(1).write_text(json.dumps({"place": rtde_r.getActualTCPPose()[2] - 0.3}))
+    assert degradation.lower_to_lid("place", rtde_c, rtde_r, 2)  # Bath 1's height is not used
+    assert probes(rtde_c) == 1
+    assert lid_cache(2).exists()
+    assert json.loads(lid_cache(1).read_text()).keys() == {"place"}
+
+@pytest.mark.parametrize("width_feedback, expected_probes", [(True, 0), (False, 1)])
+def test_lid_grasp_trusts_the_cache_only_with_width_feedback(degradation, lid_cache, monkeypatch,
+                                                            width_feedback, expected_probes):
+    monkeypatch.setitem(gripper.SETTINGS, "width_feedback", width_feedback)
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0)
+    lid_cache(1).write_text(json.dumps({"stand_on": rtde_r.getActualTCPPose()[2] - 0.05}))
+    degradation.grasp_lid("stand_on", rtde_c, rtde_r, rtde_io, 1)
+    assert probes(rtde_c) == expected_probes
+
+def test_missed_lid_is_probed_again(degradation, lid_cache, monkeypatch):
+    monkeypatch.setitem(gripper.SETTINGS, "width_feedback", True)
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0, miss_rate=1.0)
+    lid_cache(1).write_text(json.dumps({"stand_on": rtde_r.getActualTCPPose()[2] - 0.05}))
+    degradation.grasp_lid("stand_on", rtde_c, rtde_r, rtde_io, 1)
+    assert probes(rtde_c) == 1
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# CALIBRATION CACHE
+
+@pytest.fixture
+def calibration_cache(degradation, tmp_path, monkeypatch):
+    monkeypatch.setattr(degradation, "CALIBRATION_CACHE", str(tmp_path / "Calibration_setup{setup}.json"))
+    monkeypatch.setattr(degradation, "last_calibration", {})
+    monkeypatch.setattr(degradation, "expected_contacts", {})
+    return lambda setup: tmp_path / f"Calibration_setup{setup}.json"
+
+def calibrate(degradation, rtde_c, rtde_r, rtde_io, setup):
+    return degradation.calibrate(rtde_r.getActualTCPPose(), rtde_c, rtde_r, rtde_io, 0.0, setup)
+
+def test_calibration_is_cached_per_bath(degradation, calibration_cache):
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0)
+    home = rtde_r.getActualTCPPose()
+    calibrate(degradation, rtde_c, rtde_r, rtde_io, 1)
+    assert json.loads(calibration_cache(1).read_text())["setup"] == 1
+    assert not calibration_cache(2).exists()
+
+    # Bath 2 has no cache yet: it is probed in full instead of verified against bath 1
+    rtde_c.moveL(home)
+    calls = len(rtde_c.robot.calls)
+    calibrate(degradation, rtde_c, rtde_r, rtde_io, 2)
+    probes = [method for method, _ in rtde_c.robot.calls[calls:] if method == "moveUntilContact"]
+    assert len(probes) == 2 * degradation.PROBES_PER_EDGE
+    assert set(degradation.last_calibration) == {1, 2}
+
+def test_cached_calibration_is_verified_with_two_probes(degradation, calibration_cache):
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0)
+    home = rtde_r.getActualTCPPose()
+    final_pose, angle = calibrate(degradation, rtde_c, rtde_r, rtde_io, 1)
+    rtde_c.moveL(home)
+    calls = len(rtde_c.robot.calls)
+    assert calibrate(degradation, rtde_c, rtde_r, rtde_io, 1)[1] == pytest.approx(angle)
+    recent = rtde_c.robot.calls[calls:]
+    assert sum(method == "moveUntilContact" for method, _ in recent) == 2
+    # The moves to the reference probe starts use the approach speed, not 1 m/s
+    cached = json.loads(calibration_cache(1).read_text())
+    starts = [cached["probe"]["start"], cached["probe_x"]["start"]]
+    speeds = [args[1] for method, args in recent if method == "moveL" and args[0] in starts]
+    assert speeds == [degradation.APPROACH_SPEED] * 2
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# SAFE STOP
+
+@pytest.mark.parametrize("stuck", [False, True])
+def test_release_sample_returns_it_to_its_slot(degradation, monkeypatch, stuck):
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0)
+    if stuck:  # The busy flag rises and never clears
+        monkeypatch.setattr(rtde_c.robot, "gripper_command", lambda: rtde_c.robot.output_int.update({18: 1}))
+    slot = rtde_r.getActualTCPPose()
+    slot[1] += 0.1
+    assert degradation.release_sample(slot, rtde_c, rtde_r, rtde_io, timeout=0.05) != stuck
+    assert rtde_c.robot.calls[0][0] == "stopL"
+    lowest = min(args[0][2] for method, args in rtde_c.robot.calls if method == "moveL")
+    assert lowest == pytest.approx(slot[2] - 0.04)
+    assert rtde_r.getActualTCPPose() == pytest.approx(slot)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# SPONGE AND SHAKE PATHS
+
+def sent_paths(rtde_c):
+    return [np.array(args[0]) for method, args in rtde_c.robot.calls
+            if method == "moveL" and isinstance(args[0][0], list)]
+
+def test_sponge_strokes_are_not_blended(degradation):
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0)
+    degradation.use_sponge(rtde_c, rtde_r, rtde_io)
+    first, second = sent_paths(rtde_c)
+    # Bottom of the first dip, then the dab and the stroke along the sponge
+    assert first[[0, 4, 5], 8].tolist() == [0, 0, 0]
+    assert second[[1, 2], 8].tolist() == [0, 0]
+    assert first[[1, 2, 3], 8].tolist() == pytest.approx([degradation.SPONGE_BLEND] * 3)
+
+def test_only_the_turn_of_the_shake_is_blended(degradation):
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0)
+    degradation.shake(rtde_c, rtde_r, rtde_io)
+    blends = sent_paths(rtde_c)[0][:, 8]
+    assert blends.tolist() == pytest.approx([0, 0, degradation.SHAKE_BLEND, 0, 0, 0])
@@ -0,0 +1,126 @@
+import random
+import time
+
+import pytest
+
+import device_emulator
+import environment
+
+
+FAST = dict(scale_latency=0.0, arduino_latency=0.0, settle_time=0.05, load_delay=0.05, scale_noise=0.0)
+
+
+def scale(**settings):
+    return device_emulator.EmulatedScale(dict(device_emulator.SETTINGS, **FAST, **settings), random.Random(1))
+
+def reading(reply):
+    value, flag = reply.split()
+    return float(value), flag == "S"
+
+def wait_stable(model, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        value, stable = reading(model.measure())
+        if stable:
+            return value
+        time.sleep(0.005)
+    raise AssertionError("the reading never settled")
+
+
+def test_scale_weighs_a_sample_after_a_stable_zero():
+    model = scale(sample_weight=4.3, sample_spread=0.0)
+    model.tare()
+    assert wait_stable(model) == pytest.approx(0.0, abs=0.002)
+    assert not reading(model.measure())[1]  # The sample is landing
+    time.sleep(0.06)
+    assert wait_stable(model) == pytest.approx(4.3, abs=0.002)
+
+def test_scale_keeps_the_weight_for_every_load_of_a_sample():
+    model = scale(sample_spread=0.2, loads_per_sample=3)
+    weights = []
+    for _ in range(4):
+        model.tare()
+        wait_stable(model)
+        time.sleep(0.06)
+        weights.append(wait_stable(model))
+    assert weights[0] == pytest.approx(weights[1], abs=0.002) == pytest.approx(weights[2], abs=0.002)
+    assert weights[3] != pytest.approx(weights[0], abs=0.002)
+
+def test_execute_matches_commands_like_the_firmware():
+    emulator = device_emulator.DeviceEmulator(port=0, cameras=(), temperatures=[40.0, 60.0],
+                                              temperature_noise=0.0, **FAST)
+    try:
+        assert emulator.execute(b"TEMPB")[0].startswith("Temperature at sensor 2: 6")
+        assert emulator.execute("TEMP")[0].startswith("Temperature at sensor 1: 4")
+        assert emulator.execute("OPEN VALVE")[0] == "OK" and emulator.arduino.valve_open
+        assert emulator.execute("CLOSE VALVE")[0] == "OK" and not emulator.arduino.valve_open
+        assert emulator.execute("FLY")[0].startswith("ERROR")
+        assert emulator.commands["TEMP"] == 1
+    finally:
+        emulator.stop()
+
+def test_emulator_rejects_unknown_settings():
+    with pytest.raises(ValueError):
+        device_emulator.DeviceEmulator(port=0, cameras=(), scale_latence=0.1)
+
+@pytest.mark.parametrize("persistent", [True, False])
+def test_device_client_talks_to_the_emulator(persistent):
+    with device_emulator.DeviceEmulator(port=0, cameras=(), **FAST) as emulator:
+        client = environment.DeviceClient(emulator.host, emulator.port, persistent=persistent)
+        try:
+            assert client.request(b"TARE", reply=False) is None
+            replies = client.pipeline([b"MEASURE", b"TEMP"])
+            assert reading(replies[0].decode())[0] == pytest.approx(0.0, abs=0.01)
+            assert replies[1].startswith(b"Temperature at sensor 1")
+        finally:
+            client.close()
+        deadline = time.monotonic() + 1.0
+        while emulator.commands.get("TARE") != 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert emulator.commands.get("TARE") == 1
+
+class DropOnce(random.Random):
+    """Makes the emulator drop the connection of the first reply, and of no later one."""
+
+    def __init__(self):
+        super().__init__(1)
+        self.dropped = False
+
+    def uniform(self, a, b):
+        return a  # No jitter
+
+    def random(self):
+        if self.dropped:
+            return 1.0
+        self.dropped = True
+        return 0.0
+
+def test_keep_alive_client_reconnects_after_a_dropped_connection():
+    with device_emulator.DeviceEmulator(port=0, cameras=(), drop_rate=0.5, **FAST) as emulator:
+        client = environment.DeviceClient(emulator.host, emulator.port, persistent=True)
+        emulator.rng = DropOnce()
+        try:
+            assert client.request(b"TEMPB").startswith(b"Temperature at sensor 2")
+            assert emulator.commands["TEMPB"] == 2  # Dropped once, answered on the new connection
+            assert client.request(b"TEMP").startswith(b"Temperature at sensor 1")
+        finally:
+            client.close()
+
+@pytest.mark.parametrize("persistent", [True, False])
+def test_device_client_times_out_and_recovers(persistent):
+    with device_emulator.DeviceEmulator(port=0, cameras=(), **dict(FAST, arduino_latency=0.3)) as emulator:
+        client = environment.DeviceClient(emulator.host, emulator.port, timeout=0.1, persistent=persistent)
+        try:
+            with pytest.raises(OSError):
+                client.request(b"TEMPB")
+            emulator.settings["arduino_latency"] = 0.0
+            time.sleep(0.4)  # Let the late replies arrive
+            # The late reply of the timed out request is not taken for the reply of the next one
+            assert client.request(b"TEMP").startswith(b"Temperature at sensor 1")
+        finally:
+            client.close()
+
+def test_device_client_defaults_to_one_connection_per_command():
+    assert not environment.DeviceClient("127.0.0.1", 0).persistent
+    assert not environment.get_device("127.0.0.1", 1).persistent
+    environment.close_devices()
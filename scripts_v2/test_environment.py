@@ -0,0 +1,172 @@
+import itertools
+import math
+import threading
+
+import numpy as np
+import pytest
+
+import device_emulator
+import environment
+
+
+REFERENCE = [0.3, -0.4, 0.25, 2.2, 2.2, 0.0]
+INTERSECTION = [0.31, -0.42]
+DEPOSIT = [0.6, 0.1, 0.2, 2.2, 2.2, 0.0]
+
+
+def loop_poses(samples, angle):
+    """Poses computed one sample at a time, as the cycle did before the table existed."""
+    poses = {}
+    for n, sample in samples.items():
+        xtemp = .02 * (sample.index[0] - 1)
+        ytemp = .02 * (sample.index[1] - 1)
+        pick = list(REFERENCE)
+        pick[0] = INTERSECTION[0] + (xtemp * math.cos(angle) - ytemp * math.sin(angle))
+        if n > 121:
+            pick[0] += 0.003
+        pick[1] = INTERSECTION[1] + (ytemp * math.cos(angle) + xtemp * math.sin(angle))
+        deposit = list(DEPOSIT)
+        deposit[0] += xtemp
+        deposit[1] += ytemp
+        poses[n] = (pick, deposit)
+    return poses
+
+
+@pytest.mark.parametrize("columns, rows", [(4, 3), (11, 12)])
+def test_table_matches_the_per_sample_formula(columns, rows):
+    samples = environment.generate_sample_grid(columns, rows)
+    angle = 0.013
+    targets = environment.GridTargets.compute(samples, REFERENCE, INTERSECTION, angle, DEPOSIT)
+    for n, (pick, deposit) in loop_poses(samples, angle).items():
+        assert targets.pick_pose(n) == pytest.approx(pick, abs=1e-12)
+        assert targets.deposit_pose(n) == pytest.approx(deposit, abs=1e-12)
+
+def test_second_tray_is_offset():
+    samples = environment.generate_sample_grid(11, 12)
+    targets = environment.GridTargets.compute(samples, REFERENCE, INTERSECTION, 0.0, DEPOSIT)
+    # Samples 121 and 122 share a column, only 122 carries the tray offset
+    step = targets.pick_pose(122)[0] - targets.pick_pose(121)[0]
+    assert step == pytest.approx(environment.SECOND_TRAY_X_OFFSET)
+
+def test_save_and_load_round_trip(tmp_path):
+    samples = environment.generate_sample_grid(4, 3)
+    targets = environment.GridTargets.compute(samples, REFERENCE, INTERSECTION, -0.02, DEPOSIT)
+    filename = str(tmp_path / "targets")
+    targets.save(filename)
+    loaded = environment.GridTargets.load(filename)
+    np.testing.assert_array_equal(loaded.ids, targets.ids)
+    np.testing.assert_array_equal(loaded.pick, targets.pick)
+    np.testing.assert_array_equal(loaded.deposit, targets.deposit)
+    csv = np.loadtxt(filename + ".csv", delimiter=",", skiprows=1)
+    assert csv.shape == (12, 13)
+    np.testing.assert_allclose(csv[:, 1:7], targets.pick, atol=1e-6)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# TEMPERATURE SAMPLER
+
+class Bridge:
+    """Stands in for the shared Arduino client: replies from a list, an exception is raised instead."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.commands = []
+
+    def request(self, command, reply=True):
+        self.commands.append(command)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+def temperature(sensor, value):
+    return f"Temperature at sensor {sensor}: {value:.2f} ºC".encode()
+
+@pytest.fixture
+def bridge(monkeypatch):
+    bridge = Bridge([])
+    monkeypatch.setattr(environment, "get_device", lambda host=None, port=None: bridge)
+    return bridge
+
+def test_ring_buffer_keeps_the_latest_rows_in_order(bridge):
+    sampler = environment.TemperatureSampler(capacity=3)
+    for value in range(5):
+        bridge.replies += [temperature(1, 40 + value), temperature(2, 60 + value)]
+        sampler.poll()
+    assert bridge.commands[:2] == [b'TEMP', b'TEMPB']
+    times, values = sampler.history(1)
+    assert values.tolist() == pytest.approx([42, 43, 44])
+    assert np.all(np.diff(times) >= 0)
+    assert sampler.latest(2)[1] == pytest.approx(64)
+    assert sampler.value_at(1, times[0]) == pytest.approx(42)
+    assert sampler.value_at(2) == pytest.approx(64)
+
+def test_failed_reads_are_kept_as_gaps(bridge):
+    sampler = environment.TemperatureSampler()
+    assert sampler.value_at(1) is None
+    bridge.replies += [temperature(1, 40), temperature(2, 60),
+                       OSError("timed out"), b"Temperature at sen",  # Failed and incomplete reads
+                       EOFError("closed"), temperature(2, 61)]
+    for _ in range(3):
+        sampler.poll()
+    assert sampler.history(1)[1].tolist() == pytest.approx([40])
+    assert sampler.history(2)[1].tolist() == pytest.approx([60, 61])
+    assert sampler.latest(1)[1] == pytest.approx(40)  # The gaps are skipped
+    assert sampler.wait_for_data(0)
+
+def test_polls_wait_for_the_command_in_flight():
+    with device_emulator.DeviceEmulator(port=0, cameras=(), scale_latency=0.0, arduino_latency=0.0) as emulator:
+        sampler = environment.TemperatureSampler(host=emulator.host, port=emulator.port)
+        device = environment.get_device(emulator.host, emulator.port)
+        try:
+            with device._lock:  # A cycle command holds the client
+                poll = threading.Thread(target=sampler.poll)
+                poll.start()
+                poll.join(0.2)
+                assert poll.is_alive()
+            poll.join(5)
+            assert not poll.is_alive()
+            assert sampler.latest(1)[1] is not None
+        finally:
+            environment.close_devices()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# STABLE WEIGHT READINGS
+
+FAST_WEIGHING = dict(window=3, tolerance=0.002, interval=0.0, timeout=0.05)
+
+@pytest.fixture
+def balance(monkeypatch):
+    """Scripted balance: the readings are given as (weight, flag) pairs; the last one repeats."""
+    readings = []
+    def read_balance(balance, remote=True, raspberry_pi_ip=None):
+        return readings.pop(0) if len(readings) > 1 else readings[0]
+    monkeypatch.setattr(environment, "read_balance", read_balance)
+    return readings
+
+def test_flagged_reading_is_taken_at_once(balance):
+    balance += [(4.1, False), (4.3, True), (9.9, True)]
+    assert environment.read_stable_weight(None, **FAST_WEIGHING) == (4.3, True)
+
+def test_window_agreement_without_flags(balance):
+    balance += [(4.0, None), (4.301, None), (4.302, None), (4.300, None)]
+    weight, stable = environment.read_stable_weight(None, **FAST_WEIGHING)
+    assert stable and weight == pytest.approx(4.301)
+
+def test_readings_flagged_unstable_are_never_stable(balance):
+    balance += [(4.3, False)]  # Within the tolerance, but the balance says it is still moving
+    weight, stable = environment.read_stable_weight(None, **FAST_WEIGHING)
+    assert not stable and weight == pytest.approx(4.3)
+    # Unless the flag is ignored
+    assert environment.read_stable_weight(None, **dict(FAST_WEIGHING, use_flag=False)) == (4.3, True)
+
+def test_drifting_reading_times_out_unstable(monkeypatch):
+    drift = itertools.count()
+    monkeypatch.setattr(environment, "read_balance", lambda *args: (4.3 + 0.01 * next(drift), None))
+    weight, stable = environment.read_stable_weight(None, **FAST_WEIGHING)
+    assert not stable and weight > 4.3
+
+def test_invalid_replies_time_out_without_a_weight(balance):
+    balance += [(None, None)]
+    assert environment.read_stable_weight(None, **FAST_WEIGHING) == (None, False)
@@ -0,0 +1,53 @@
+import time
+
+import pytest
+
+import gripper
+import simulator
+
+
+class SilentReceive:
+    """Stands in for RTDEReceiveInterface of a gripper program that never raises the busy flag."""
+
+    def getOutputIntRegister(self, register):
+        return 0
+
+    def getOutputDoubleRegister(self, register):
+        return 0.0
+
+
+def commands(rtde_c):
+    return [args for method, args in rtde_c.robot.calls if method == "setInputIntRegister"]
+
+
+def test_command_waits_for_the_busy_flag_and_resets_the_register(monkeypatch):
+    monkeypatch.setitem(gripper.SETTINGS, "width_feedback", True)
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0, part_width=3.0)
+    assert gripper.close_grip(rtde_c, rtde_r, rtde_io) == pytest.approx(3.0)
+    assert rtde_r.getOutputIntRegister(gripper.BUSY_REGISTER) == 0
+    assert gripper.open_grip(15, rtde_c, rtde_r, rtde_io) == pytest.approx(15.0)
+    assert commands(rtde_c) == [(gripper.COMMAND_REGISTER, 1), (gripper.COMMAND_REGISTER, 0)] * 2
+
+def test_width_is_unknown_without_feedback(monkeypatch):
+    monkeypatch.setitem(gripper.SETTINGS, "width_feedback", False)
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=0.0, miss_rate=1.0)
+    assert gripper.close_grip(rtde_c, rtde_r, rtde_io) is None
+    assert gripper.holding(None)
+
+def test_unacknowledged_command_waits_the_fixed_delay(monkeypatch):
+    monkeypatch.setattr(gripper, "ACK_TIMEOUT", 0.01)
+    monkeypatch.setattr(gripper, "UNACKED_DELAY", 0.05)
+    _, _, rtde_io = simulator.connect(time_scale=0.0)
+    start = time.monotonic()
+    gripper.open_grip(15, None, SilentReceive(), rtde_io)
+    assert time.monotonic() - start >= 0.05
+
+def test_busy_gripper_times_out_and_resets_the_register():
+    rtde_c, rtde_r, rtde_io = simulator.connect(time_scale=1.0, gripper_delay=5.0)
+    with pytest.raises(gripper.GripperTimeout):
+        gripper.close_grip(rtde_c, rtde_r, rtde_io, timeout=0.05)
+    assert commands(rtde_c)[-1] == (gripper.COMMAND_REGISTER, 0)
+
+def test_unknown_settings_are_refused():
+    with pytest.raises(ValueError):
+        gripper.configure(width_feedbak=True)
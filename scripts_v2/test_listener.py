@@ -0,0 +1,160 @@
+import asyncio
+import importlib
+import json
+import os
+import shutil
+import threading
+
+import pytest
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="module")
+def listener(tmp_path_factory):
+    # degradation (imported by listener) reads config.json from the working directory at import
+    workdir = tmp_path_factory.mktemp("run")
+    shutil.copy(os.path.join(HERE, "config1.json"), workdir / "config.json")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return importlib.import_module("listener")
+    finally:
+        os.chdir(cwd)
+
+@pytest.fixture
+def worker(listener, monkeypatch):
+    """A worker whose commands run until release is set, reporting the events listed in "events"."""
+    release = threading.Event()
+    def handler(command, report):
+        for event in command.get("events", []):
+            report(event, sample=1)
+        if command.get("fail"):
+            raise RuntimeError("gripper timeout")
+        release.wait(5)
+    worker = listener.CommandWorker(handler)
+    worker.release = release
+    worker.start()
+    monkeypatch.setattr(listener, "worker", worker)
+    yield worker
+    release.set()
+    worker.shutdown(drain=False, timeout=5)
+
+
+async def connect(listener):
+    server = await asyncio.start_server(listener.handle_client, "127.0.0.1", 0, limit=listener.MAX_LINE)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    return server, reader, writer
+
+async def receive(reader, count):
+    return [json.loads(await asyncio.wait_for(reader.readline(), 5)) for _ in range(count)]
+
+async def close(server, writer):
+    writer.close()
+    await writer.wait_closed()
+    server.close()
+    await server.wait_closed()
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# WORKER
+
+def test_second_command_is_queued_while_busy(worker):
+    assert worker.submit({"cycle_number": 1})["status"] == "accepted"
+    assert worker.submit({"cycle_number": 2})["status"] == "busy"
+    status = worker.status()
+    assert status["queued"] + (status["status"] == "busy") == 2
+    worker.release.set()
+    assert worker.wait_idle(5)
+    assert worker.status() == {"status": "idle", "current": None, "queued": 0}
+
+def test_queued_command_is_never_reported_idle(listener):
+    # Every snapshot taken while a command is pending shows it as running or queued
+    done = threading.Event()
+    worker = listener.CommandWorker(lambda command, report: done.wait(5))
+    worker.start()
+    try:
+        for _ in range(200):
+            worker.submit({})
+            status = worker.status()
+            assert status["status"] == "busy" or status["queued"] == 1
+            done.set()
+            assert worker.wait_idle(5)
+            done.clear()
+    finally:
+        done.set()
+        worker.shutdown(timeout=5)
+
+def test_failed_command_is_reported_and_the_worker_goes_on(worker):
+    events = []
+    worker.submit({"fail": True}, events.append)
+    assert worker.wait_idle(5)
+    assert [event["event"] for event in events] == ["started", "failed"]
+    assert events[-1]["message"] == "gripper timeout"
+    worker.release.set()
+    worker.submit({}, events.append)
+    assert worker.wait_idle(5)
+    assert events[-1]["event"] == "completed"
+
+def test_shutdown_refuses_new_commands(listener):
+    worker = listener.CommandWorker(lambda command, report: None)
+    worker.start()
+    worker.shutdown(timeout=5)
+    assert worker.submit({})["status"] == "error"
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# SERVER
+
+def test_commands_are_framed_by_lines(listener, worker):
+    async def run():
+        server, reader, writer = await connect(listener)
+        # One command split across writes, then a status request and invalid JSON in a single write
+        writer.write(b'{"cycle_number": 1, ')
+        await writer.drain()
+        await asyncio.sleep(0.05)
+        writer.write(b'"setup": 2}\n\n{"type": "status"}\nnot json\n[1]\n')
+        await writer.drain()
+        replies = await receive(reader, 5)
+        await close(server, writer)
+        return replies
+    replies = asyncio.run(run())
+    assert replies[0]["status"] == "accepted"
+    events = [reply for reply in replies if "event" in reply]
+    answers = [reply for reply in replies if "event" not in reply]
+    assert [event["event"] for event in events] == ["started"]
+    assert (events[0]["setup"], events[0]["cycle"]) == (2, 1)
+    assert answers[1]["status"] == "busy" and answers[1]["current"]["setup"] == 2
+    assert [answer["status"] for answer in answers[2:]] == ["error", "error"]
+
+def test_oversized_command_is_refused(listener, worker, monkeypatch):
+    monkeypatch.setattr(listener, "MAX_LINE", 64)
+    async def run():
+        server, reader, writer = await connect(listener)
+        writer.write(json.dumps({"samples": list(range(100))}).encode() + b"\n")
+        await writer.drain()
+        reply = await receive(reader, 1)
+        closed = await asyncio.wait_for(reader.read(), 5)
+        await close(server, writer)
+        return reply[0], closed
+    reply, closed = asyncio.run(run())
+    assert reply == {"status": "error", "message": "Command exceeds 64 bytes."}
+    assert closed == b""
+    assert worker.status()["status"] == "idle"
+
+def test_progress_events_are_streamed(listener, worker):
+    worker.release.set()
+    async def run():
+        server, reader, writer = await connect(listener)
+        writer.write(json.dumps({"cycle_number": 4, "events": ["picked", "weighed"]}).encode() + b"\n")
+        await writer.drain()
+        replies = await receive(reader, 5)
+        await close(server, writer)
+        return replies
+    replies = asyncio.run(run())
+    assert replies[0]["status"] == "accepted"
+    assert [reply["event"] for reply in replies[1:]] == ["started", "picked", "weighed", "completed"]
+    assert all(reply["cycle"] == 4 for reply in replies[1:])
+    assert replies[2]["sample"] == 1
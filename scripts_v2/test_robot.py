@@ -0,0 +1,209 @@
+import threading
+import time
+
+import pytest
+
+import robot
+import simulator
+
+
+START = [0.0, 0.0, 0.0, 2.2, 2.2, 0.0]
+
+
+class Recorder:
+    """Stands in for RTDEControl and records the paths it is sent."""
+
+    def __init__(self):
+        self.calls = []
+
+    def moveL(self, path, asynchronous=False):
+        self.calls.append(("moveL", path, asynchronous))
+        return True
+
+    def moveJ(self, path, asynchronous=False):
+        self.calls.append(("moveJ", path, asynchronous))
+        return True
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# BLENDED PATHS
+
+def test_blend_is_clamped_to_half_the_shorter_segment():
+    path = robot.Path(START, blend=0.05).offset(dz=0.2).offset(dx=0.04).offset(dy=0.3)
+    blends = [waypoint[8] for waypoint in path.waypoints()]
+    assert blends == pytest.approx([0.02, 0.02, 0.0])
+
+def test_blend_is_kept_when_segments_are_long():
+    path = robot.Path(START, blend=0.05).offset(dz=0.2).offset(dx=0.2)
+    assert [waypoint[8] for waypoint in path.waypoints()] == pytest.approx([0.05, 0.0])
+
+def test_last_waypoint_has_no_blend():
+    path = robot.Path(START).to(START, blend=0.1)
+    assert path.waypoints()[-1][8] == 0.0
+
+def test_waypoints_carry_their_own_speed_and_acceleration():
+    path = robot.Path(START, speed=0.25, acceleration=1.2).offset(dz=0.1, speed=0.05).offset(dz=-0.1)
+    first, second = path.waypoints()
+    assert first[:6] == [0.0, 0.0, 0.1, 2.2, 2.2, 0.0]
+    assert first[6:8] == [0.05, 1.2]
+    assert second[6:8] == [0.25, 1.2]
+
+def test_joint_path_keeps_blends_and_runs_with_movej():
+    path = robot.Path(START, blend=0.05, joint=True).rotate(5, 3.14).rotate(5, -3.14)
+    rtde_c = Recorder()
+    assert path.run(rtde_c)
+    move, waypoints, asynchronous = rtde_c.calls[0]
+    assert move == "moveJ" and not asynchronous
+    assert [waypoint[8] for waypoint in waypoints] == [0.05, 0.0]
+
+def test_rotate_needs_a_joint_path():
+    with pytest.raises(ValueError):
+        robot.Path(START).rotate(5, 1.0)
+
+def test_empty_path_sends_nothing():
+    rtde_c = Recorder()
+    assert robot.Path(START).run(rtde_c)
+    assert rtde_c.calls == []
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# TRANSITS
+
+def counting_planner(monkeypatch):
+    rtde_c, rtde_r, _ = simulator.connect(time_scale=0.0)
+    solved = []
+    solve = rtde_c.getInverseKinematics
+    monkeypatch.setattr(rtde_c, "getInverseKinematics", lambda pose, qnear=None: solved.append(pose) or solve(pose, qnear))
+    return robot.TransitPlanner(rtde_c, rtde_r), rtde_r, solved
+
+def offset_pose(pose, dx=0.0, dy=0.0, dz=0.0):
+    return [pose[0] + dx, pose[1] + dy, pose[2] + dz] + list(pose[3:6])
+
+def test_stations_are_solved_once(monkeypatch):
+    planner, rtde_r, solved = counting_planner(monkeypatch)
+    home = rtde_r.getActualTCPPose()
+    stations = [offset_pose(home, dx=0.1), offset_pose(home, dy=-0.1)]
+    assert planner.precompute(stations) == 0
+    for station in stations + stations:
+        assert planner.transit(list(station))
+        assert rtde_r.getActualTCPPose() == pytest.approx(station, abs=1e-6)
+    assert len(solved) == 2
+
+def test_poses_built_from_the_current_pose_are_not_cached(monkeypatch):
+    planner, rtde_r, solved = counting_planner(monkeypatch)
+    planner.precompute([offset_pose(rtde_r.getActualTCPPose(), dx=0.1)])
+    for dz in (0.0213, 0.0208, -0.0195):
+        # Fixed X and Y, the rest of the pose as found (like the air blow point)
+        target = offset_pose(rtde_r.getActualTCPPose(), dz=dz)
+        target[:2] = [0.05, 1.0]
+        assert planner.transit(target)
+        assert rtde_r.getActualTCPPose() == pytest.approx(target, abs=1e-6)
+    assert len(solved) == 4
+    assert len(planner.solutions) == 1
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# ASYNCHRONOUS MOTION
+
+class MovingArm(Recorder):
+    """Recorder whose asynchronous motions run for a number of progress polls (forever with None)."""
+
+    def __init__(self, polls=3):
+        super().__init__()
+        self.polls = polls
+        self.remaining = 0
+
+    def moveL(self, path, asynchronous=False):
+        self.calls.append(("moveL", path, asynchronous, self.remaining))  # Polls left of the previous motion
+        self.remaining = self.polls if asynchronous else 0
+        return True
+
+    def getAsyncOperationProgress(self):
+        if self.remaining is None:
+            return 0
+        if self.remaining == 0:
+            return -1
+        self.remaining -= 1
+        return 0
+
+    def stopL(self, acceleration=10.0):
+        self.calls.append(("stopL",))
+
+def test_disabled_overlap_runs_everything_in_order():
+    rtde_c = Recorder()
+    overlap = robot.Overlap(rtde_c)
+    assert overlap.motion(rtde_c.moveL, START)
+    assert rtde_c.calls == [("moveL", START, False)]
+    assert overlap.background(lambda: threading.current_thread()).result() is threading.current_thread()
+    failed = overlap.background(lambda: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        failed.result()
+    overlap.close()
+
+def test_device_calls_run_while_the_arm_moves():
+    rtde_c, rtde_r, _ = simulator.connect(time_scale=1.0)
+    target = rtde_r.getActualTCPPose()
+    target[2] -= 0.05  # About 0.4 s at 0.25 m/s
+    overlap = robot.Overlap(rtde_c, enabled=True)
+    try:
+        start = time.monotonic()
+        overlap.motion(rtde_c.moveL, target)
+        assert rtde_c.getAsyncOperationProgress() >= 0
+        tared = overlap.background(lambda: rtde_c.getAsyncOperationProgress() >= 0)
+        assert tared.result()  # Ran while the arm was still moving
+        overlap.sync()
+        assert time.monotonic() - start >= 0.3
+        assert rtde_r.getActualTCPPose() == pytest.approx(target, abs=1e-6)
+    finally:
+        overlap.close()
+
+def test_new_motion_waits_for_the_running_one():
+    rtde_c = MovingArm()
+    overlap = robot.Overlap(rtde_c, enabled=True)
+    overlap.motion(rtde_c.moveL, START)
+    overlap.motion(rtde_c.moveL, START)
+    overlap.close()
+    assert [call[2:] for call in rtde_c.calls] == [(True, 0), (True, 0)]
+
+def test_sync_stops_the_arm_after_the_timeout():
+    rtde_c = MovingArm(polls=None)
+    overlap = robot.Overlap(rtde_c, enabled=True, timeout=0.02)
+    overlap.motion(rtde_c.moveL, START)
+    with pytest.raises(TimeoutError):
+        overlap.close()
+    assert rtde_c.calls[-1] == ("stopL",)
+    with pytest.raises(RuntimeError):  # The worker threads were shut down anyway
+        overlap.background(time.sleep, 0)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# SESSION
+
+def test_session_reuses_its_interfaces():
+    session = robot.RobotSession("sim", backend="sim")
+    rtde_c, rtde_r, rtde_io = session.interfaces()
+    assert session.interfaces() == (rtde_c, rtde_r, rtde_io)
+    assert session.healthy()
+    session.close()
+    assert not session.healthy()
+    assert ("stopScript", ()) in rtde_c.robot.calls
+
+def test_session_reconnects_dropped_interfaces():
+    session = robot.RobotSession("sim", backend="sim")
+    rtde_c, rtde_r, _ = session.interfaces()
+    rtde_r.disconnect()
+    assert not session.healthy()
+    assert session.interfaces()[1] is rtde_r
+    assert rtde_r.isConnected()
+    session.close()
+
+def test_sessions_are_shared_per_robot():
+    try:
+        assert robot.get_session("sim", "sim") is robot.get_session("sim", "sim")
+        assert robot.get_session("sim", "sim") is not robot.get_session("sim-2", "sim")
+    finally:
+        robot.close_sessions()
+
+def test_unknown_backend_is_refused():
+    with pytest.raises(ValueError):
+        robot.RobotSession("sim", backend="ursim").interfaces()
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+import scheduler
+
+
+def test_deadlines_are_anchored_to_the_start():
+    cycles = scheduler.CycleScheduler(3600, start=100.0)
+    assert cycles.deadline(0) == 100.0
+    assert cycles.deadline(5) == 100.0 + 5 * 3600
+
+def test_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        scheduler.CycleScheduler(0)
+
+def test_interval_from_config():
+    assert scheduler.interval_from_config({"hours_delay": 2, "minutes_delay": 30}) == 9000
+    assert scheduler.interval_from_config({"days_delay": 1, "hours_delay": 30}) == 86400 + 30 * 3600
+    assert scheduler.interval_from_config({}) == 0
+
+def test_wall_time_round_trip():
+    deadline = time.monotonic() + 1234.5
+    assert scheduler.from_wall_time(scheduler.to_wall_time(deadline)) == pytest.approx(deadline, abs=1e-3)
+
+def test_wait_until_past_deadline_returns_lateness():
+    lateness = scheduler.wait_until(time.monotonic() - 2.0)
+    assert lateness == pytest.approx(2.0, abs=0.1)
+
+def test_wait_until_sleeps_and_calls_back():
+    calls = []
+    start = time.monotonic()
+    lateness = scheduler.wait_until(start + 0.3, callback=lambda: calls.append(time.monotonic()), every=0.1)
+    assert time.monotonic() - start >= 0.3
+    assert 0 <= lateness < 0.1
+    assert 3 <= len(calls) <= 4
+
+def test_wait_returns_immediately_for_a_past_cycle():
+    cycles = scheduler.CycleScheduler(10, start=time.monotonic() - 25)
+    assert cycles.wait(2) == pytest.approx(5, abs=0.1)
+
+def test_format_duration():
+    assert scheduler.format_duration(59.6) == "00:01:00"
+    assert scheduler.format_duration(3 * 3600 + 5) == "03:00:05"
+    assert scheduler.format_duration(86400 + 2 * 3600 + 30 * 60) == "1d 02:30:00"
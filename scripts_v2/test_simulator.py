@@ -0,0 +1,126 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+import simulator
+
+
+def connect(**settings):
+    return simulator.connect(time_scale=0.0, **settings)
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# KINEMATICS
+
+@pytest.mark.parametrize("rotvec", [[0.0, 0.0, 0.0], [0.1, -0.2, 0.3], [2.2, 2.2, 0.0], [0.0, 3.1, 0.05]])
+def test_rotvec_round_trip(rotvec):
+    np.testing.assert_allclose(simulator.matrix_to_rotvec(simulator.rotvec_to_matrix(rotvec)), rotvec, atol=1e-9)
+
+def test_inverse_kinematics_inverts_forward_kinematics():
+    q = list(simulator.HOME_Q)
+    q[0] += 0.2
+    q[4] -= 0.1
+    pose = simulator.forward_kinematics(q)
+    solution = simulator.inverse_kinematics(pose, simulator.HOME_Q)
+    assert solution is not None
+    np.testing.assert_allclose(simulator.forward_kinematics(solution)[:3], pose[:3], atol=1e-6)
+
+def test_inverse_kinematics_fails_out_of_reach():
+    pose = simulator.forward_kinematics(simulator.HOME_Q)
+    pose[0] += 5.0
+    assert simulator.inverse_kinematics(pose, simulator.HOME_Q) is None
+
+def test_trapezoid_time():
+    assert simulator.trapezoid_time(0.0, 0.25, 1.2) == 0.0
+    assert simulator.trapezoid_time(1.0, 0.25, 1.2) == pytest.approx(1.0 / 0.25 + 0.25 / 1.2)
+    assert simulator.trapezoid_time(0.01, 1.0, 1.0) == pytest.approx(2 * math.sqrt(0.01))  # Never at full speed
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# MOTION
+
+def test_movel_reaches_the_target_and_counts_motion_time():
+    rtde_c, rtde_r, _ = connect()
+    target = rtde_r.getActualTCPPose()
+    target[2] -= 0.1
+    assert rtde_c.moveL(target, 0.25, 1.2)
+    np.testing.assert_allclose(rtde_r.getActualTCPPose(), target, atol=1e-9)
+    assert rtde_c.robot.motion_time == pytest.approx(simulator.trapezoid_time(0.1, 0.25, 1.2))
+
+def test_blended_path_is_faster_than_separate_moves():
+    rtde_c, rtde_r, _ = connect()
+    start = rtde_r.getActualTCPPose()
+    a = list(start)
+    a[2] -= 0.1
+    b = list(a)
+    b[0] += 0.1
+    rtde_c.moveL([a + [0.25, 1.2, 0.02], b + [0.25, 1.2, 0.0]], True)
+    rtde_c.robot.finish_motion()
+    blended = rtde_c.robot.motion_time
+    np.testing.assert_allclose(rtde_r.getActualTCPPose(), b, atol=1e-9)
+    assert blended < 2 * simulator.trapezoid_time(0.1, 0.25, 1.2)
+
+def test_movej_updates_the_pose():
+    rtde_c, rtde_r, _ = connect()
+    q = rtde_r.getActualQ()
+    q[0] += 0.3
+    rtde_c.moveJ(q, 1.05, 1.4)
+    np.testing.assert_allclose(rtde_r.getActualTCPPose(), simulator.forward_kinematics(q), atol=1e-12)
+
+def test_protective_stop_refuses_motions():
+    rtde_c, rtde_r, _ = connect()
+    rtde_c.robot.protective_stop()
+    assert rtde_r.isProtectiveStopped()
+    assert not rtde_c.moveL(rtde_r.getActualTCPPose())
+    rtde_c.robot.clear_stop()
+    assert rtde_c.moveL(rtde_r.getActualTCPPose())
+
+
+# ---------------------------------------------------------------------------------------------------------------------
+# CONTACTS AND GRIPPER
+
+def test_contact_stops_at_the_configured_surface():
+    rtde_c, rtde_r, _ = connect()
+    height = rtde_r.getActualTCPPose()[2] - 0.07
+    rtde_c.robot.surfaces.append(simulator.ContactSurface("z", height, name="table"))
+    rtde_c.moveUntilContact([0, 0, -0.1, 0, 0, 0])
+    assert rtde_r.getActualTCPPose()[2] == pytest.approx(height)
+    assert rtde_r.getActualTCPForce()[2] == pytest.approx(rtde_c.robot.settings["contact_force"])
+
+def test_surface_bounds_limit_contacts():
+    surface = simulator.ContactSurface("z", 0.0, {"x": [0.0, 1.0]})
+    assert surface.distance([0.5, 0.0, 0.2], [0, 0, -1]) == pytest.approx(0.2)
+    assert surface.distance([1.5, 0.0, 0.2], [0, 0, -1]) is None
+    assert surface.distance([0.5, 0.0, 0.2], [0, 0, 1]) is None
+
+def test_probe_without_surface_touches_the_same_spot_again():
+    rtde_c, rtde_r, _ = connect(contact_travel=0.05)
+    start = rtde_r.getActualTCPPose()
+    rtde_c.moveUntilContact([0, -0.1, 0, 0, 0, 0])
+    first = rtde_r.getActualTCPPose()[1]
+    assert first == pytest.approx(start[1] - 0.05)
+    rtde_c.moveL(start)
+    rtde_c.moveUntilContact([0, -0.1, 0, 0, 0, 0])
+    assert rtde_r.getActualTCPPose()[1] == pytest.approx(first)
+
+def wait_for_gripper(rtde_r):
+    deadline = time.monotonic() + 1.0
+    while rtde_r.getOutputIntRegister(18) != 0 and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+@pytest.mark.parametrize("miss_rate, width", [(0.0, 3.0), (1.0, 0.0)])
+def test_gripper_reports_the_part_width(miss_rate, width):
+    _, rtde_r, rtde_io = connect(part_width=3.0, miss_rate=miss_rate, seed=1)
+    rtde_io.setInputDoubleRegister(18, 0.0)
+    rtde_io.setInputIntRegister(18, 1)
+    assert rtde_r.getOutputIntRegister(18) == 1
+    wait_for_gripper(rtde_r)
+    assert rtde_r.getOutputIntRegister(18) == 0
+    assert rtde_r.getOutputDoubleRegister(18) == width
+    assert rtde_io.robot.gripper_time > 0
+
+def test_configure_rejects_unknown_settings():
+    with pytest.raises(ValueError):
+        simulator.configure(time_sale=0)
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+import trace_analysis
+
+
+def span(id, name, category, start, end, parent=None, thread="MainThread", **ids):
+    return dict(type="span", id=id, parent=parent, name=name, category=category, start=start, end=end,
+                thread=thread, setup=1, **ids)
+
+# One cycle of 10 s: a move, the pick of sample 1 (move + tare), a dry wait, then the idle wait
+CYCLE = [
+    {"type": "trace", "monotonic": 100.0, "wall": 1000.0, "pid": 1},
+    span(2, "moveL", "motion", 100, 104, parent=1, cycle=1),
+    span(4, "moveL", "motion", 104, 105, parent=3, cycle=1, sample=1),
+    span(5, "tare", "device", 105, 107, parent=3, cycle=1, sample=1),
+    span(3, "pick", "step", 104, 108, parent=1, cycle=1, sample=1),
+    span(8, "poll", "device", 102, 103, thread="sampler", cycle=1),
+    span(6, "dry", "sleep", 108, 109, parent=1, cycle=1, sample=1),
+    span(1, "execute_command", "step", 100, 110, cycle=1),
+    span(7, "wait_next_cycle", "step", 110, 120, cycle=1),
+]
+
+
+def write(path, records, tail=""):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records) + tail)
+    return str(path)
+
+@pytest.fixture
+def spans(tmp_path):
+    return trace_analysis.load_trace(write(tmp_path / "trace.jsonl", CYCLE, tail='{"type": "span", "id"'))
+
+
+def test_load_computes_self_time_and_depth(spans):
+    rows = spans.set_index("id")
+    assert 7 not in rows.index  # Idle wait dropped
+    assert rows.loc[1, "self_time"] == pytest.approx(1.0)
+    assert rows.loc[3, "self_time"] == pytest.approx(1.0)
+    assert rows.loc[4, "depth"] == 2 and rows.loc[1, "depth"] == 0 and rows.loc[8, "depth"] == 0
+    assert rows.loc[1, "wall_start"] == pytest.approx(1000.0)
+
+def test_idle_spans_can_be_kept(tmp_path):
+    spans = trace_analysis.load_trace(write(tmp_path / "trace.jsonl", CYCLE), idle=True)
+    assert "wait_next_cycle" in set(spans["name"])
+
+def test_cycle_time_split_by_category(spans):
+    assert trace_analysis.cycle_thread(spans) == "MainThread"
+    assert trace_analysis.cycles(spans)["makespan"].tolist() == [10.0]
+    table = trace_analysis.by_category(spans)
+    assert table.loc["motion", "seconds"] == pytest.approx(5.0)
+    assert table.loc["device", "seconds"] == pytest.approx(2.0)
+    assert table.loc["sleep", "seconds"] == pytest.approx(1.0)
+    assert table.loc["other", "seconds"] == pytest.approx(2.0)
+    assert table.loc[["motion", "device", "sleep", "other"], "share"].sum() == pytest.approx(1.0)
+    assert table.loc["background", "seconds"] == pytest.approx(1.0)
+
+def test_per_sample_and_bottlenecks(spans):
+    samples = trace_analysis.per_sample(spans)
+    row = samples.loc[(1, 1)]
+    assert row["seconds"] == pytest.approx(5.0)
+    assert (row["motion"], row["device"], row["sleep"], row["other"]) == pytest.approx((1.0, 2.0, 1.0, 1.0))
+    name, category, seconds, share, per_sample = trace_analysis.bottlenecks(spans, top=1)[0]
+    assert (name, category) == ("moveL", "motion")
+    assert (seconds, share, per_sample) == pytest.approx((5.0, 0.5, 5.0))
+
+def test_steps_are_kept_apart_by_category(tmp_path):
+    # A traced step and an instrumented call with the same name
+    records = CYCLE + [span(9, "tare", "step", 109.0, 109.5, parent=1, cycle=1)]
+    steps = trace_analysis.by_step(trace_analysis.load_trace(write(tmp_path / "trace.jsonl", records)))
+    assert steps.loc[("tare", "device"), "total"] == pytest.approx(2.0)
+    assert steps.loc[("tare", "step"), "total"] == pytest.approx(0.5)
+    assert steps.loc[("moveL", "motion"), "count"] == 2
+
+def test_sessions_do_not_mix(tmp_path):
+    second = [{"type": "trace", "monotonic": 5.0, "wall": 5000.0, "pid": 2},
+              span(1, "execute_command", "step", 6, 8, cycle=2)]
+    spans = trace_analysis.load_trace(write(tmp_path / "trace.jsonl", CYCLE + second))
+    rerun = spans[spans["session"] == 1].iloc[0]
+    assert rerun["self_time"] == pytest.approx(2.0) and rerun["wall_start"] == pytest.approx(5001.0)
+    assert trace_analysis.load_trace(str(tmp_path / "trace.jsonl"), cycle=2)["id"].tolist() == [1]
+    with pytest.raises(ValueError):
+        trace_analysis.load_trace(str(tmp_path / "trace.jsonl"), cycle=9)
+
+def test_report_and_timeline(spans, tmp_path, capsys):
+    trace_analysis.report(spans)
+    assert "moveL" in capsys.readouterr().out
+    trace_analysis.plot_gantt(spans, str(tmp_path / "timeline.png"))
+    assert (tmp_path / "timeline.png").stat().st_size > 0
@@ -0,0 +1,87 @@
+import json
+import threading
+
+import pytest
+
+import tracing
+
+
+@pytest.fixture
+def trace(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    tracing.enable(str(path), cycle=3, setup=1)
+    yield path
+    tracing.disable()
+
+def spans(path):
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    return [record for record in records if record["type"] == "span"]
+
+
+def test_nested_spans_record_parent_context_and_fields(trace):
+    with tracing.span("sample", sample=7) as outer:
+        tracing.set_context(sample=7)
+        with tracing.span("weigh", "device") as inner:
+            inner.set(weight=4.3)
+        tracing.set_context(sample=None)
+    tracing.disable()
+    inner_record, outer_record = spans(trace)
+    assert inner_record["name"] == "weigh" and inner_record["category"] == "device"
+    assert inner_record["parent"] == outer_record["id"] and outer_record["parent"] is None
+    assert inner_record["weight"] == 4.3
+    assert inner_record["cycle"] == 3 and inner_record["setup"] == 1 and inner_record["sample"] == 7
+    assert outer_record["start"] <= inner_record["start"] <= inner_record["end"] <= outer_record["end"]
+
+def test_trace_starts_with_the_clock_header(trace):
+    tracing.disable()
+    header = json.loads(trace.read_text().splitlines()[0])
+    assert header["type"] == "trace"
+    assert {"monotonic", "wall", "pid"} <= set(header)
+
+def test_errors_are_recorded_and_raised(trace):
+    with pytest.raises(TimeoutError):
+        with tracing.span("tare", "device"):
+            raise TimeoutError
+    tracing.disable()
+    assert spans(trace)[0]["error"] == "TimeoutError"
+
+def test_traced_and_instrumented_calls(trace):
+    class Control:
+        def moveL(self, pose):
+            return True
+
+        def getActualQ(self):
+            return [0.0] * 6
+
+    @tracing.traced(category="grip")
+    def close_grip():
+        return "closed"
+
+    control = tracing.instrument(Control(), "motion", ["moveL"])
+    assert close_grip() == "closed"
+    assert control.moveL([0.0] * 6) is True
+    assert control.getActualQ() == [0.0] * 6
+    assert tracing.instrument(control, "motion", ["moveL"]) is control
+    tracing.disable()
+    assert [(record["name"], record["category"]) for record in spans(trace)] == [("close_grip", "grip"), ("moveL", "motion")]
+
+def test_threads_keep_their_own_parents(trace):
+    def worker():
+        with tracing.span("poll", "device"):
+            pass
+    with tracing.span("cycle"):
+        thread = threading.Thread(target=worker, name="sampler")
+        thread.start()
+        thread.join()
+    tracing.disable()
+    poll = next(record for record in spans(trace) if record["name"] == "poll")
+    assert poll["parent"] is None and poll["thread"] == "sampler"
+
+def test_disabled_tracing_costs_nothing(tmp_path):
+    assert not tracing.enabled()
+    target = object()
+    assert tracing.instrument(target, "motion", ["moveL"]) is target
+    with tracing.span("dry") as span:
+        span.set(seconds=1)
+    assert span is tracing.span("other")
+    assert list(tmp_path.iterdir()) == []
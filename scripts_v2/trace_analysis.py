@@ -0,0 +1,287 @@
+# ------------------------------------------------------- #
+# BOTTLENECK ANALYSIS OF CYCLE TRACES (tracing.py)        #
+# ------------------------------------------------------- #
+
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+IDLE_SPANS = ("wait_next_cycle",)  # Waiting for the next cycle is not part of the cycle time
+
+# Self time of "step" spans and time outside any span is computation, prints and file writes ("other")
+COLORS = {"motion": "tab:blue", "device": "tab:orange", "grip": "tab:green", "sleep": "tab:gray", "other": "tab:purple"}
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 1. LOADING
+
+def load_trace(path, cycle=None, idle=False):
+    """
+    Reads a trace file into a table of spans.
+
+    Each session of the file (one "trace" header per process that wrote to it)
+    gets its own number, so span IDs and clocks of different runs never mix.
+
+    Args:
+    - path: JSON-lines trace written by tracing.py.
+    - cycle: Keep only this cycle number.
+    - idle: Keep the IDLE_SPANS (the wait for the next cycle).
+
+    Returns:
+    - DataFrame: One row per span with duration, self_time (duration minus
+      the children), depth, wall_start (epoch seconds) and the cycle/sample IDs.
+    """
+    records = []
+    session, offset = -1, 0.0
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Line cut short by a crash
+            if record.get("type") == "trace":
+                session += 1
+                offset = record["wall"] - record["monotonic"]
+            elif record.get("type") == "span" and (idle or record["name"] not in IDLE_SPANS):
+                record["session"] = max(session, 0)
+                record["wall_start"] = record["start"] + offset
+                records.append(record)
+
+    spans = pd.DataFrame(records)
+    if spans.empty:
+        raise ValueError(f"No spans in {path}")
+    for column in ("cycle", "setup", "sample", "parent", "error"):
+        if column not in spans:
+            spans[column] = None
+    if cycle is not None:
+        spans = spans[spans["cycle"] == cycle]
+        if spans.empty:
+            raise ValueError(f"No spans of cycle {cycle} in {path}")
+    spans = spans.reset_index(drop=True)
+    spans["duration"] = spans["end"] - spans["start"]
+
+    # Self time: the part of a span not covered by its children
+    children = spans.dropna(subset=["parent"]).groupby(["session", "parent"])["duration"].sum()
+    keys = list(zip(spans["session"], spans["id"]))
+    spans["self_time"] = spans["duration"] - np.array([children.get(key, 0.0) for key in keys])
+
+    # Nesting depth, following the parents up to a top-level span
+    parents = dict(zip(keys, spans["parent"]))
+    def depth(key):
+        level = 0
+        while parents.get(key) is not None and not pd.isna(parents[key]):
+            key = (key[0], int(parents[key]))
+            level += 1
+        return level
+    spans["depth"] = [depth(key) for key in keys]
+    return spans
+
+def cycle_thread(spans):
+    """Thread that ran the cycle: the one with the most top-level span time (the others are background work)."""
+    top = spans[spans["depth"] == 0]
+    return top.groupby("thread")["duration"].sum().idxmax()
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 2. AGGREGATION
+
+def _percentiles(values):
+    values = np.asarray(values, dtype=float)
+    return {"count": len(values), "total": values.sum(), "mean": values.mean(),
+            "p50": np.percentile(values, 50), "p95": np.percentile(values, 95), "max": values.max()}
+
+def cycles(spans):
+    """
+    Wall extent of each cycle on the cycle thread.
+
+    Returns:
+    - DataFrame: session, cycle, start, end, makespan, traced (time inside top-level spans).
+    """
+    main = spans[spans["thread"] == cycle_thread(spans)]
+    rows = []
+    for (session, cycle), group in main.groupby(["session", "cycle"], dropna=False):
+        top = group[group["depth"] == 0]
+        rows.append({"session": session, "cycle": cycle, "start": group["start"].min(), "end": group["end"].max(),
+                     "makespan": group["end"].max() - group["start"].min(), "traced": top["duration"].sum()})
+    return pd.DataFrame(rows)
+
+def by_category(spans):
+    """
+    Splits the cycle time into motion, device, grip, sleep and other.
+
+    Only the cycle thread counts: that is the critical path of a sequential
+    cycle. Work on other threads (temperature sampler, device calls overlapped
+    with motion) is reported as "background"; it was hidden behind the cycle.
+
+    Returns:
+    - DataFrame: Seconds and share of the cycle time per category.
+    """
+    main = spans[spans["thread"] == cycle_thread(spans)]
+    self_times = main.groupby(main["category"].where(main["category"] != "step", "other"))["self_time"].sum()
+    extent = cycles(spans)
+    untraced = (extent["makespan"] - extent["traced"]).sum()
+    self_times["other"] = self_times.get("other", 0.0) + untraced
+    table = pd.DataFrame({"seconds": self_times})
+    table["share"] = table["seconds"] / extent["makespan"].sum()
+    table = table.sort_values("seconds", ascending=False)
+    background = spans[(spans["thread"] != cycle_thread(spans)) & (spans["depth"] == 0)]["duration"].sum()
+    table.loc["background"] = [background, np.nan]
+    return table
+
+def by_step(spans):
+    """
+    Statistics per span name and category on the cycle thread (the same name can
+    appear in several categories, e.g. a traced step and an instrumented call).
+
+    "total"/"mean"/"p50"/"p95"/"max" are inclusive durations (a step with its
+    moves and device calls); "self" is the time spent in the span itself,
+    outside its children, which is what ranks the bottlenecks.
+
+    Returns:
+    - DataFrame indexed by (name, category), sorted by self time.
+    """
+    main = spans[spans["thread"] == cycle_thread(spans)]
+    rows = []
+    for (name, category), group in main.groupby(["name", "category"]):
+        row = _percentiles(group["duration"])
+        row.update(name=name, category=category, self=group["self_time"].sum())
+        rows.append(row)
+    table = pd.DataFrame(rows).set_index(["name", "category"])
+    table["share"] = table["self"] / cycles(spans)["makespan"].sum()
+    return table.sort_values("self", ascending=False)[["count", "self", "share", "total", "mean", "p50", "p95", "max"]]
+
+def per_sample(spans):
+    """
+    Time of each sample from the first to the last span carrying its ID, split by category.
+
+    Returns:
+    - DataFrame: One row per sample (cycle, sample) with "seconds" and the self time per category.
+    """
+    main = spans[(spans["thread"] == cycle_thread(spans)) & spans["sample"].notna()]
+    if main.empty:
+        return pd.DataFrame()
+    categories = main["category"].where(main["category"] != "step", "other")
+    table = main.assign(category=categories).pivot_table(index=["cycle", "sample"], columns="category",
+                                                         values="self_time", aggfunc="sum", fill_value=0.0)
+    extent = main.groupby(["cycle", "sample"]).agg(start=("start", "min"), end=("end", "max"))
+    table.insert(0, "seconds", extent["end"] - extent["start"])
+    # Gaps between the spans of a sample (untraced code) count as other
+    table["other"] = table.get("other", 0.0) + table["seconds"] - table.drop(columns="seconds").sum(axis=1)
+    return table
+
+def bottlenecks(spans, top=10):
+    """
+    Ranks the span names and categories of the cycle thread by self time.
+
+    Returns:
+    - list: (name, category, seconds, share of the cycle time, seconds per sample).
+    """
+    steps = by_step(spans).head(top)
+    samples = max(len(per_sample(spans)), 1)
+    return [(name, category, row["self"], row["share"], row["self"] / samples)
+            for (name, category), row in steps.iterrows()]
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 3. TIMELINE
+
+def plot_gantt(spans, output_file, cycle=None):
+    """
+    Renders a Gantt-style timeline: top-level steps on the first row, then one
+    row per category on the cycle thread and one per background thread.
+    Samples are marked along the time axis.
+    """
+    if cycle is not None:
+        spans = spans[spans["cycle"] == cycle]
+    main_thread = cycle_thread(spans)
+    origin = spans["start"].min()
+    main = spans[spans["thread"] == main_thread]
+
+    rows = [("steps", main[main["depth"] == 0])]
+    for category in ("motion", "device", "grip", "sleep"):
+        rows.append((category, main[main["category"] == category]))
+    for thread, group in spans[spans["thread"] != main_thread].groupby("thread"):
+        rows.append((thread, group[group["depth"] == 0]))
+
+    width = max(12, min(60, (spans["end"].max() - origin) / 20))
+    fig, ax = plt.subplots(figsize=(width, 1 + 0.6 * len(rows)))
+    for index, (label, group) in enumerate(rows):
+        colors = [COLORS.get(category, COLORS["other"]) for category in group["category"]]
+        ax.broken_barh(list(zip(group["start"] - origin, group["duration"])), (index - 0.4, 0.8),
+                       facecolors=colors, edgecolors="black", linewidths=0.2)
+        if label == "steps":
+            for _, span in group[group["duration"] > 0.02 * (spans["end"].max() - origin)].iterrows():
+                ax.text(span["start"] - origin + span["duration"] / 2, index, span["name"],
+                        ha="center", va="center", fontsize=7, clip_on=True)
+
+    sample_starts = main[main["sample"].notna()].groupby("sample")["start"].min()
+    for sample, start in sample_starts.items():
+        ax.axvline(start - origin, color="black", linestyle=":", linewidth=0.8)
+        ax.text(start - origin, len(rows) - 0.4, f" sample {int(sample)}", fontsize=7, va="bottom")
+
+    ax.set_yticks(range(len(rows)))
+    ax.set_yticklabels([label for label, _ in rows])
+    ax.invert_yaxis()
+    ax.set_xlabel("Time since start of the trace (s)")
+    ax.set_title("Cycle timeline")
+    handles = [plt.Rectangle((0, 0), 1, 1, color=color) for color in COLORS.values()]
+    ax.legend(handles, list(COLORS), loc="upper left", bbox_to_anchor=(1, 1))
+    ax.grid(True, axis="x", alpha=0.3)
+    plt.savefig(output_file, bbox_inches="tight")
+    plt.close(fig)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 4. REPORT
+
+def report(spans, top=10):
+    """Prints the cycle summary, the category split, the bottlenecks and the per-sample distribution."""
+    extent = cycles(spans)
+    samples = per_sample(spans)
+    print(f"{len(extent)} cycle(s), {len(samples)} samples, makespan {extent['makespan'].sum():.1f} s "
+          f"(cycle thread: {cycle_thread(spans)})")
+
+    print("\nTime by category (cycle thread)")
+    for category, row in by_category(spans).iterrows():
+        share = "" if pd.isna(row["share"]) else f"{row['share'] * 100:6.1f} %"
+        print(f"  {category:<12}{row['seconds']:>10.1f} s {share}")
+
+    print(f"\nTop {top} bottlenecks (self time)")
+    print(f"  {'span':<22}{'category':<10}{'seconds':>9}{'share':>9}{'s/sample':>10}")
+    for name, category, seconds, share, per in bottlenecks(spans, top):
+        print(f"  {name:<22}{category:<10}{seconds:>9.1f}{share * 100:>8.1f}%{per:>10.2f}")
+
+    print("\nSpan durations (inclusive, s)")
+    steps = by_step(spans)
+    print(f"  {'span':<22}{'category':<10}{'count':>6}{'mean':>9}{'p50':>9}{'p95':>9}{'max':>9}")
+    for (name, category), row in steps.iterrows():
+        print(f"  {name:<22}{category:<10}{row['count']:>6}{row['mean']:>9.2f}{row['p50']:>9.2f}{row['p95']:>9.2f}{row['max']:>9.2f}")
+
+    if not samples.empty:
+        stats = _percentiles(samples["seconds"])
+        print(f"\nPer sample: mean {stats['mean']:.1f} s, p50 {stats['p50']:.1f} s, p95 {stats['p95']:.1f} s, max {stats['max']:.1f} s")
+        means = samples.drop(columns="seconds").mean()
+        print("  " + ", ".join(f"{category} {seconds:.1f} s" for category, seconds in means.sort_values(ascending=False).items()))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Finds where the time of a cycle goes, from a trace written with tracing enabled.")
+    parser.add_argument('trace', help='Trace file (JSON lines)')
+    parser.add_argument('--cycle', type=int, default=None, help='Analyse only this cycle')
+    parser.add_argument('--top', type=int, default=10, help='Number of bottlenecks listed')
+    parser.add_argument('--gantt', help='Write the timeline to this image (e.g. timeline.png)')
+    parser.add_argument('--csv', help='Write the per-step and per-sample tables to <prefix>_steps.csv and <prefix>_samples.csv')
+    args = parser.parse_args()
+
+    spans = load_trace(args.trace, args.cycle)
+    report(spans, args.top)
+    if args.gantt:
+        plot_gantt(spans, args.gantt)
+        print(f"\nTimeline saved to {args.gantt}")
+    if args.csv:
+        by_step(spans).to_csv(args.csv + "_steps.csv")
+        per_sample(spans).to_csv(args.csv + "_samples.csv")
+        print(f"Tables saved to {args.csv}_steps.csv and {args.csv}_samples.csv")
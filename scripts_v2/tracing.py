@@ -0,0 +1,220 @@
+# ------------------------------------------------------- #
+# TIMING SPANS OF THE UR ROBOT DEGRADATION CYCLE          #
+# ------------------------------------------------------- #
+
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+# Span categories: cycle steps, robot motion, scale/Arduino/camera calls, gripper actions and explicit waits
+CATEGORIES = ("step", "motion", "device", "grip", "sleep")
+
+_writer = None            # TraceWriter while tracing is enabled
+_context = {}             # IDs attached to every span (cycle, setup, sample)
+_local = threading.local()  # Stack of open span IDs of each thread
+_ids = itertools.count(1)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 1. TRACE FILE
+
+def _default(value):
+    if isinstance(value, bytes):
+        return value.decode(errors="replace")
+    if hasattr(value, "tolist"):  # numpy scalars and arrays
+        return value.tolist()
+    return str(value)
+
+class TraceWriter:
+    """
+    Appends trace records to a JSON-lines file, one object per line.
+
+    The first record of every session maps the monotonic clock of the span
+    timestamps to wall-clock time: {"type": "trace", "monotonic", "wall", "pid"}.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+        self.write({"type": "trace", "monotonic": time.monotonic(), "wall": time.time(), "pid": os.getpid()})
+
+    def write(self, record):
+        line = json.dumps(record, default=_default)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+def enable(path, **context):
+    """
+    Starts writing spans to a trace file (appending if it exists).
+
+    Args:
+    - path: JSON-lines file.
+    - context: IDs attached to every span, e.g. cycle=5, setup=1.
+    """
+    global _writer
+    disable()
+    _context.clear()
+    set_context(**context)
+    _writer = TraceWriter(path)
+
+def disable():
+    """Stops tracing and closes the trace file."""
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+def enabled():
+    return _writer is not None
+
+def set_context(**ids):
+    """Sets the IDs attached to the following spans (e.g. sample=12); None removes an ID."""
+    for key, value in ids.items():
+        if value is None:
+            _context.pop(key, None)
+        else:
+            _context[key] = value
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 2. SPANS
+
+class Span:
+    """
+    Timed section of the cycle, written to the trace when it ends.
+
+    Records: {"type": "span", "id", "parent", "name", "category", "start", "end",
+    "thread", <context IDs>, <fields>, "error" (exception type, if one was raised)}.
+    start and end are time.monotonic() seconds.
+    """
+
+    __slots__ = ("name", "category", "fields", "id", "parent", "start")
+
+    def __init__(self, name, category, fields):
+        self.name = name
+        self.category = category
+        self.fields = fields
+
+    def set(self, **fields):
+        """Adds fields to the record, e.g. a result known only at the end of the span."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.id = next(_ids)
+        self.parent = stack[-1] if stack else None
+        stack.append(self.id)
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.monotonic()
+        _local.stack.pop()
+        writer = _writer
+        if writer is None:
+            return False
+        record = {"type": "span", "id": self.id, "parent": self.parent, "name": self.name,
+                  "category": self.category, "start": self.start, "end": end,
+                  "thread": threading.current_thread().name}
+        record.update(_context)
+        record.update(self.fields)
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        writer.write(record)
+        return False
+
+class _NullSpan:
+    """Stand-in returned while tracing is disabled."""
+
+    __slots__ = ()
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name, category="step", **fields):
+    """
+    Context manager that times a block:
+
+        with tracing.span("dry", "sleep", seconds=1):
+            ...
+
+    While tracing is disabled it returns a shared no-op object.
+    """
+    if _writer is None:
+        return _NULL_SPAN
+    return Span(name, category, fields)
+
+def traced(name=None, category="step"):
+    """
+    Decorator that times every call of a function (span name defaults to the function name).
+    While tracing is disabled the only cost is one global lookup per call.
+    """
+    def decorator(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _writer is None:
+                return function(*args, **kwargs)
+            with Span(label, category, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def sleep(seconds, name="sleep"):
+    """time.sleep() recorded as a "sleep" span."""
+    with span(name, "sleep", seconds=seconds):
+        time.sleep(seconds)
+
+# ---------------------------------------------------------------------------------------------------------------------
+# 3. INSTRUMENTED INTERFACES
+
+class _Instrumented:
+    """Proxy that records a span for each call of selected methods of an object."""
+
+    def __init__(self, target, category, methods):
+        self._target = target
+        self._category = category
+        self._methods = frozenset(methods)
+
+    def __getattr__(self, attribute):
+        value = getattr(self._target, attribute)
+        if attribute not in self._methods:
+            return value
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            with span(attribute, self._category):
+                return value(*args, **kwargs)
+        return call
+
+def instrument(target, category, methods):
+    """
+    Returns target with a span around each call of `methods` (e.g. the moves of rtde_c).
+    While tracing is disabled target is returned unchanged, so untraced cycles pay nothing.
+    """
+    if _writer is None or isinstance(target, _Instrumented):
+        return target
+    return _Instrumented(target, category, methods)